@@ -46,6 +46,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -126,7 +127,65 @@ MEDIA_ROOT = BASE_DIR.parent / 'media'
 
 # Database/Dataset paths
 DATASET_DIR = BASE_DIR.parent / 'database' / 'dataset'
+# Legacy single-file sklearn model; imported into MODEL_DIR on first load if present
 MODEL_PATH = BASE_DIR.parent / 'database' / 'model.pkl'
+# Versioned gallery artifacts (see core/model_store.py)
+MODEL_DIR = BASE_DIR.parent / 'database' / 'models'
+MODEL_KEEP_VERSIONS = 5
+
+# Max face-encoding distance for a match
+RECOGNITION_THRESHOLD = 0.53
+
+# Per-worker cache of recognition results for repeated identical frames
+RECOGNITION_CACHE_SIZE = 64
+RECOGNITION_CACHE_TTL = 10  # seconds
+
+# In-memory lecture slot index (core/slot_index.py); workers rebuild when the
+# shared generation counter moves, and at least this often regardless
+SLOT_INDEX_GENERATION_PATH = BASE_DIR.parent / 'database' / 'slot_index.generation'
+SLOT_INDEX_MAX_AGE = 300  # seconds
+
+# Model training: requests within this window are coalesced into one build.
+# The building worker touches the lock file every HEARTBEAT seconds; a lock
+# untouched for LOCK_TIMEOUT belongs to a dead worker and may be broken.
+TRAINING_DEBOUNCE_SECONDS = 5
+TRAINING_LOCK_HEARTBEAT = 30
+TRAINING_LOCK_TIMEOUT = 5 * 60
+
+# Bearer token for scraping /metrics/ without logging in (admins always can);
+# unset disables token access. Client IPs are not used: behind nginx every
+# request arrives from 127.0.0.1.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Application logging (recognition / marking diagnostics) to stderr
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core': {'handlers': ['console'], 'level': os.getenv('CORE_LOG_LEVEL', 'INFO')},
+    },
+}
+
+# Per-request profiling (core/profiling.py); off unless PROFILING_ENABLED=1.
+# Each worker logs to PROFILING_LOG_PATH with its pid inserted (profiling.<pid>.log)
+# and rotates only its own file; logs untouched for RETENTION_DAYS are deleted.
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', '0') == '1'
+PROFILING_LOG_PATH = BASE_DIR.parent / 'logs' / 'profiling.log'
+PROFILING_LOG_MAX_BYTES = 5 * 1024 * 1024
+PROFILING_LOG_BACKUPS = 3
+PROFILING_LOG_RETENTION_DAYS = 7
+PROFILING_TOP_QUERIES = 5
+PROFILING_CPROFILE_SAMPLE_RATE = float(os.getenv('PROFILING_CPROFILE_SAMPLE_RATE', '0'))
+PROFILING_CPROFILE_TOP = 30
+
+# Bulk attendance export API (core/attendance_export.py): records per keyset page
+ATTENDANCE_EXPORT_PAGE_SIZE = 2000
+
+# Records per page of attendance_list / student_attendance (keyset paginated)
+ATTENDANCE_PAGE_SIZE = 50
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
@@ -8,7 +8,8 @@ from django.conf import settings
 from django.core.files.storage import FileSystemStorage
 from django.contrib import messages
 import os
-from .utils import detect_and_crop_face, train_model
+from .utils import detect_and_crop_face
+from .training import request_training
 
 class MultipleFileInput(forms.ClearableFileInput): 
     # Or inherit from FileInput if Clearable is problematic, 
@@ -90,12 +91,9 @@ class StudentAdmin(admin.ModelAdmin):
                 if count > 0:
                     messages.success(request, f"Successfully processed {count} face images for {obj.name}.")
                     
-                    # Train model after adding new images
-                    success, msg = train_model()
-                    if success:
-                        messages.success(request, msg)
-                    else:
-                        messages.warning(request, f"Model training warning: {msg}")
+                    # Queue a background model rebuild after adding new images
+                    request_training(f"admin {obj.roll_number}")
+                    messages.info(request, "Model update queued. It will be rebuilt in the background shortly.")
                         
                 else:
                     messages.warning(request, "No faces detected in uploaded photos. Please try again with clear photos.")
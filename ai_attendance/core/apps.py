@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class CoreConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'core'
+
+    def ready(self):
+        # Connect the receivers that keep the attendance summaries and the slot index
+        # current, whichever entry point (views, shell, admin, commands) writes first
+        from . import attendance_summary, slot_index  # noqa: F401
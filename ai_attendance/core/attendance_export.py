@@ -0,0 +1,136 @@
+"""
+Keyset pagination of attendance records: the bulk export (CSV / JSON lines)
+for other systems, and the newest-first attendance_list / student_attendance
+pages.
+
+Records are read in (date, time, id) order one page at a time, each page
+starting after the last row of the previous one:
+
+    WHERE date > d OR (date = d AND time > t) OR (date = d AND time = t AND id > i)
+    ORDER BY date, time, id LIMIT page_size
+
+so every page is an index range scan on attendance_date_time, however deep
+into the history it is (OFFSET would re-read every skipped row), and only
+one page of tuples is in memory at a time. The list pages run the same
+comparison reversed (newest first) and link onwards with the cursor of
+their last row. Every exported row carries the cursor of its own position;
+a client whose pull was interrupted passes the last cursor it stored and
+continues with the next row. Rows inserted behind the cursor (back-dated
+corrections) are not revisited by a running pull.
+"""
+import csv
+import json
+import base64
+import datetime
+from django.conf import settings
+from django.db.models import Q
+from .models import normalize_key, canonical_department
+
+COLUMNS = ('id', 'date', 'time', 'roll_number', 'name', 'department', 'year', 'section', 'subject', 'status')
+FIELDS = ('id', 'date', 'time', 'student__roll_number', 'student__name', 'student__department',
+          'student__year', 'student__section', 'subject', 'status')
+
+
+def encode_cursor(date, time, record_id):
+    """Opaque, URL-safe token for the position of one record."""
+    raw = f"{date.isoformat()}|{time.isoformat()}|{record_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """(date, time, id) of a token from encode_cursor(); ValueError if it is not one."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        date, time, record_id = raw.split('|')
+        return datetime.date.fromisoformat(date), datetime.time.fromisoformat(time), int(record_id)
+    except (TypeError, UnicodeDecodeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {token!r}") from e
+
+
+def filter_records(records, params):
+    """
+    Narrow `records` by the request parameters from / to (YYYY-MM-DD), branch,
+    year, section and subject; blank parameters are ignored. ValueError on a bad date.
+    """
+    filters = {}
+    for param, lookup in (('from', 'date__gte'), ('to', 'date__lte')):
+        if params.get(param):
+            filters[lookup] = datetime.date.fromisoformat(params[param])
+    if params.get('branch'):
+        filters['student__department_key'] = canonical_department(params['branch'])
+    for param in ('year', 'section'):
+        if params.get(param):
+            filters[f'student__{param}_key'] = normalize_key(params[param])
+    if params.get('subject'):
+        filters['subject_key'] = normalize_key(params['subject'])
+    return records.filter(**filters)
+
+
+def after_cursor(records, cursor, descending=False):
+    """`records` strictly after `cursor` ((date, time, id)) in (date, time, id) order, or its reverse."""
+    date, time, record_id = cursor
+    op = 'lt' if descending else 'gt'
+    return records.filter(
+        Q(**{f'date__{op}': date})
+        | Q(date=date, **{f'time__{op}': time})
+        | Q(date=date, time=time, **{f'id__{op}': record_id})
+    )
+
+
+def keyset_page(records, cursor=None, page_size=None):
+    """
+    (records, next cursor token or None): one page of `records` newest first,
+    after `cursor`. One query; the extra row fetched only tells if there is more.
+    """
+    page_size = page_size or getattr(settings, 'ATTENDANCE_PAGE_SIZE', 50)
+    records = records.order_by('-date', '-time', '-id')
+    if cursor:
+        records = after_cursor(records, cursor, descending=True)
+    page = list(records[:page_size + 1])
+    if len(page) <= page_size:
+        return page, None
+    last = page[page_size - 1]
+    return page[:page_size], encode_cursor(last.date, last.time, last.id)
+
+
+def export_rows(records, cursor=None, limit=None, page_size=None):
+    """
+    Yield (row, cursor token) for `records` (a filtered AttendanceRecord
+    queryset) after `cursor`, at most `limit` rows, one query per page.
+    """
+    page_size = page_size or getattr(settings, 'ATTENDANCE_EXPORT_PAGE_SIZE', 2000)
+    records = records.order_by('date', 'time', 'id').values_list(*FIELDS)
+    sent = 0
+    while limit is None or sent < limit:
+        page_records = after_cursor(records, cursor) if cursor else records
+        size = page_size if limit is None else min(page_size, limit - sent)
+        page = list(page_records[:size])
+        for row in page:
+            yield row, encode_cursor(row[1], row[2], row[0])
+        sent += len(page)
+        if len(page) < size:
+            return
+        last = page[-1]
+        cursor = (last[1], last[2], last[0])
+
+
+class _Echo:
+    """File-like object whose write() returns the line for the streaming response."""
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLUMNS + ('cursor',))
+    for row, token in rows:
+        yield writer.writerow(row + (token,))
+
+
+def jsonl_lines(rows):
+    for row, token in rows:
+        item = dict(zip(COLUMNS, row))
+        item['date'] = item['date'].isoformat()
+        item['time'] = item['time'].isoformat()
+        item['cursor'] = token
+        yield json.dumps(item) + '\n'
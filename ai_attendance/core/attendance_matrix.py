@@ -0,0 +1,82 @@
+"""
+Student x lecture attendance matrix shared by the coordinator dashboard and
+its Excel export.
+
+Both used to run records.filter(student=s) for every student, and the export
+also looked up the teacher of every column separately. Here the columns
+((date, subject) pairs) come from one query, all statuses for the cohort and
+column window from one streamed query placed by dict index, and the faculty
+initials of every column from one TeacherSubject query.
+"""
+from django.db.models import Q
+from .models import AttendanceRecord, TeacherSubject, normalize_key
+
+CHUNK_SIZE = 2000
+
+
+def attendance_columns(students, limit=None, newest_first=False):
+    """Distinct (date, subject) pairs recorded for `students` (a queryset), oldest first unless newest_first."""
+    order = ('-date', 'subject') if newest_first else ('date', 'subject')
+    columns = AttendanceRecord.objects.filter(student__in=students).values_list(
+        'date', 'subject').distinct().order_by(*order)
+    return list(columns[:limit] if limit else columns)
+
+
+def attendance_pivot(students, columns):
+    """
+    {student_id: [status per column]} with '-' where a student has no record.
+    When a student has several records for one column, the earliest of the day
+    wins (as when the per-student dicts were built from date/time-descending rows).
+    """
+    index = {column: i for i, column in enumerate(columns)}
+    if not index:
+        return {}
+    dates = [date for date, _ in columns]
+    subjects = {subject for _, subject in columns}
+    subject_filter = Q(subject__in=subjects - {None})
+    if None in subjects:
+        subject_filter |= Q(subject__isnull=True)
+    records = AttendanceRecord.objects.filter(
+        subject_filter, student__in=students, date__range=(min(dates), max(dates)),
+    ).values_list('student_id', 'date', 'subject', 'status').order_by('-date', '-time')
+
+    matrix = {}
+    for student_id, date, subject, status in records.iterator(chunk_size=CHUNK_SIZE):
+        col = index.get((date, subject))
+        if col is None:
+            continue
+        row = matrix.get(student_id)
+        if row is None:
+            row = matrix[student_id] = ['-'] * len(columns)
+        row[col] = status
+    return matrix
+
+
+def teacher_initials(teacher):
+    first, last = teacher.first_name, teacher.last_name
+    if first and last:
+        return f"{first[0].upper()}{last[0].upper()}"
+    if first:
+        return first[:2].upper()
+    return teacher.username[:3].upper()
+
+
+def column_faculty(columns, year, section):
+    """
+    Faculty initials per column: the teacher assigned the subject for this
+    year/section, else the first teacher assigned the subject at all, else '-'.
+    """
+    keys = {normalize_key(subject) for _, subject in columns}
+    year_key, section_key = normalize_key(year), normalize_key(section)
+    own_class, any_class = {}, {}
+    assignments = TeacherSubject.objects.filter(subject_key__in=keys).select_related('teacher').order_by('id')
+    for ts in assignments:
+        any_class.setdefault(ts.subject_key, ts.teacher)
+        if (ts.year_key, ts.section_key) == (year_key, section_key):
+            own_class.setdefault(ts.subject_key, ts.teacher)
+    initials = []
+    for _, subject in columns:
+        key = normalize_key(subject)
+        teacher = own_class.get(key) or any_class.get(key)
+        initials.append(teacher_initials(teacher) if teacher else "-")
+    return initials
@@ -0,0 +1,281 @@
+"""
+Denormalized attendance counts for the dashboards.
+
+student_dashboard, manage_students and download_attendance used to count
+AttendanceRecord rows on every request (per student, plus a distinct() over
+the whole cohort for manage_students). They read two small tables instead:
+
+    AttendanceSummary        (student, subject) -> present, absent, total
+    CohortAttendanceSummary  (cohort, subject)  -> distinct lectures (date, time)
+
+Writers report what changed and apply_changes() moves the counts by that
+much with F() updates, inside the writer's transaction, so readers never
+see records without their counts. A record that is edited is reported as
+its old version removed and its new version added. A cohort's `lectures`
+only moves when a (date, time) gets its first record or loses its last
+one, which one grouped count over the touched lectures tells; the history
+is never rescanned. The number of queries does not depend on how many
+records changed.
+
+Single saves and deletes are handled by the receivers below (imported by
+CoreConfig.ready()); inside batched_summaries() they are collected and
+applied once when the block ends. Bulk writers (bulk_create, bulk_update,
+queryset.update) call apply_changes() themselves. Changes that bypass both
+(raw SQL, moving a student to another class) are repaired with
+`manage.py rebuild_attendance_summary`.
+"""
+import datetime
+import threading
+from collections import Counter, defaultdict, namedtuple
+from contextlib import contextmanager
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Max, Q, Value, When
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .models import Student, AttendanceRecord, AttendanceSummary, CohortAttendanceSummary
+
+BATCH_SIZE = 2000
+
+# What a record contributes to the summaries; cohort is (year_key, section_key, department_key)
+SummaryRow = namedtuple('SummaryRow', 'student_id subject_key subject status date time cohort')
+
+
+def _cohort_of(student):
+    return (student.year_key, student.section_key, student.department_key)
+
+
+def summary_row(record, student=None):
+    """The SummaryRow of an AttendanceRecord as it is now (its student is queried unless cached or given)."""
+    if student is None:
+        if AttendanceRecord.student.is_cached(record):
+            student = record.student
+        else:
+            student = Student.objects.only('year_key', 'section_key', 'department_key').get(id=record.student_id)
+    time = record.time
+    if isinstance(time, datetime.datetime):  # the field default before the record is reloaded
+        time = time.time()
+    return SummaryRow(record.student_id, record.subject_key, record.subject or '', record.status,
+                      record.date, time, _cohort_of(student))
+
+
+def _any_cohort(cohorts, prefix=''):
+    """Q matching any of the (year_key, section_key, department_key) cohorts."""
+    match = Q(pk__in=[])
+    for year_key, section_key, department_key in cohorts:
+        match |= Q(**{f'{prefix}year_key': year_key, f'{prefix}section_key': section_key,
+                      f'{prefix}department_key': department_key})
+    return match
+
+
+def _case(deltas):
+    """Integer expression: the delta of the first matching (Q, delta), else 0."""
+    if not deltas:
+        return Value(0)
+    return Case(*[When(match, then=Value(delta)) for match, delta in deltas], default=Value(0),
+                output_field=IntegerField())
+
+
+def _apply_student_deltas(removed, added):
+    deltas = defaultdict(lambda: [0, 0, 0])  # (student_id, subject_key) -> [present, absent, total]
+    names = {}
+    for sign, rows in ((-1, removed), (1, added)):
+        for row in rows:
+            delta = deltas[(row.student_id, row.subject_key)]
+            delta[0] += sign * (row.status == 'Present')
+            delta[1] += sign * (row.status == 'Absent')
+            delta[2] += sign
+            names.setdefault((row.student_id, row.subject_key), row.subject)
+
+    AttendanceSummary.objects.bulk_create([
+        AttendanceSummary(student_id=student_id, subject_key=subject_key, subject=names[(student_id, subject_key)])
+        for (student_id, subject_key), (_, _, total) in deltas.items() if total > 0
+    ], batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+    # One UPDATE per subject; a CASE gives each group of students with the same change its delta
+    groups = defaultdict(lambda: defaultdict(list))  # subject_key -> delta -> student ids
+    for (student_id, subject_key), delta in deltas.items():
+        if any(delta):
+            groups[subject_key][tuple(delta)].append(student_id)
+    for subject_key, by_delta in groups.items():
+        def change(i):
+            return _case([(Q(student_id__in=ids), delta[i]) for delta, ids in by_delta.items() if delta[i]])
+        AttendanceSummary.objects.filter(
+            student_id__in=[sid for ids in by_delta.values() for sid in ids], subject_key=subject_key,
+        ).update(present=F('present') + change(0), absent=F('absent') + change(1), total=F('total') + change(2))
+
+    emptied = [pair for pair, (_, _, total) in deltas.items() if total < 0]
+    if emptied:
+        AttendanceSummary.objects.filter(
+            student_id__in={student_id for student_id, _ in emptied},
+            subject_key__in={subject_key for _, subject_key in emptied},
+            total=0,
+        ).delete()
+
+
+def _apply_lecture_deltas(removed, added):
+    # Net records added per lecture; a lecture whose count didn't change can't have appeared or vanished
+    net = Counter()
+    for sign, rows in ((-1, removed), (1, added)):
+        for row in rows:
+            net[(row.cohort, row.subject_key, row.date, row.time)] += sign
+    touched = {lecture: n for lecture, n in net.items() if n}
+    if not touched:
+        return
+
+    cohorts = {cohort for cohort, _, _, _ in touched}
+    counts = {
+        ((row['student__year_key'], row['student__section_key'], row['student__department_key']),
+         row['subject_key'], row['date'], row['time']): row['records']
+        for row in AttendanceRecord.objects.filter(
+            _any_cohort(cohorts, prefix='student__'),
+            subject_key__in={subject_key for _, subject_key, _, _ in touched},
+            date__in={date for _, _, date, _ in touched},
+            time__in={time for _, _, _, time in touched},
+        ).values(
+            'student__year_key', 'student__section_key', 'student__department_key', 'subject_key', 'date', 'time'
+        ).annotate(records=Count('id')).order_by()
+    }
+    lecture_deltas = Counter()  # (cohort, subject_key) -> lectures gained or lost
+    for lecture, n in touched.items():
+        now = counts.get(lecture, 0)
+        lecture_deltas[lecture[:2]] += (now > 0) - (now - n > 0)
+
+    CohortAttendanceSummary.objects.bulk_create([
+        CohortAttendanceSummary(year_key=cohort[0], section_key=cohort[1], department_key=cohort[2],
+                                subject_key=subject_key)
+        for (cohort, subject_key), delta in lecture_deltas.items() if delta > 0
+    ], batch_size=BATCH_SIZE, ignore_conflicts=True)
+    groups = defaultdict(lambda: defaultdict(set))  # subject_key -> delta -> cohorts
+    for (cohort, subject_key), delta in lecture_deltas.items():
+        if delta:
+            groups[subject_key][delta].add(cohort)
+    for subject_key, by_delta in groups.items():
+        cohorts = set().union(*by_delta.values())
+        CohortAttendanceSummary.objects.filter(_any_cohort(cohorts), subject_key=subject_key).update(
+            lectures=F('lectures') + _case([(_any_cohort(group), delta) for delta, group in by_delta.items()]))
+        if any(delta < 0 for delta in by_delta):
+            CohortAttendanceSummary.objects.filter(_any_cohort(cohorts), subject_key=subject_key, lectures=0).delete()
+
+def apply_changes(removed=(), added=()):
+    """
+    Move the summaries by SummaryRows of records that were deleted (or the
+    old version of edited ones) and records that were created (or the new
+    version). Call after the records have been written.
+    """
+    removed, added = list(removed), list(added)
+    if not removed and not added:
+        return
+    with transaction.atomic():
+        _apply_student_deltas(removed, added)
+        _apply_lecture_deltas(removed, added)
+
+
+def _student_rows(records):
+    """One AttendanceSummary per (student, subject_key) of `records`."""
+    rows = records.values('student_id', 'subject_key').annotate(
+        subject_name=Max('subject'),
+        present_count=Count('id', filter=Q(status='Present')),
+        absent_count=Count('id', filter=Q(status='Absent')),
+        record_count=Count('id'),
+    ).order_by()
+    return [
+        AttendanceSummary(
+            student_id=row['student_id'], subject_key=row['subject_key'], subject=row['subject_name'] or '',
+            present=row['present_count'], absent=row['absent_count'], total=row['record_count'],
+        )
+        for row in rows
+    ]
+
+
+def _cohort_rows(records):
+    """One CohortAttendanceSummary per (cohort, subject_key) of `records`."""
+    lectures = Counter(
+        lecture[:4]
+        for lecture in records.values_list(
+            'student__year_key', 'student__section_key', 'student__department_key', 'subject_key', 'date', 'time'
+        ).distinct().order_by().iterator(chunk_size=BATCH_SIZE)
+    )
+    return [
+        CohortAttendanceSummary(
+            year_key=year_key, section_key=section_key, department_key=department_key,
+            subject_key=subject_key, lectures=count,
+        )
+        for (year_key, section_key, department_key, subject_key), count in lectures.items()
+    ]
+
+
+def rebuild_summaries():
+    """Recompute every summary from AttendanceRecord; returns (student rows, cohort rows)."""
+    with transaction.atomic():
+        AttendanceSummary.objects.all().delete()
+        CohortAttendanceSummary.objects.all().delete()
+        student_rows = _student_rows(AttendanceRecord.objects.all())
+        cohort_rows = _cohort_rows(AttendanceRecord.objects.all())
+        AttendanceSummary.objects.bulk_create(student_rows, batch_size=BATCH_SIZE)
+        CohortAttendanceSummary.objects.bulk_create(cohort_rows, batch_size=BATCH_SIZE)
+    return len(student_rows), len(cohort_rows)
+
+
+_batch = threading.local()
+
+
+@contextmanager
+def batched_summaries():
+    """Apply the summary changes of single saves/deletes inside the block once, when it ends."""
+    if getattr(_batch, 'changes', None) is not None:
+        yield
+        return
+    _batch.changes = changes = ([], [])
+    try:
+        yield
+    finally:
+        _batch.changes = None
+    apply_changes(*changes)
+
+
+def _record_changed(removed=(), added=()):
+    changes = getattr(_batch, 'changes', None)
+    if changes is None:
+        apply_changes(removed, added)
+    else:
+        changes[0].extend(removed)
+        changes[1].extend(added)
+
+
+@receiver(pre_save, sender=AttendanceRecord)
+def _record_saving(sender, instance, raw=False, **kwargs):
+    # The version being replaced, read before it is overwritten
+    instance._summary_row = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    old = AttendanceRecord.objects.filter(pk=instance.pk).values(
+        'student_id', 'subject_key', 'subject', 'status', 'date', 'time',
+        'student__year_key', 'student__section_key', 'student__department_key',
+    ).first()
+    if old:
+        instance._summary_row = SummaryRow(
+            old['student_id'], old['subject_key'], old['subject'] or '', old['status'], old['date'], old['time'],
+            (old['student__year_key'], old['student__section_key'], old['student__department_key']),
+        )
+
+
+@receiver(post_save, sender=AttendanceRecord)
+def _record_saved(sender, instance, created=False, raw=False, **kwargs):
+    if raw:  # loaddata: rebuild afterwards
+        return
+    old = getattr(instance, '_summary_row', None)
+    new = summary_row(instance)
+    if old == new:
+        return
+    _record_changed(removed=[old] if old else [], added=[new])
+
+
+@receiver(post_delete, sender=AttendanceRecord)
+def _record_deleted(sender, instance, origin=None, **kwargs):
+    # Only direct deletes of records. When a student (or their user) is deleted the
+    # cascade also removes their summaries, and updating them mid-cascade would recreate them.
+    origin_model = getattr(origin, 'model', type(origin))
+    if origin_model is not AttendanceRecord:
+        return
+    _record_changed(removed=[summary_row(instance)])
+
@@ -0,0 +1,58 @@
+"""
+Write-only (streaming) Excel exports.
+
+A regular openpyxl Workbook keeps a Cell object, with its own Font/Fill/
+Border, for every value until save. Write-only workbooks write each appended
+row straight to a temporary file, and cells reference named styles registered
+once per workbook. Column widths and row heights are written before the first
+row, so callers estimate widths from data statistics (e.g. Max(Length(...))
+in SQL) instead of measuring every cell afterwards.
+
+An .xlsx is a zip archive whose sheet entry can only be written once all of
+its rows are known, so the response starts once the sheet is complete; the
+finished file is spooled to disk and sent in chunks by FileResponse, keeping
+memory flat however many rows there are.
+"""
+import tempfile
+from django.http import FileResponse
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+# Exports up to this size are assembled in memory, larger ones on disk
+SPOOL_MAX_BYTES = 2 * 1024 * 1024
+
+
+def new_workbook(title, named_styles=()):
+    """(workbook, worksheet) in write-only mode with `named_styles` registered."""
+    import openpyxl
+    wb = openpyxl.Workbook(write_only=True)
+    for style in named_styles:
+        wb.add_named_style(style)
+    return wb, wb.create_sheet(title)
+
+
+def styled(ws, value, style):
+    """A write-only cell using the named style `style`."""
+    from openpyxl.cell import WriteOnlyCell
+    cell = WriteOnlyCell(ws, value=value)
+    cell.style = style
+    return cell
+
+
+def estimate_width(max_length, minimum=12, padding=4, maximum=60):
+    """Column width for values of at most `max_length` characters."""
+    return min(max((max_length or 0) + padding, minimum), maximum)
+
+
+def set_column_widths(ws, widths):
+    """Widths for columns A, B, ... in order; must run before the first append()."""
+    from openpyxl.utils import get_column_letter
+    for idx, width in enumerate(widths, 1):
+        ws.column_dimensions[get_column_letter(idx)].width = width
+
+
+def xlsx_response(wb, filename):
+    """Save the workbook to a spooled temp file and stream it as an attachment."""
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    wb.save(out)
+    out.seek(0)
+    return FileResponse(out, as_attachment=True, filename=filename, content_type=XLSX_CONTENT_TYPE)
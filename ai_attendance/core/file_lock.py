@@ -0,0 +1,81 @@
+"""
+Cross-process lock files for work shared by all gunicorn workers (model
+builds, publishing a model version, the training status file).
+
+A lock is a file created with O_EXCL holding its owner's token. An owner
+that crashed leaves the file behind; once its mtime is older than
+`stale_after` another process may break it. Owners of long critical
+sections call touch() periodically so they are never taken for crashed.
+"""
+import os
+import time
+import uuid
+
+
+class FileLock:
+    def __init__(self, path, stale_after):
+        self.path = str(path)
+        self.stale_after = stale_after
+        self._token = None
+
+    def _try_create(self):
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        token = f"{os.getpid()}-{uuid.uuid4().hex}"
+        with os.fdopen(fd, 'w') as f:
+            f.write(token)
+        self._token = token
+        return True
+
+    def _break_if_stale(self):
+        try:
+            if time.time() - os.path.getmtime(self.path) < self.stale_after:
+                return
+            # Renamed aside first so only one process breaks a given stale file
+            stale_path = f"{self.path}.{os.getpid()}-{uuid.uuid4().hex}.stale"
+            os.rename(self.path, stale_path)
+            os.remove(stale_path)
+        except OSError:
+            pass
+
+    def acquire(self, timeout=0, poll=0.05):
+        """True once the lock is held; False if it is still held elsewhere after `timeout` seconds."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        deadline = time.monotonic() + timeout
+        while True:
+            if self._try_create():
+                return True
+            self._break_if_stale()
+            if self._try_create():
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(poll)
+
+    def touch(self):
+        """Refresh the mtime so a long-running owner is not considered stale."""
+        try:
+            os.utime(self.path)
+        except OSError:
+            pass
+
+    def release(self):
+        # Only remove the file if it is still ours (it may have been broken as stale).
+        try:
+            with open(self.path) as f:
+                owned = f.read() == self._token
+            if owned:
+                os.remove(self.path)
+        except OSError:
+            pass
+        self._token = None
+
+    def __enter__(self):
+        if not self.acquire(timeout=self.stale_after):
+            raise TimeoutError(f"Could not acquire {self.path}")
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from core.attendance_summary import rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = "Recompute the attendance summary tables from the attendance records."
+
+    def handle(self, *args, **options):
+        student_rows, cohort_rows = rebuild_summaries()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {student_rows} student/subject and {cohort_rows} cohort/subject summaries."))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.model_store import list_versions, get_current_version, rollback
+
+
+class Command(BaseCommand):
+    help = "List published face-model versions or roll back to a previous one."
+
+    def add_arguments(self, parser):
+        parser.add_argument('version', nargs='?', help="Version to activate (default: the one before current)")
+        parser.add_argument('--list', action='store_true', help="List available versions and exit")
+
+    def handle(self, *args, **options):
+        current = get_current_version()
+        if options['list']:
+            for version in list_versions():
+                marker = '*' if version == current else ' '
+                self.stdout.write(f"{marker} {version}")
+            return
+
+        activated = rollback(options['version'])
+        if activated is None:
+            raise CommandError("No matching earlier model version to roll back to.")
+        self.stdout.write(self.style.SUCCESS(f"Active model: {current} -> {activated}"))
@@ -0,0 +1,249 @@
+"""
+In-process metrics for the recognition hot path.
+
+A small registry of counters, gauges and fixed-bucket latency histograms,
+rendered in the Prometheus text exposition format by the /metrics/ view
+(?format=json for a JSON dump). Everything lives in process memory, so each
+gunicorn worker reports its own numbers; the scraper sums across workers.
+Recording is a dict lookup plus a lock, cheap enough for every frame.
+
+    with STAGE_SECONDS.time(stage='encode'):
+        encodings = encode_faces(image, locations)
+    FACES_DETECTED.inc(len(locations), detector='hog')
+"""
+import time
+import bisect
+import functools
+import threading
+from contextlib import contextmanager
+
+# Seconds; covers a 1-NN match (~1ms) up to a full HOG pass on a large upload.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = self._header()
+        for key, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{_format_labels(zip(self.labelnames, key))} {_format_value(value)}")
+        return lines
+
+    def to_dict(self):
+        return [{'labels': dict(zip(self.labelnames, key)), 'value': value}
+                for key, value in sorted(self.collect().items())]
+
+
+class Gauge(Counter):
+    """A value that can go down; `func` (no labels) is evaluated at scrape time."""
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labelnames=(), func=None):
+        super().__init__(name, help_text, labelnames)
+        self.func = func
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def collect(self):
+        if self.func is not None:
+            return {(): self.func()}
+        return super().collect()
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # per-bucket (non-cumulative) counts, last slot is +Inf; then sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def collect(self):
+        with self._lock:
+            return {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+
+    def render(self):
+        lines = self._header()
+        for key, (counts, total) in sorted(self.collect().items()):
+            base = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(base + [('le', _format_value(float(bound)))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(base)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(base)} {cumulative}")
+        return lines
+
+    def to_dict(self):
+        result = []
+        for key, (counts, total) in sorted(self.collect().items()):
+            count = sum(counts)
+            result.append({
+                'labels': dict(zip(self.labelnames, key)),
+                'count': count,
+                'sum': total,
+                'mean': total / count if count else 0.0,
+                'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'], counts)),
+            })
+        return result
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                return self._metrics[metric.name]
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=(), func=None):
+        return self._register(Gauge(name, help_text, labelnames, func=func))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def render_prometheus(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def to_dict(self):
+        return {
+            'started_at': self.started_at,
+            'metrics': {
+                name: {'type': metric.kind, 'help': metric.help, 'samples': metric.to_dict()}
+                for name, metric in list(self._metrics.items())
+            },
+        }
+
+
+def timed(histogram, **labels):
+    """View decorator: observe the wrapped call's duration in `histogram`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+registry = MetricsRegistry()
+
+# -- Recognition pipeline ----------------------------------------------------
+STAGE_SECONDS = registry.histogram(
+    'recognition_stage_seconds',
+    'Time spent in each recognition pipeline stage.',
+    ('stage',),
+)
+FRAMES = registry.counter(
+    'recognition_frames_total',
+    'Frames passed to identify_faces(), by recognition cache outcome.',
+    ('cache',),
+)
+FACES_DETECTED = registry.counter(
+    'recognition_faces_detected_total',
+    'Face boxes found per detector (merged = after IOU de-duplication).',
+    ('detector',),
+)
+FACES_MATCHED = registry.counter(
+    'recognition_faces_total',
+    'Encoded faces by match outcome.',
+    ('result',),
+)
+
+# -- Attendance marking ------------------------------------------------------
+REQUEST_SECONDS = registry.histogram(
+    'attendance_request_seconds',
+    'End-to-end latency of recognition-backed attendance requests.',
+    ('view',),
+)
+ATTENDANCE_MARKED = registry.counter(
+    'attendance_marked_total',
+    'Attendance outcomes written or skipped by the recognition views.',
+    ('view', 'status'),
+)
+
+
+def _cache_entries():
+    from .recognition_cache import recognition_cache
+    return recognition_cache.stats()['size']
+
+
+registry.gauge('recognition_cache_entries', 'Entries in the recognition result cache.', func=_cache_entries)
+
@@ -0,0 +1,69 @@
+# Generated by Django 4.2.16 on 2026-10-19 10:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0027_studentnote"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ClassSession",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("subject", models.CharField(max_length=100)),
+                ("subject_key", models.CharField(max_length=100)),
+                ("year", models.CharField(blank=True, default="", max_length=10)),
+                ("section", models.CharField(blank=True, default="", max_length=10)),
+                (
+                    "year_key",
+                    models.CharField(
+                        blank=True, default="", editable=False, max_length=10
+                    ),
+                ),
+                (
+                    "section_key",
+                    models.CharField(
+                        blank=True, default="", editable=False, max_length=10
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("start_time", models.TimeField()),
+                ("end_time", models.TimeField(blank=True, null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "ordering": ["-date", "-start_time"],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="classsession",
+            constraint=models.UniqueConstraint(
+                fields=("subject_key", "year_key", "section_key", "date", "start_time"),
+                name="unique_class_session",
+            ),
+        ),
+        migrations.AddField(
+            model_name="attendancerecord",
+            name="session",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="records",
+                to="core.classsession",
+            ),
+        ),
+    ]
@@ -0,0 +1,124 @@
+"""
+Backfill ClassSession rows for historical attendance and link every record
+with a subject to its session.
+
+Sessions are keyed like the runtime does (core.utils.get_class_sessions):
+the normalized year/section of the student (a cohort spelled "A" and "a "
+is one cohort; the session keeps the first spelling seen), the normalized
+subject, the date, and the start
+of the TeacherSubject slot (TimeTable as fallback) whose +/-45 minute window
+covers the record's time. Records outside any slot are grouped into
+unscheduled sessions: a record more than 60 minutes after the current
+session's start opens a new one. If a student has several records in one
+session (old double-marking), only the earliest is linked; the rest keep
+session NULL so the unique constraint added next can be created.
+"""
+import datetime
+from django.db import migrations
+
+BATCH_SIZE = 2000
+SLOT_MARGIN = datetime.timedelta(minutes=45)
+UNSCHEDULED_SPAN = datetime.timedelta(minutes=60)
+
+
+def _key(value):
+    return ' '.join((value or '').split()).lower()
+
+
+def _load_slots(TeacherSubject, TimeTable):
+    """{(subject_key, weekday): [(id, start, end), ...]} per model, id order."""
+    result = []
+    for model in (TeacherSubject, TimeTable):
+        slots = {}
+        for slot_id, subject, day, start, end in model.objects.order_by('id').values_list(
+                'id', 'subject', 'day', 'start_time', 'end_time'):
+            entries = slots.setdefault((_key(subject), day), [])
+            if start and end:
+                entries.append((slot_id, start, end))
+        result.append(slots)
+    return result
+
+
+def _slot_for(teacher_slots, timetable_slots, subject_key, date, time):
+    key = (subject_key, date.weekday())
+    entries = teacher_slots[key] if key in teacher_slots else timetable_slots.get(key, [])
+    check = datetime.datetime.combine(date, time)
+    for _, start, end in entries:
+        if (datetime.datetime.combine(date, start) - SLOT_MARGIN <= check
+                <= datetime.datetime.combine(date, end) + SLOT_MARGIN):
+            return start, end
+    return None
+
+
+def backfill_sessions(apps, schema_editor):
+    AttendanceRecord = apps.get_model('core', 'AttendanceRecord')
+    ClassSession = apps.get_model('core', 'ClassSession')
+    TeacherSubject = apps.get_model('core', 'TeacherSubject')
+    TimeTable = apps.get_model('core', 'TimeTable')
+
+    teacher_slots, timetable_slots = _load_slots(TeacherSubject, TimeTable)
+
+    rows = (
+        AttendanceRecord.objects.filter(session__isnull=True)
+        .exclude(subject__isnull=True).exclude(subject='')
+        .values_list('id', 'student_id', 'subject', 'date', 'time', 'student__year', 'student__section')
+        .order_by('date', 'time', 'id')
+    )
+
+    sessions = {}       # (subject_key, year_key, section_key, date, start) -> [subject, end, year, section]
+    assignment = {}     # record id -> session key
+    open_unscheduled = {}  # (subject_key, year_key, section_key, date) -> start of the latest unscheduled session
+    seen = set()        # (session key, student id)
+    for record_id, student_id, subject, date, time, year, section in rows.iterator(chunk_size=BATCH_SIZE):
+        subject_key = _key(subject)
+        cohort = (subject_key, _key(year), _key(section), date)
+        slot = _slot_for(teacher_slots, timetable_slots, subject_key, date, time)
+        if slot:
+            start, end = slot
+        else:
+            start, end = open_unscheduled.get(cohort), None
+            if start is None or (datetime.datetime.combine(date, time)
+                                 - datetime.datetime.combine(date, start)) > UNSCHEDULED_SPAN:
+                start = time.replace(microsecond=0)
+                open_unscheduled[cohort] = start
+        session_key = cohort + (start,)
+        sessions.setdefault(session_key, [subject, end, year or '', section or ''])
+        if (session_key, student_id) in seen:
+            continue
+        seen.add((session_key, student_id))
+        assignment[record_id] = session_key
+
+    ClassSession.objects.bulk_create([
+        ClassSession(subject=subject, subject_key=key[0], year=year, section=section,
+                     year_key=key[1], section_key=key[2], date=key[3], start_time=key[4], end_time=end)
+        for key, (subject, end, year, section) in sessions.items()
+    ], batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+    session_ids = {
+        (s.subject_key, s.year_key, s.section_key, s.date, s.start_time): s.id
+        for s in ClassSession.objects.all().only('id', 'subject_key', 'year_key', 'section_key', 'date', 'start_time')
+    }
+    pending = []
+    for record_id, session_key in assignment.items():
+        pending.append(AttendanceRecord(id=record_id, session_id=session_ids[session_key]))
+        if len(pending) >= BATCH_SIZE:
+            AttendanceRecord.objects.bulk_update(pending, ['session'])
+            pending = []
+    if pending:
+        AttendanceRecord.objects.bulk_update(pending, ['session'])
+
+
+def unlink_sessions(apps, schema_editor):
+    apps.get_model('core', 'AttendanceRecord').objects.update(session=None)
+    apps.get_model('core', 'ClassSession').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0028_classsession"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_sessions, unlink_sessions),
+    ]
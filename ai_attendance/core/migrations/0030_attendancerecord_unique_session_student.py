@@ -0,0 +1,19 @@
+# Generated by Django 4.2.16 on 2026-10-19 10:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0029_backfill_class_sessions"),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name="attendancerecord",
+            constraint=models.UniqueConstraint(
+                fields=("session", "student"), name="unique_session_student"
+            ),
+        ),
+    ]
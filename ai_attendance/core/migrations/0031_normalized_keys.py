@@ -0,0 +1,102 @@
+# Generated by Django 4.2.16 on 2026-10-19 11:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0030_attendancerecord_unique_session_student"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="attendancerecord",
+            name="subject_key",
+            field=models.CharField(
+                blank=True, default="", editable=False, max_length=100
+            ),
+        ),
+        migrations.AddField(
+            model_name="student",
+            name="department_key",
+            field=models.CharField(
+                blank=True, default="", editable=False, max_length=100
+            ),
+        ),
+        migrations.AddField(
+            model_name="student",
+            name="section_key",
+            field=models.CharField(
+                blank=True, default="", editable=False, max_length=10
+            ),
+        ),
+        migrations.AddField(
+            model_name="student",
+            name="year_key",
+            field=models.CharField(
+                blank=True, default="", editable=False, max_length=10
+            ),
+        ),
+        migrations.AddField(
+            model_name="teachersubject",
+            name="section_key",
+            field=models.CharField(
+                blank=True, default="", editable=False, max_length=10
+            ),
+        ),
+        migrations.AddField(
+            model_name="teachersubject",
+            name="subject_key",
+            field=models.CharField(
+                blank=True, default="", editable=False, max_length=100
+            ),
+        ),
+        migrations.AddField(
+            model_name="teachersubject",
+            name="year_key",
+            field=models.CharField(
+                blank=True, default="", editable=False, max_length=10
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="student",
+            index=models.Index(
+                fields=["year_key", "section_key", "department_key"], name="student_cohort_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="attendancerecord",
+            index=models.Index(
+                fields=["student", "date", "subject_key"], name="attendance_student_date_subj"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="attendancerecord",
+            index=models.Index(
+                fields=["subject_key", "date"], name="attendance_subject_date"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="attendancerecord",
+            index=models.Index(fields=["date", "time"], name="attendance_date_time"),
+        ),
+        migrations.AddIndex(
+            model_name="attendancerecord",
+            index=models.Index(
+                fields=["student", "date", "time"], name="attendance_student_date_time"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="teachersubject",
+            index=models.Index(
+                fields=["teacher", "day"], name="teachersubject_teacher_day"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="teachersubject",
+            index=models.Index(
+                fields=["subject_key", "year_key", "section_key"], name="teachersubject_subject_class"
+            ),
+        ),
+    ]
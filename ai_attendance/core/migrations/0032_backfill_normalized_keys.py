@@ -0,0 +1,44 @@
+"""
+Fill the normalized key columns added in 0031 for existing rows, with the
+same normalization the models apply on save (core.models.normalize_key).
+"""
+from django.db import migrations
+
+BATCH_SIZE = 2000
+
+
+def _key(value):
+    return ' '.join((value or '').split()).lower()
+
+
+def _backfill(model, sources):
+    pending = []
+    for row in model.objects.only('id', *sources).iterator(chunk_size=BATCH_SIZE):
+        for source in sources:
+            setattr(row, f'{source}_key', _key(getattr(row, source)))
+        pending.append(row)
+        if len(pending) >= BATCH_SIZE:
+            model.objects.bulk_update(pending, [f'{source}_key' for source in sources])
+            pending = []
+    if pending:
+        model.objects.bulk_update(pending, [f'{source}_key' for source in sources])
+
+
+def backfill_keys(apps, schema_editor):
+    _backfill(apps.get_model('core', 'Student'), ['department', 'year', 'section'])
+    _backfill(apps.get_model('core', 'TeacherSubject'), ['subject', 'year', 'section'])
+    # Few distinct subjects over many records: one UPDATE per subject spelling
+    AttendanceRecord = apps.get_model('core', 'AttendanceRecord')
+    for subject in AttendanceRecord.objects.exclude(subject=None).values_list('subject', flat=True).distinct():
+        AttendanceRecord.objects.filter(subject=subject).update(subject_key=_key(subject))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0031_normalized_keys"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,100 @@
+"""
+Store the canonical department code (core.models.canonical_department) in
+Student.department_key, replacing the lower-cased department text written
+by 0032, and index it with the year for coordinator lookups. Class
+coordinators get the same department/year/section keys, so a coordinator
+entered as "Computer Science" is matched with the CSE students.
+"""
+from django.db import migrations, models
+
+DEPARTMENT_CODES = ['CSE', 'IT', 'ECE', 'EE', 'ME', 'CE', 'AIDS', 'AIML']
+# Spellings seen in student records that don't contain their code
+DEPARTMENT_ALIASES = {
+    'CS': 'CSE', 'COMPUTER SCIENCE': 'CSE', 'COMPUTER SCIENCE & ENGINEERING': 'CSE',
+    'COMPUTER SCIENCE AND ENGINEERING': 'CSE', 'INFORMATION TECHNOLOGY': 'IT',
+    'EC': 'ECE', 'ELECTRONICS & COMMUNICATION': 'ECE', 'ELECTRONICS AND COMMUNICATION': 'ECE',
+    'EEE': 'EE', 'ELECTRICAL': 'EE', 'ELECTRICAL ENGINEERING': 'EE',
+    'MECH': 'ME', 'MECHANICAL': 'ME', 'MECHANICAL ENGINEERING': 'ME',
+    'CIVIL': 'CE', 'CIVIL ENGINEERING': 'CE',
+    'AI&DS': 'AIDS', 'AI & DATA SCIENCE': 'AIDS', 'AI-DS': 'AIDS',
+    'AI&ML': 'AIML', 'AI & MACHINE LEARNING': 'AIML', 'AI-ML': 'AIML',
+}
+
+def _canonical_department(value):
+    """
+    Department code (TeacherProfile.DEPARTMENT_CHOICES) for a free-text
+    department: 'cse', 'CSE-A', 'Dept. of CSE' and 'Computer Science' all
+    give 'CSE'. Unrecognised values are returned trimmed and upper-cased.
+    """
+    name = ' '.join((value or '').split()).upper()
+    if name in DEPARTMENT_CODES:
+        return name
+    if name in DEPARTMENT_ALIASES:
+        return DEPARTMENT_ALIASES[name]
+    tokens = set(''.join(c if c.isalnum() else ' ' for c in name).split())
+    matches = {DEPARTMENT_ALIASES.get(token, token) for token in tokens} & set(DEPARTMENT_CODES)
+    return matches.pop() if len(matches) == 1 else name
+
+
+def _key(value):
+    return ' '.join((value or '').split()).lower()
+
+
+def backfill_department_codes(apps, schema_editor):
+    # Few distinct department spellings: one UPDATE each
+    Student = apps.get_model('core', 'Student')
+    for department in Student.objects.values_list('department', flat=True).distinct():
+        Student.objects.filter(department=department).update(department_key=_canonical_department(department))
+
+    # One row per class
+    ClassCoordinator = apps.get_model('core', 'ClassCoordinator')
+    coordinators = list(ClassCoordinator.objects.all())
+    for coordinator in coordinators:
+        coordinator.department_key = _canonical_department(coordinator.department)
+        coordinator.year_key = _key(coordinator.year)
+        coordinator.section_key = _key(coordinator.section)
+    ClassCoordinator.objects.bulk_update(coordinators, ['department_key', 'year_key', 'section_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0032_backfill_normalized_keys"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="classcoordinator",
+            name="department_key",
+            field=models.CharField(
+                blank=True, default="", editable=False, max_length=100
+            ),
+        ),
+        migrations.AddField(
+            model_name="classcoordinator",
+            name="section_key",
+            field=models.CharField(
+                blank=True, default="", editable=False, max_length=10
+            ),
+        ),
+        migrations.AddField(
+            model_name="classcoordinator",
+            name="year_key",
+            field=models.CharField(
+                blank=True, default="", editable=False, max_length=10
+            ),
+        ),
+        migrations.RunPython(backfill_department_codes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="student",
+            index=models.Index(
+                fields=["department_key", "year_key"], name="student_dept_year_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="classcoordinator",
+            index=models.Index(
+                fields=["department_key", "year_key"], name="coordinator_dept_year_idx"
+            ),
+        ),
+    ]
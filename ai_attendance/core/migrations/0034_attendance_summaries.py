@@ -0,0 +1,90 @@
+# Generated by Django 4.2.16 on 2026-10-19 12:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0033_student_department_code"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CohortAttendanceSummary",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "department_key",
+                    models.CharField(blank=True, default="", max_length=100),
+                ),
+                ("year_key", models.CharField(blank=True, default="", max_length=10)),
+                (
+                    "section_key",
+                    models.CharField(blank=True, default="", max_length=10),
+                ),
+                (
+                    "subject_key",
+                    models.CharField(blank=True, default="", max_length=100),
+                ),
+                ("lectures", models.PositiveIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="AttendanceSummary",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("subject", models.CharField(blank=True, default="", max_length=100)),
+                (
+                    "subject_key",
+                    models.CharField(blank=True, default="", max_length=100),
+                ),
+                ("present", models.PositiveIntegerField(default=0)),
+                ("absent", models.PositiveIntegerField(default=0)),
+                ("total", models.PositiveIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "student",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="attendance_summaries",
+                        to="core.student",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["subject"],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="cohortattendancesummary",
+            constraint=models.UniqueConstraint(
+                fields=("year_key", "section_key", "department_key", "subject_key"),
+                name="unique_cohort_subject_summary",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="attendancesummary",
+            constraint=models.UniqueConstraint(
+                fields=("student", "subject_key"), name="unique_student_subject_summary"
+            ),
+        ),
+    ]
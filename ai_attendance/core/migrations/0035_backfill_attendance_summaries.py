@@ -0,0 +1,59 @@
+"""
+Populate the attendance summary tables from existing records; the same
+computation as core.attendance_summary.rebuild_summaries(), on historical models.
+"""
+from collections import Counter
+from django.db import migrations
+from django.db.models import Count, Max, Q
+
+BATCH_SIZE = 2000
+
+
+def build_summaries(apps, schema_editor):
+    AttendanceRecord = apps.get_model('core', 'AttendanceRecord')
+    AttendanceSummary = apps.get_model('core', 'AttendanceSummary')
+    CohortAttendanceSummary = apps.get_model('core', 'CohortAttendanceSummary')
+
+    rows = AttendanceRecord.objects.values('student_id', 'subject_key').annotate(
+        subject_name=Max('subject'),
+        present_count=Count('id', filter=Q(status='Present')),
+        absent_count=Count('id', filter=Q(status='Absent')),
+        record_count=Count('id'),
+    ).order_by()
+    AttendanceSummary.objects.bulk_create([
+        AttendanceSummary(
+            student_id=row['student_id'], subject_key=row['subject_key'], subject=row['subject_name'] or '',
+            present=row['present_count'], absent=row['absent_count'], total=row['record_count'],
+        )
+        for row in rows
+    ], batch_size=BATCH_SIZE)
+
+    lectures = Counter(
+        lecture[:4]
+        for lecture in AttendanceRecord.objects.values_list(
+            'student__year_key', 'student__section_key', 'student__department_key', 'subject_key', 'date', 'time'
+        ).distinct().order_by().iterator(chunk_size=BATCH_SIZE)
+    )
+    CohortAttendanceSummary.objects.bulk_create([
+        CohortAttendanceSummary(
+            year_key=year_key, section_key=section_key, department_key=department_key,
+            subject_key=subject_key, lectures=count,
+        )
+        for (year_key, section_key, department_key, subject_key), count in lectures.items()
+    ], batch_size=BATCH_SIZE)
+
+
+def clear_summaries(apps, schema_editor):
+    apps.get_model('core', 'AttendanceSummary').objects.all().delete()
+    apps.get_model('core', 'CohortAttendanceSummary').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0034_attendance_summaries"),
+    ]
+
+    operations = [
+        migrations.RunPython(build_summaries, clear_summaries),
+    ]
@@ -0,0 +1,354 @@
+"""
+Versioned face-gallery artifacts.
+
+Each trained model is published as its own directory under MODEL_DIR:
+
+    MODEL_DIR/
+        CURRENT              -> name of the active version (e.g. "v000004")
+        GENERATION           -> int64 counter, bumped whenever CURRENT changes
+        v000004/
+            encodings.npy    float64 (N, 128) face encodings
+            norms.npy        float64 (N,) squared norms of the encodings
+            labels.npy       unicode (N,) roll numbers
+            students.json    {roll_number: {name, department, year, section}} display metadata
+            manifest.json    version, checksum, build timestamp, threshold, counts
+
+A version is written into a temporary directory, renamed into place, and only
+then made active by atomically replacing CURRENT, so a reader never sees a
+half-written model. Publishing and rollback hold MODEL_DIR/publish.lock, so
+two workers never claim the same version number or lose a generation bump.
+Older versions are kept for rollback.
+
+Arrays are plain .npy files (no pickle, no scikit-learn dependency) and are
+opened with mmap_mode='r', so loading takes milliseconds regardless of size.
+Because the mappings are read-only and file-backed, every gunicorn worker
+shares the same physical pages of the gallery instead of holding a private
+copy. Workers notice a new version by reading the memory-mapped GENERATION
+counter, which needs no lock and no syscall on the hot path.
+"""
+import os
+import json
+import logging
+import time
+import shutil
+import hashlib
+import threading
+import numpy as np
+from django.conf import settings
+from .file_lock import FileLock
+
+logger = logging.getLogger(__name__)
+
+ENCODINGS_FILE = 'encodings.npy'
+NORMS_FILE = 'norms.npy'
+LABELS_FILE = 'labels.npy'
+STUDENTS_FILE = 'students.json'
+MANIFEST_FILE = 'manifest.json'
+CURRENT_FILE = 'CURRENT'
+GENERATION_FILE = 'GENERATION'
+FORMAT_VERSION = 1
+PUBLISH_LOCK_STALE_AFTER = 60  # seconds
+
+
+def _model_dir():
+    return str(settings.MODEL_DIR)
+
+
+def _current_path():
+    return os.path.join(_model_dir(), CURRENT_FILE)
+
+
+def list_versions():
+    """Return published version names, oldest first."""
+    model_dir = _model_dir()
+    if not os.path.isdir(model_dir):
+        return []
+    return sorted(
+        name for name in os.listdir(model_dir)
+        if name.startswith('v') and os.path.isfile(os.path.join(model_dir, name, MANIFEST_FILE))
+    )
+
+
+def get_current_version():
+    try:
+        with open(_current_path()) as f:
+            version = f.read().strip()
+    except OSError:
+        return None
+    return version or None
+
+
+def _set_current(version):
+    tmp_path = f"{_current_path()}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(version)
+    os.replace(tmp_path, _current_path())
+    _bump_generation()
+
+
+def _generation_path():
+    return os.path.join(_model_dir(), GENERATION_FILE)
+
+
+def _ensure_generation():
+    """Create the counter at 0 unless it exists; linked into place so no reader maps a half-written file."""
+    path = _generation_path()
+    if os.path.exists(path):
+        return
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(np.zeros(1, dtype=np.int64).tobytes())
+    try:
+        os.link(tmp_path, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(tmp_path)
+
+
+def _bump_generation():
+    # Updated in place (never replaced) so readers' existing mappings see the new value.
+    _ensure_generation()
+    counter = np.memmap(_generation_path(), dtype=np.int64, mode='r+', shape=(1,))
+    counter[0] += 1
+    counter.flush()
+    del counter
+
+
+_generation_map = None
+
+
+def _read_generation():
+    """Current generation from the shared counter, or None if it doesn't exist yet."""
+    global _generation_map
+    if _generation_map is None:
+        path = _generation_path()
+        if not os.path.exists(path):
+            return None
+        _generation_map = np.memmap(path, dtype=np.int64, mode='r', shape=(1,))
+    return int(_generation_map[0])
+
+
+def _checksum(encodings, labels):
+    h = hashlib.sha256()
+    h.update(np.ascontiguousarray(encodings).tobytes())
+    h.update(np.ascontiguousarray(labels).tobytes())
+    return h.hexdigest()
+
+
+def _publish_lock():
+    # Held from choosing the version number until CURRENT points at it
+    return FileLock(os.path.join(_model_dir(), 'publish.lock'), PUBLISH_LOCK_STALE_AFTER)
+
+
+def publish_gallery(encodings, labels, students=None):
+    """
+    Write a new gallery version and make it current. `students` maps roll
+    number to display metadata so recognition doesn't need a query per face.
+    Returns the manifest of the published version.
+    """
+    os.makedirs(_model_dir(), exist_ok=True)
+    with _publish_lock():
+        return _publish(encodings, labels, students)
+
+
+def _publish(encodings, labels, students):
+    # Called with the publish lock held.
+    model_dir = _model_dir()
+    encodings = np.asarray(encodings, dtype=np.float64)
+    labels = np.asarray(labels, dtype=str)
+
+    existing = list_versions()
+    next_num = int(existing[-1][1:]) + 1 if existing else 1
+    version = f"v{next_num:06d}"
+
+    manifest = {
+        'format': FORMAT_VERSION,
+        'version': version,
+        'built_at': time.time(),
+        'threshold': settings.RECOGNITION_THRESHOLD,
+        'count': int(encodings.shape[0]),
+        'dim': int(encodings.shape[1]) if encodings.ndim == 2 else 0,
+        'identities': int(len(set(labels.tolist()))),
+        'checksum': _checksum(encodings, labels),
+    }
+
+    tmp_dir = os.path.join(model_dir, f".tmp-{version}-{os.getpid()}")
+    os.makedirs(tmp_dir)
+    try:
+        np.save(os.path.join(tmp_dir, ENCODINGS_FILE), encodings)
+        np.save(os.path.join(tmp_dir, NORMS_FILE), np.einsum('ij,ij->i', encodings, encodings))
+        np.save(os.path.join(tmp_dir, LABELS_FILE), labels)
+        with open(os.path.join(tmp_dir, STUDENTS_FILE), 'w') as f:
+            json.dump(students or {}, f)
+        with open(os.path.join(tmp_dir, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.rename(tmp_dir, os.path.join(model_dir, version))
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    _set_current(version)
+    _prune_versions(keep=getattr(settings, 'MODEL_KEEP_VERSIONS', 5))
+    return manifest
+
+
+def _prune_versions(keep):
+    current = get_current_version()
+    versions = list_versions()
+    for version in versions[:-keep] if keep > 0 else []:
+        if version != current:
+            shutil.rmtree(os.path.join(_model_dir(), version), ignore_errors=True)
+
+
+def rollback(version=None):
+    """
+    Make an older version current. Defaults to the version published before
+    the current one. Returns the activated version name, or None.
+    """
+    # Under the publish lock: _bump_generation() is a read-modify-write a concurrent publish could lose
+    with _publish_lock():
+        versions = list_versions()
+        current = get_current_version()
+        if version is None:
+            older = [v for v in versions if current is None or v < current]
+            if not older:
+                return None
+            version = older[-1]
+        if version not in versions:
+            return None
+        _set_current(version)
+        return version
+
+
+class Gallery:
+    """Read-only view over one published version."""
+
+    def __init__(self, version, encodings, labels, manifest, norms=None, generation=None, students=None):
+        self.version = version
+        self.encodings = encodings
+        self.labels = labels
+        self.manifest = manifest
+        self.students = students or {}
+        self.generation = generation
+        if norms is None:
+            norms = np.einsum('ij,ij->i', encodings, encodings)
+        self.norms = norms
+        self.threshold = manifest.get('threshold', settings.RECOGNITION_THRESHOLD)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def nearest(self, face_encodings):
+        """
+        1-NN search. Returns (labels, distances) for each query encoding,
+        matching KNeighborsClassifier(n_neighbors=1) on the same data.
+        """
+        queries = np.asarray(face_encodings, dtype=np.float64)
+        # ||q - g||^2 = ||q||^2 - 2 q.g + ||g||^2, with ||g||^2 precomputed at build time
+        sq = (
+            np.einsum('ij,ij->i', queries, queries)[:, None]
+            - 2.0 * queries @ self.encodings.T
+            + self.norms[None, :]
+        )
+        idx = np.argmin(sq, axis=1)
+        dists = np.sqrt(np.maximum(sq[np.arange(len(queries)), idx], 0.0))
+        return self.labels[idx], dists
+
+
+def load_gallery(version=None, verify=False, generation=None):
+    """Memory-map a gallery version (the current one by default)."""
+    version = version or get_current_version()
+    if not version:
+        return None
+    version_dir = os.path.join(_model_dir(), version)
+    try:
+        with open(os.path.join(version_dir, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        encodings = np.load(os.path.join(version_dir, ENCODINGS_FILE), mmap_mode='r', allow_pickle=False)
+        labels = np.load(os.path.join(version_dir, LABELS_FILE), mmap_mode='r', allow_pickle=False)
+        norms_path = os.path.join(version_dir, NORMS_FILE)
+        norms = np.load(norms_path, mmap_mode='r', allow_pickle=False) if os.path.exists(norms_path) else None
+        students_path = os.path.join(version_dir, STUDENTS_FILE)
+        students = None
+        if os.path.exists(students_path):
+            with open(students_path) as f:
+                students = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error("Error loading model version %s: %s", version, e)
+        return None
+    if verify and _checksum(encodings, labels) != manifest.get('checksum'):
+        logger.error("Checksum mismatch for model version %s", version)
+        return None
+    return Gallery(version, encodings, labels, manifest, norms=norms, generation=generation, students=students)
+
+
+_cache_lock = threading.Lock()
+_cached_gallery = None
+
+
+def get_gallery():
+    """
+    Return the current gallery. While the shared generation counter is
+    unchanged this is a single memory read; CURRENT is only re-read (and the
+    new version mapped) after the trainer or a rollback bumps it.
+    """
+    global _cached_gallery
+    generation = _read_generation()
+    cached = _cached_gallery
+    if cached is not None and generation is not None and cached.generation == generation:
+        return cached
+
+    version = get_current_version()
+    if version is None:
+        version = _import_legacy_model()
+        if version is None:
+            return None
+        generation = _read_generation()
+    elif generation is None:
+        # Published before the counter existed: create it so later calls take the fast path
+        _ensure_generation()
+        generation = _read_generation()
+    if cached is not None and cached.version == version:
+        cached.generation = generation
+        return cached
+    with _cache_lock:
+        if _cached_gallery is None or _cached_gallery.version != version:
+            start = time.perf_counter()
+            gallery = load_gallery(version, generation=generation)
+            if gallery is None:
+                return _cached_gallery
+            logger.info("Loaded model %s (%d faces) in %.1fms", version, len(gallery), (time.perf_counter() - start) * 1000)
+            _cached_gallery = gallery
+        return _cached_gallery
+
+
+def _import_legacy_model():
+    """One-time conversion of a legacy sklearn model.pkl into a gallery version."""
+    legacy_path = str(settings.MODEL_PATH)
+    if not os.path.exists(legacy_path):
+        return None
+    try:
+        import pickle
+        with open(legacy_path, 'rb') as f:
+            knn_clf = pickle.load(f)
+        encodings = np.asarray(knn_clf._fit_X)
+        labels = np.asarray(knn_clf.classes_)[np.asarray(knn_clf._y)]
+    except Exception as e:
+        logger.warning("Could not import legacy model %s: %s", legacy_path, e)
+        return None
+    from .utils import get_student_display_metadata
+    students = get_student_display_metadata(set(labels.tolist()))
+    os.makedirs(_model_dir(), exist_ok=True)
+    try:
+        with _publish_lock():
+            # Another worker may have imported it while this one was reading the pickle
+            version = get_current_version()
+            if version is not None:
+                return version
+            manifest = _publish(encodings, labels, students)
+    except (OSError, TimeoutError) as e:
+        logger.warning("Could not publish legacy model %s: %s", legacy_path, e)
+        return get_current_version()
+    logger.info("Imported legacy model.pkl as %s", manifest['version'])
+    return manifest['version']
@@ -2,6 +2,38 @@ from django.db import models
 from django.contrib.auth.models import User
 import datetime
 
+def normalize_key(value):
+    """Canonical form of a free-text subject/cohort value for exact, indexable matching."""
+    return ' '.join((value or '').split()).lower()
+
+DEPARTMENT_CODES = ['CSE', 'IT', 'ECE', 'EE', 'ME', 'CE', 'AIDS', 'AIML']
+# Spellings seen in student records that don't contain their code
+DEPARTMENT_ALIASES = {
+    'CS': 'CSE', 'COMPUTER SCIENCE': 'CSE', 'COMPUTER SCIENCE & ENGINEERING': 'CSE',
+    'COMPUTER SCIENCE AND ENGINEERING': 'CSE', 'INFORMATION TECHNOLOGY': 'IT',
+    'EC': 'ECE', 'ELECTRONICS & COMMUNICATION': 'ECE', 'ELECTRONICS AND COMMUNICATION': 'ECE',
+    'EEE': 'EE', 'ELECTRICAL': 'EE', 'ELECTRICAL ENGINEERING': 'EE',
+    'MECH': 'ME', 'MECHANICAL': 'ME', 'MECHANICAL ENGINEERING': 'ME',
+    'CIVIL': 'CE', 'CIVIL ENGINEERING': 'CE',
+    'AI&DS': 'AIDS', 'AI & DATA SCIENCE': 'AIDS', 'AI-DS': 'AIDS',
+    'AI&ML': 'AIML', 'AI & MACHINE LEARNING': 'AIML', 'AI-ML': 'AIML',
+}
+
+def canonical_department(value):
+    """
+    Department code (TeacherProfile.DEPARTMENT_CHOICES) for a free-text
+    department: 'cse', 'CSE-A', 'Dept. of CSE' and 'Computer Science' all
+    give 'CSE'. Unrecognised values are returned trimmed and upper-cased.
+    """
+    name = ' '.join((value or '').split()).upper()
+    if name in DEPARTMENT_CODES:
+        return name
+    if name in DEPARTMENT_ALIASES:
+        return DEPARTMENT_ALIASES[name]
+    tokens = set(''.join(c if c.isalnum() else ' ' for c in name).split())
+    matches = {DEPARTMENT_ALIASES.get(token, token) for token in tokens} & set(DEPARTMENT_CODES)
+    return matches.pop() if len(matches) == 1 else name
+
 class Student(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True)
     name = models.CharField(max_length=100)
@@ -17,6 +49,22 @@ class Student(models.Model):
     is_registered = models.BooleanField(default=False)
     profile_pic = models.ImageField(upload_to='profile_pics/', null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # canonical_department() and normalize_key() of year/section, kept in sync by save(); filter on these
+    department_key = models.CharField(max_length=100, blank=True, default='', editable=False)
+    year_key = models.CharField(max_length=10, blank=True, default='', editable=False)
+    section_key = models.CharField(max_length=10, blank=True, default='', editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['year_key', 'section_key', 'department_key'], name='student_cohort_idx'),
+            models.Index(fields=['department_key', 'year_key'], name='student_dept_year_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.department_key = canonical_department(self.department)
+        self.year_key = normalize_key(self.year)
+        self.section_key = normalize_key(self.section)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.roll_number} - {self.name}"
@@ -39,19 +87,112 @@ class TimeTable(models.Model):
     def __str__(self):
         return f"{self.get_day_display()} {self.start_time}-{self.end_time}: {self.subject}"
 
+class ClassSession(models.Model):
+    """
+    One lecture: a subject taught to a cohort (year + section) in one slot on
+    one date. Scheduled lectures start at their TeacherSubject/TimeTable slot;
+    unscheduled ones at the time they were first marked. Attendance records
+    point at their session, so "already marked?" is an indexed lookup.
+    """
+    subject = models.CharField(max_length=100)
+    subject_key = models.CharField(max_length=100)
+    year = models.CharField(max_length=10, blank=True, default='')
+    section = models.CharField(max_length=10, blank=True, default='')
+    # normalize_key() of year/section, kept in sync by save(); sessions are looked up on these
+    year_key = models.CharField(max_length=10, blank=True, default='', editable=False)
+    section_key = models.CharField(max_length=10, blank=True, default='', editable=False)
+    date = models.DateField()
+    start_time = models.TimeField()
+    end_time = models.TimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-date', '-start_time']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['subject_key', 'year_key', 'section_key', 'date', 'start_time'],
+                name='unique_class_session',
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.subject_key = normalize_key(self.subject)
+        self.year_key = normalize_key(self.year)
+        self.section_key = normalize_key(self.section)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.subject} ({self.year} {self.section}) {self.date} {self.start_time}"
+
 class AttendanceRecord(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
+    session = models.ForeignKey(ClassSession, on_delete=models.SET_NULL, null=True, blank=True, related_name='records')
     date = models.DateField(default=datetime.date.today)
     time = models.TimeField(default=datetime.datetime.now)
     status = models.CharField(max_length=20, default='Present')
     subject = models.CharField(max_length=100, null=True, blank=True)
+    # normalize_key(subject); set by save(), bulk_create callers pass it explicitly
+    subject_key = models.CharField(max_length=100, blank=True, default='', editable=False)
 
     class Meta:
         ordering = ['-date', '-time']
+        indexes = [
+            models.Index(fields=['student', 'date', 'subject_key'], name='attendance_student_date_subj'),
+            models.Index(fields=['subject_key', 'date'], name='attendance_subject_date'),
+            models.Index(fields=['date', 'time'], name='attendance_date_time'),
+            models.Index(fields=['student', 'date', 'time'], name='attendance_student_date_time'),
+        ]
+        constraints = [
+            # One record per student per lecture; records without a session (no subject) are unconstrained
+            models.UniqueConstraint(fields=['session', 'student'], name='unique_session_student'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.subject_key = normalize_key(self.subject)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.student.name} - {self.date} {self.time} ({self.subject})"
 
+class AttendanceSummary(models.Model):
+    """Present/absent/total records of one student in one subject (core.attendance_summary keeps it current)."""
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='attendance_summaries')
+    subject = models.CharField(max_length=100, blank=True, default='')
+    subject_key = models.CharField(max_length=100, blank=True, default='')
+    present = models.PositiveIntegerField(default=0)
+    absent = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['subject']
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'subject_key'], name='unique_student_subject_summary'),
+        ]
+
+    def __str__(self):
+        return f"{self.student_id} {self.subject or 'General'}: {self.present}/{self.total}"
+
+class CohortAttendanceSummary(models.Model):
+    """Distinct lectures (date, time) held for one cohort (department/year/section keys) in one subject."""
+    department_key = models.CharField(max_length=100, blank=True, default='')
+    year_key = models.CharField(max_length=10, blank=True, default='')
+    section_key = models.CharField(max_length=10, blank=True, default='')
+    subject_key = models.CharField(max_length=100, blank=True, default='')
+    lectures = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['year_key', 'section_key', 'department_key', 'subject_key'],
+                name='unique_cohort_subject_summary',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.department_key} {self.year_key}-{self.section_key} {self.subject_key}: {self.lectures}"
+
 class Teacher(User):
     class Meta:
         proxy = True
@@ -116,6 +257,22 @@ class TeacherSubject(models.Model):
     day = models.IntegerField(choices=DAYS_OF_WEEK, default=0)
     start_time = models.TimeField(null=True, blank=True)
     end_time = models.TimeField(null=True, blank=True)
+    # normalize_key() of subject/year/section, kept in sync by save()
+    subject_key = models.CharField(max_length=100, blank=True, default='', editable=False)
+    year_key = models.CharField(max_length=10, blank=True, default='', editable=False)
+    section_key = models.CharField(max_length=10, blank=True, default='', editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['teacher', 'day'], name='teachersubject_teacher_day'),
+            models.Index(fields=['subject_key', 'year_key', 'section_key'], name='teachersubject_subject_class'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.subject_key = normalize_key(self.subject)
+        self.year_key = normalize_key(self.year)
+        self.section_key = normalize_key(self.section)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.teacher.username} - {self.subject} ({self.year}) - {self.get_day_display()}"
@@ -440,9 +597,22 @@ class ClassCoordinator(models.Model):
     department = models.CharField(max_length=10, choices=TeacherProfile.DEPARTMENT_CHOICES, default='CSE')
     year = models.CharField(max_length=10)
     section = models.CharField(max_length=10)
+    # canonical_department() and normalize_key() of year/section, kept in sync by save(); match students on these
+    department_key = models.CharField(max_length=100, blank=True, default='', editable=False)
+    year_key = models.CharField(max_length=10, blank=True, default='', editable=False)
+    section_key = models.CharField(max_length=10, blank=True, default='', editable=False)
 
     class Meta:
         unique_together = ('department', 'year', 'section')
+        indexes = [
+            models.Index(fields=['department_key', 'year_key'], name='coordinator_dept_year_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.department_key = canonical_department(self.department)
+        self.year_key = normalize_key(self.year)
+        self.section_key = normalize_key(self.section)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.teacher.username} - Coordinator of {self.department} {self.year}-{self.section}"
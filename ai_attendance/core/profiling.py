@@ -0,0 +1,246 @@
+"""
+Opt-in per-request profiling.
+
+Enabled with PROFILING_ENABLED (env PROFILING_ENABLED=1); otherwise the
+middleware removes itself at startup and costs nothing. For each request it
+records wall time, SQL query count and time, repeated queries and the
+slowest statements, and appends one JSON line to a rotating log. Each
+worker writes its own file (PROFILING_LOG_PATH with the pid before the
+extension, e.g. logs/profiling.1234.log) and rotates only that file, so
+workers never rename a log another one is appending to; files of workers
+gone for PROFILING_LOG_RETENTION_DAYS are deleted. Two kinds of repeats are
+reported:
+
+    duplicates -> same SQL and same params (pure waste)
+    similar    -> same SQL, different params (the N+1 loop signature)
+
+A cProfile capture (top functions by cumulative time) is added when a staff
+user sends `X-Profile: 1`, or for a random PROFILING_CPROFILE_SAMPLE_RATE
+fraction of requests. The admin page /profiling/ summarises the logs of
+all workers.
+
+For streaming responses (StreamingHttpResponse, FileResponse: the CSV /
+JSON-lines and Excel exports) the middleware returns before the body is
+produced, so wall time and SQL cover only the view up to the first byte,
+not the body or the queries issued while it streams. Such records are
+flagged `streamed`.
+"""
+import os
+import io
+import re
+import json
+import time
+import random
+import pstats
+import logging
+import glob
+import cProfile
+from collections import Counter
+from logging.handlers import RotatingFileHandler
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+_IN_LIST_RE = re.compile(r"\((?:%s,\s*)+%s\)")
+
+
+def normalize_sql(sql):
+    """Collapse IN (%s, %s, ...) so the same statement with different list sizes groups together."""
+    return _IN_LIST_RE.sub("(...)", sql)
+
+
+class QueryRecorder:
+    """connection.execute_wrapper hook collecting (sql, params, seconds)."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, params, time.perf_counter() - start))
+
+
+def build_record(request, response, wall, queries, profiler=None, top_n=5):
+    match = getattr(request, 'resolver_match', None)
+    exact = Counter((sql, repr(params)) for sql, params, _ in queries)
+    similar = Counter(normalize_sql(sql) for sql, _, _ in queries)
+    slowest = sorted(queries, key=lambda q: q[2], reverse=True)[:top_n]
+
+    record = {
+        'ts': time.time(),
+        'pid': os.getpid(),
+        'method': request.method,
+        'path': request.path,
+        'view': match.view_name if match else request.path,
+        'status': getattr(response, 'status_code', None),
+        # Body (and its queries) produced after the view returned: not measured
+        'streamed': bool(getattr(response, 'streaming', False)),
+        'wall_ms': round(wall * 1000, 2),
+        'sql_count': len(queries),
+        'sql_ms': round(sum(q[2] for q in queries) * 1000, 2),
+        'duplicates': [
+            {'sql': sql, 'count': count}
+            for (sql, _), count in exact.most_common(top_n) if count > 1
+        ],
+        'similar': [{'sql': sql, 'count': count} for sql, count in similar.most_common(top_n) if count > 1],
+        'slowest': [{'sql': sql, 'ms': round(seconds * 1000, 2)} for sql, _, seconds in slowest],
+        'profile': None,
+    }
+    if profiler is not None:
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(
+            getattr(settings, 'PROFILING_CPROFILE_TOP', 30))
+        record['profile'] = out.getvalue()
+    return record
+
+
+_logger = None
+_logger_pid = None
+
+
+def _worker_log_path(pid=None):
+    root, ext = os.path.splitext(str(settings.PROFILING_LOG_PATH))
+    return f"{root}.{pid or os.getpid()}{ext}"
+
+
+def _log_files():
+    """Every worker's log and rotated backup."""
+    root, ext = os.path.splitext(str(settings.PROFILING_LOG_PATH))
+    return glob.glob(f"{glob.escape(root)}.*{ext}") + glob.glob(f"{glob.escape(root)}.*{ext}.*")
+
+
+def _prune_old_logs():
+    max_age = getattr(settings, 'PROFILING_LOG_RETENTION_DAYS', 7) * 86400
+    now = time.time()
+    for name in _log_files():
+        try:
+            if now - os.path.getmtime(name) > max_age:
+                os.remove(name)
+        except OSError:
+            pass
+
+
+def _get_logger():
+    global _logger, _logger_pid
+    if _logger is None or _logger_pid != os.getpid():  # (re)opened after a fork
+        path = _worker_log_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _prune_old_logs()
+        logger = logging.getLogger(f'core.profiling.{os.getpid()}')
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        if not logger.handlers:
+            handler = RotatingFileHandler(
+                path,
+                maxBytes=getattr(settings, 'PROFILING_LOG_MAX_BYTES', 5 * 1024 * 1024),
+                backupCount=getattr(settings, 'PROFILING_LOG_BACKUPS', 3),
+            )
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(handler)
+        _logger, _logger_pid = logger, os.getpid()
+    return _logger
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.top_n = getattr(settings, 'PROFILING_TOP_QUERIES', 5)
+        self.sample_rate = getattr(settings, 'PROFILING_CPROFILE_SAMPLE_RATE', 0.0)
+
+    def _wants_cprofile(self, request):
+        if request.META.get('HTTP_X_PROFILE') == '1':
+            user = getattr(request, 'user', None)
+            return bool(user and user.is_staff)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def __call__(self, request):
+        profiler = cProfile.Profile() if self._wants_cprofile(request) else None
+        recorder = QueryRecorder()
+
+        start = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            if profiler:
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler:
+                    profiler.disable()
+        wall = time.perf_counter() - start
+
+        try:
+            record = build_record(request, response, wall, recorder.queries, profiler, self.top_n)
+            _get_logger().info(json.dumps(record))
+            response['X-Response-Time-Ms'] = str(record['wall_ms'])
+            response['X-SQL-Queries'] = str(record['sql_count'])
+        except Exception as e:
+            print(f"Profiling error: {e}")
+        return response
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def read_log(limit=5000):
+    """Most recent `limit` records from every worker's log and backups, oldest first."""
+    records = []
+    for name in _log_files():
+        try:
+            with open(name) as f:
+                lines = f.readlines()
+        except OSError:
+            continue
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    records.sort(key=lambda r: r.get('ts', 0))
+    return records[-limit:]
+
+
+def summarize(records, slow_limit=20):
+    """Per-view aggregates plus the slowest and the cProfiled requests."""
+    by_view = {}
+    for r in records:
+        by_view.setdefault(r['view'], []).append(r)
+
+    views = []
+    for view, rows in by_view.items():
+        walls = [r['wall_ms'] for r in rows]
+        counts = [r['sql_count'] for r in rows]
+        similar = Counter()
+        for r in rows:
+            for item in r.get('similar', []):
+                similar[item['sql']] = max(similar[item['sql']], item['count'])
+        worst = similar.most_common(1)
+        views.append({
+            'view': view,
+            'requests': len(rows),
+            'wall_mean_ms': sum(walls) / len(walls),
+            'wall_p95_ms': _percentile(walls, 95),
+            'wall_max_ms': max(walls),
+            'sql_mean': sum(counts) / len(counts),
+            'sql_max': max(counts),
+            'sql_ms_mean': sum(r['sql_ms'] for r in rows) / len(rows),
+            'dup_requests': sum(1 for r in rows if r.get('duplicates')),
+            'streamed': any(r.get('streamed') for r in rows),
+            'worst_repeat': {'sql': worst[0][0], 'count': worst[0][1]} if worst else None,
+        })
+    views.sort(key=lambda v: v['sql_max'], reverse=True)
+
+    return {
+        'records': len(records),
+        'views': views,
+        'slowest': sorted(records, key=lambda r: r['wall_ms'], reverse=True)[:slow_limit],
+        'profiles': [r for r in reversed(records) if r.get('profile')][:slow_limit],
+    }
@@ -0,0 +1,75 @@
+"""
+Short-lived cache of identify_faces() results.
+
+Clients retry, double-submit and re-post identical frames (e.g. the manual
+scan button next to the auto-scan loop on the live attendance page). Results
+are keyed by a hash of the decoded frame plus the model version, so a repeat
+frame skips detection and encoding entirely, and a new model never serves
+stale predictions. Attendance marking is not cached; callers still run it.
+"""
+import time
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+from django.conf import settings
+
+
+class RecognitionCache:
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(image, model_version):
+        h = hashlib.blake2b(digest_size=16)
+        h.update(str(image.shape).encode())
+        h.update(str(image.dtype).encode())
+        h.update(image.tobytes())
+        return f"{model_version}:{h.hexdigest()}"
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            # Callers annotate predictions in place; never hand out the cached objects
+            return copy.deepcopy(entry[1])
+
+    def set(self, key, predictions):
+        if self.max_size <= 0:
+            return
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            self._entries[key] = (expires, copy.deepcopy(predictions))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl,
+            }
+
+
+recognition_cache = RecognitionCache(
+    max_size=getattr(settings, 'RECOGNITION_CACHE_SIZE', 64),
+    ttl=getattr(settings, 'RECOGNITION_CACHE_TTL', 10),
+)
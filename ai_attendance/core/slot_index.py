@@ -0,0 +1,158 @@
+"""
+In-memory index of lecture slots for attendance de-duplication.
+
+Attendance de-duplication used to query TeacherSubject (and TimeTable) with
+subject__iexact on every call, i.e. once per student being marked. The
+schedule changes a few times a term, so each worker keeps it in memory:
+
+    {(normalize_key(subject), weekday): [(window_start, window_end, slot_id, start, end), ...]}
+
+with windows in minutes since midnight (slot start - 45 min, end + 45 min),
+sorted by start so a lookup bisects straight to the candidate slots. The
+slot's own start/end times are kept because they identify its ClassSession.
+TeacherSubject slots take precedence over TimeTable slots for the same
+(subject, day), exactly like the queries they replace.
+
+post_save/post_delete on TeacherSubject and TimeTable mark the index stale
+and, on commit, bump a shared generation counter (SLOT_INDEX_GENERATION_PATH, a
+memory-mapped int64 like the model store's GENERATION), so every gunicorn
+worker rebuilds on its next lookup. Writes that bypass signals (bulk_create,
+queryset.update, raw SQL) are picked up after SLOT_INDEX_MAX_AGE seconds.
+"""
+import os
+import time
+import bisect
+import logging
+import threading
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import TeacherSubject, TimeTable, normalize_key
+
+logger = logging.getLogger(__name__)
+
+SLOT_MARGIN_MINUTES = 45
+
+
+def _minutes(t):
+    return t.hour * 60 + t.minute + t.second / 60 + t.microsecond / 60e6
+
+
+def _generation_path():
+    return str(settings.SLOT_INDEX_GENERATION_PATH)
+
+
+def _bump_generation():
+    # Updated in place (never replaced) so other workers' mappings see the new value.
+    path = _generation_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if not os.path.exists(path):
+        with open(path, 'wb') as f:
+            f.write(np.zeros(1, dtype=np.int64).tobytes())
+    counter = np.memmap(path, dtype=np.int64, mode='r+', shape=(1,))
+    counter[0] += 1
+    counter.flush()
+    del counter
+
+
+class SlotIndex:
+    def __init__(self, max_age):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._teacher_slots = None
+        self._timetable_slots = None
+        self._built_at = 0.0
+        self._generation = None
+        self._generation_map = None
+        self.builds = 0
+
+    def _read_generation(self):
+        if self._generation_map is None:
+            path = _generation_path()
+            if not os.path.exists(path):
+                return None
+            self._generation_map = np.memmap(path, dtype=np.int64, mode='r', shape=(1,))
+        return int(self._generation_map[0])
+
+    @staticmethod
+    def _group(rows):
+        slots = {}
+        for slot_id, subject, day, start, end in rows:
+            # Keys exist even for slots without times: presence alone decides TeacherSubject vs TimeTable
+            entries = slots.setdefault((normalize_key(subject), day), [])
+            if start and end:
+                entries.append((_minutes(start) - SLOT_MARGIN_MINUTES, _minutes(end) + SLOT_MARGIN_MINUTES,
+                                slot_id, start, end))
+        for entries in slots.values():
+            entries.sort()
+        return slots
+
+    def _build(self, generation):
+        fields = ('id', 'subject', 'day', 'start_time', 'end_time')
+        self._teacher_slots = self._group(TeacherSubject.objects.values_list(*fields))
+        self._timetable_slots = self._group(TimeTable.objects.values_list(*fields))
+        self._generation = generation
+        self._built_at = time.monotonic()
+        self.builds += 1
+
+    def _slots(self):
+        generation = self._read_generation()
+        if (self._teacher_slots is None or generation != self._generation
+                or time.monotonic() - self._built_at > self.max_age):
+            with self._lock:
+                if (self._teacher_slots is None or generation != self._generation
+                        or time.monotonic() - self._built_at > self.max_age):
+                    self._build(generation)
+        return self._teacher_slots, self._timetable_slots
+
+    def invalidate_local(self):
+        """Rebuild on this worker's next lookup."""
+        with self._lock:
+            self._teacher_slots = None
+
+    def invalidate(self):
+        """Rebuild on every worker's next lookup."""
+        self.invalidate_local()
+        try:
+            _bump_generation()
+        except OSError as e:
+            logger.error("Slot index: could not bump generation (%s)", e)
+
+    def slot_times(self, subject, date, ref_time):
+        """(start_time, end_time) of the slot whose window covers ref_time on `date`, or None."""
+        teacher_slots, timetable_slots = self._slots()
+        key = (normalize_key(subject), date.weekday())
+        entries = teacher_slots[key] if key in teacher_slots else timetable_slots.get(key, ())
+        minute = _minutes(ref_time)
+        # Candidates start at or before `minute`; of those still open, the lowest id wins
+        # (the order the per-call query used to return them in).
+        end = bisect.bisect_right(entries, (minute, float('inf'), float('inf')))
+        best = None
+        for entry in entries[:end]:
+            if entry[1] >= minute and (best is None or entry[2] < best[2]):
+                best = entry
+        return best[3:] if best else None
+
+    def stats(self):
+        return {
+            'builds': self.builds,
+            'generation': self._generation,
+            'teacher_slots': sum(len(v) for v in (self._teacher_slots or {}).values()),
+            'timetable_slots': sum(len(v) for v in (self._timetable_slots or {}).values()),
+        }
+
+
+slot_index = SlotIndex(max_age=getattr(settings, 'SLOT_INDEX_MAX_AGE', 300))
+
+
+@receiver(post_save, sender=TeacherSubject)
+@receiver(post_delete, sender=TeacherSubject)
+@receiver(post_save, sender=TimeTable)
+@receiver(post_delete, sender=TimeTable)
+def _schedule_changed(sender, **kwargs):
+    # This worker sees the change immediately (same connection); the others
+    # only once it is committed, or they could rebuild from the old rows.
+    slot_index.invalidate_local()
+    transaction.on_commit(slot_index.invalidate)
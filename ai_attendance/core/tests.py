@@ -0,0 +1,1052 @@
+"""
+Query-count regression tests for the views, plus behaviour tests.
+
+Every view is requested against a generated institution (departments, years,
+sections, weeks of attendance, timetables, store traffic) and again after
+`grow()` has doubled the roster of each class, the attendance history and
+the store requests. The second request must issue exactly as many SQL
+queries as the first (assertNumQueries) and stay under a fixed ceiling. An
+N+1 loop that creeps back into a view fails here instead of in production;
+query counts don't depend on how fast the machine running the tests is.
+
+The behaviour tests pin down what the optimized paths return, which a query
+count cannot see: marking counts, export pagination, coordinator lookups and
+attendance summaries, the training coordinator's debounce, model store
+publish/rollback, recognition cache invalidation, the data migrations'
+backfills, and evaluate_model's vectorised metrics against plain loops.
+
+    python manage.py test core.tests
+"""
+import base64
+import csv
+import datetime
+import importlib.util
+import io
+import itertools
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from .models import (
+    Student, AttendanceRecord, AttendanceSummary, CohortAttendanceSummary, ClassSession, TimeTable, TeacherSubject, TeacherProfile,
+    StoreStaff, StoreRequest, StoreRequestItem, ClassCoordinator, StudentApplication,
+    normalize_key, canonical_department,
+)
+from . import model_store
+from .slot_index import slot_index
+from .recognition_cache import RecognitionCache
+from .training import TrainingCoordinator, get_training_status, _mark_pending
+from .views import coordinator_students, find_class_coordinator
+from .attendance_summary import apply_changes, rebuild_summaries, summary_row
+
+DEPARTMENTS = ['CSE', 'IT', 'ECE', 'ME']
+YEARS = ['1', '2', '3']
+SECTIONS = ['A', 'B']
+# (subject, lecture start hour); one lecture of each per weekday
+SUBJECTS = [('Mathematics', 9), ('Physics', 10), ('Programming', 11)]
+STUDENTS_PER_CLASS = 6
+HISTORY_DAYS = 28
+STORE_REQUESTS_PER_TEACHER = 8
+
+# The teacher's class used by the marking, coordinator and export views
+CLASS_DEPT, CLASS_YEAR, CLASS_SECTION = 'CSE', '2', 'A'
+CLASS_SUBJECT, CLASS_HOUR = 'Programming', 11
+
+MAX_QUERIES = 30
+
+
+def _weekdays(first, last):
+    """Weekdays in [today - first, today - last), newest last."""
+    today = datetime.date.today()
+    days = [today - datetime.timedelta(days=n) for n in range(first - 1, last - 1, -1)]
+    return [d for d in days if d.weekday() < 5]
+
+
+class InstitutionTestCase(TestCase):
+    """Builds the institution once per class; `grow()` runs inside each test's transaction."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+
+        cls.teacher = User.objects.create_user('teacher', password='pass', is_staff=True,
+                                               first_name='Tara', last_name='Kapoor')
+        TeacherProfile.objects.create(user=cls.teacher, designation='hod', department=CLASS_DEPT)
+        cls.colleagues = []
+        for i in range(3):
+            colleague = User.objects.create_user(f'colleague{i}', password='pass', is_staff=True)
+            TeacherProfile.objects.create(user=colleague, department=CLASS_DEPT)
+            cls.colleagues.append(colleague)
+
+        start = datetime.time(CLASS_HOUR)
+        end = datetime.time(CLASS_HOUR + 1)
+        TimeTable.objects.bulk_create([
+            TimeTable(day=day, start_time=datetime.time(hour), end_time=datetime.time(hour + 1), subject=subject)
+            for day in range(7) for subject, hour in SUBJECTS
+        ])
+        TeacherSubject.objects.bulk_create([
+            TeacherSubject(teacher=cls.teacher, subject=CLASS_SUBJECT, year=CLASS_YEAR, section=section,
+                           day=day, start_time=start, end_time=end, subject_key=normalize_key(CLASS_SUBJECT),
+                           year_key=CLASS_YEAR, section_key=normalize_key(section))
+            for day in range(7) for section in SECTIONS
+        ] + [
+            TeacherSubject(teacher=cls.colleagues[i % len(cls.colleagues)], subject=subject, year=year,
+                           section=section, day=day, start_time=datetime.time(hour),
+                           end_time=datetime.time(hour + 1), subject_key=normalize_key(subject),
+                           year_key=year, section_key=normalize_key(section))
+            for i, (subject, hour) in enumerate(SUBJECTS[:2])
+            for year in YEARS for section in SECTIONS for day in range(5)
+        ])
+        cls.coordinator = ClassCoordinator.objects.create(
+            teacher=cls.teacher, department=CLASS_DEPT, year=CLASS_YEAR, section=CLASS_SECTION)
+
+        store_head_user = User.objects.create_user('storehead', password='pass')
+        cls.store_head = StoreStaff.objects.create(user=store_head_user, role='head')
+        cls.store_staff = [
+            StoreStaff.objects.create(user=User.objects.create_user(f'storestaff{i}', password='pass'), role='staff')
+            for i in range(2)
+        ]
+
+        students = cls.add_students()
+        cls.add_attendance(students, _weekdays(HISTORY_DAYS, 0))
+        cls.add_store_requests()
+
+        cls.student_user = User.objects.create_user('student', password='pass')
+        cls.student = Student.objects.filter(
+            department=CLASS_DEPT, year=CLASS_YEAR, section=CLASS_SECTION).order_by('roll_number').first()
+        cls.student.user = cls.student_user
+        cls.student.save()
+        cls.add_applications()
+        # The schedule above was bulk-created (no signals); don't reuse another class's slots
+        slot_index.invalidate_local()
+
+    # -- generators -----------------------------------------------------------
+
+    @classmethod
+    def add_students(cls):
+        """STUDENTS_PER_CLASS new students in every department/year/section."""
+        offset = Student.objects.count()
+        new = []
+        for dept in DEPARTMENTS:
+            for year in YEARS:
+                for section in SECTIONS:
+                    for _ in range(STUDENTS_PER_CLASS):
+                        n = offset + len(new) + 1
+                        new.append(Student(
+                            name=f'Student {n}',
+                            roll_number=f'{dept}{year}{section}{n:05d}',
+                            department=dept, year=year, section=section,
+                            department_key=canonical_department(dept), year_key=year, section_key=normalize_key(section),
+                        ))
+        Student.objects.bulk_create(new)
+        return list(Student.objects.filter(roll_number__in=[s.roll_number for s in new]))
+
+    @classmethod
+    def add_attendance(cls, students, days):
+        """One record per student, weekday and subject, ~80% present, each linked to its lecture's session."""
+        rng = random.Random(len(students) * 1000 + len(days))
+        cohorts = {(student.year, student.section) for student in students}
+        ClassSession.objects.bulk_create([
+            ClassSession(subject=subject, subject_key=normalize_key(subject), year=year, section=section,
+                         year_key=normalize_key(year), section_key=normalize_key(section),
+                         date=day, start_time=datetime.time(hour), end_time=datetime.time(hour + 1))
+            for day in days for subject, hour in SUBJECTS for year, section in cohorts
+        ], batch_size=2000, ignore_conflicts=True)
+        sessions = {
+            (s.subject, s.year, s.section, s.date): s
+            for s in ClassSession.objects.filter(date__in=days)
+        }
+        records = AttendanceRecord.objects.bulk_create([
+            AttendanceRecord(
+                student=student, date=day, time=datetime.time(hour), subject=subject, subject_key=normalize_key(subject),
+                session=sessions[(subject, student.year, student.section, day)],
+                status='Present' if rng.random() < 0.8 else 'Absent',
+            )
+            for day in days for subject, hour in SUBJECTS for student in students
+        ], batch_size=2000)
+        apply_changes(added=[summary_row(record, record.student) for record in records])
+
+    @classmethod
+    def add_store_requests(cls):
+        """Requests from every CSE teacher cycling through all workflow states, three items each."""
+        statuses = [status for status, _ in StoreRequest.STATUS_CHOICES]
+        requests = []
+        for teacher in [cls.teacher] + cls.colleagues:
+            for i in range(STORE_REQUESTS_PER_TEACHER):
+                status = statuses[i % len(statuses)]
+                staff = cls.store_staff[i % len(cls.store_staff)]
+                past_hod = status not in ('pending_hod', 'hod_rejected')
+                requests.append(StoreRequest(
+                    requested_by=teacher, title=f'Lab supplies {i}', status=status,
+                    hod_approved_by=cls.teacher if past_hod else None,
+                    assigned_to=staff if status in ('assigned', 'delivered', 'partial', 'fulfilled') else None,
+                    fulfilled_by=staff if status in ('partial', 'fulfilled') else None,
+                ))
+        created = StoreRequest.objects.bulk_create(requests)
+        if not all(r.pk for r in created):
+            created = list(StoreRequest.objects.order_by('-id')[:len(requests)])
+        StoreRequestItem.objects.bulk_create([
+            StoreRequestItem(request=req, item_name=f'Item {n}', quantity_requested=n + 1)
+            for req in created for n in range(3)
+        ])
+
+    @classmethod
+    def add_applications(cls):
+        StudentApplication.objects.bulk_create([
+            StudentApplication(student=student, title='Leave', description='Medical leave')
+            for student in Student.objects.filter(
+                department=CLASS_DEPT, year=CLASS_YEAR, section=CLASS_SECTION)
+        ])
+
+    def grow(self):
+        """Double every class, the attendance history, store requests and applications."""
+        cls = type(self)
+        old_students = list(Student.objects.all())
+        new_students = cls.add_students()
+        cls.add_attendance(old_students, _weekdays(2 * HISTORY_DAYS, HISTORY_DAYS))
+        cls.add_attendance(new_students, _weekdays(2 * HISTORY_DAYS, 0))
+        cls.add_store_requests()
+        StudentApplication.objects.bulk_create([
+            StudentApplication(student=student, title='Leave', description='Medical leave')
+            for student in new_students
+            if (student.department, student.year, student.section) == (CLASS_DEPT, CLASS_YEAR, CLASS_SECTION)
+        ])
+
+    # -- assertion -------------------------------------------------------------
+
+    def request(self, url, method, data, expected_status):
+        """One request, with its writes rolled back."""
+        payload = data() if callable(data) else data
+        with transaction.atomic():
+            if method == 'post' and isinstance(payload, str):
+                response = self.client.post(url, payload, content_type='application/json')
+            else:
+                response = getattr(self.client, method)(url, payload or {})
+            if hasattr(response, 'streaming_content'):
+                b''.join(response.streaming_content)
+            transaction.set_rollback(True)
+        self.assertEqual(response.status_code, expected_status, f"{method.upper()} {url}")
+
+    def assertScales(self, user, url, method='get', data=None, max_queries=MAX_QUERIES, expected_status=200):
+        if user is not None:
+            self.client.force_login(user)
+        self.request(url, method, data, expected_status)  # warm-up: lazy imports, caches
+        with CaptureQueriesContext(connection) as queries:
+            self.request(url, method, data, expected_status)
+        self.assertLessEqual(len(queries), max_queries, f"{url}: {len(queries)} queries")
+
+        self.grow()
+        with self.assertNumQueries(len(queries)):
+            self.request(url, method, data, expected_status)
+
+
+class DashboardQueryTests(InstitutionTestCase):
+
+    def test_home_anonymous(self):
+        self.assertScales(None, '/core/')
+
+    def test_admin_dashboard(self):
+        self.assertScales(self.admin, '/core/admin_dashboard/')
+
+    def test_teacher_dashboard(self):
+        self.assertScales(self.teacher, '/core/teacher_dashboard/')
+
+    def test_teacher_portal_dashboard(self):
+        self.assertScales(self.teacher, '/teacher/')
+
+    def test_student_dashboard(self):
+        self.assertScales(self.student_user, '/student/')
+
+    def test_take_attendance_selector(self):
+        self.assertScales(self.teacher, '/core/take_attendance_selector/')
+
+    def test_manage_teacher_subjects(self):
+        self.assertScales(self.admin, '/core/manage_teacher_subjects/')
+
+    def test_manage_students_class(self):
+        self.assertScales(self.teacher, '/core/manage_students/', data={
+            'branch': CLASS_DEPT, 'year': CLASS_YEAR, 'section': CLASS_SECTION})
+
+    def test_manage_students_all(self):
+        self.assertScales(self.admin, '/core/manage_students/')
+
+    def test_attendance_list(self):
+        self.assertScales(self.admin, '/core/attendance_list/')
+
+    def test_attendance_list_filtered(self):
+        self.assertScales(self.admin, '/core/attendance_list/', data={
+            'branch': CLASS_DEPT, 'year': CLASS_YEAR, 'section': CLASS_SECTION, 'subject': CLASS_SUBJECT})
+
+    def test_student_attendance(self):
+        self.assertScales(self.admin, f'/core/student/{self.student.id}/')
+
+    def test_coordinator_dashboard(self):
+        self.assertScales(self.teacher, '/core/coordinator/dashboard/')
+
+    def test_student_applications(self):
+        self.assertScales(self.student_user, '/core/student/applications/')
+
+    def test_metrics(self):
+        self.assertScales(self.admin, '/core/metrics/')
+
+
+class ExportQueryTests(InstitutionTestCase):
+
+    def test_download_attendance(self):
+        self.assertScales(self.teacher, '/core/download_attendance/', data={
+            'branch': CLASS_DEPT, 'year': CLASS_YEAR, 'section': CLASS_SECTION})
+
+    def test_export_coordinator_attendance_excel(self):
+        self.assertScales(self.teacher, f'/core/coordinator/export/excel/{self.coordinator.id}/')
+
+    def test_export_attendance_api_page(self):
+        self.assertScales(self.admin, '/core/api/attendance/export/', data={'format': 'jsonl', 'limit': 1000})
+
+    def test_export_attendance_api_class(self):
+        self.assertScales(self.teacher, '/core/api/attendance/export/', data={
+            'branch': CLASS_DEPT, 'year': CLASS_YEAR, 'section': CLASS_SECTION})
+
+
+@override_settings(ATTENDANCE_EXPORT_PAGE_SIZE=30)
+class ExportPaginationTests(InstitutionTestCase):
+    """
+    What the export API returns. Every lecture's records share one (date, time),
+    and a page size that doesn't divide a lecture puts page breaks inside them.
+    """
+
+    def pull(self, user, params):
+        self.client.force_login(user)
+        response = self.client.get('/core/api/attendance/export/', params)
+        self.assertEqual(response.status_code, 200)
+        text = b''.join(response.streaming_content).decode()
+        if params.get('format') == 'jsonl':
+            return [json.loads(line) for line in text.splitlines()]
+        return list(csv.DictReader(io.StringIO(text)))
+
+    def test_resumed_pull_matches_full_export(self):
+        days = _weekdays(HISTORY_DAYS, 0)[-4:-1]
+        params = {'format': 'jsonl', 'from': days[0].isoformat(), 'to': days[-1].isoformat()}
+        expected = list(
+            AttendanceRecord.objects.filter(date__range=(days[0], days[-1]))
+            .order_by('date', 'time', 'id').values_list('id', flat=True)
+        )
+
+        full = self.pull(self.admin, params)
+        self.assertEqual([row['id'] for row in full], expected)
+
+        pulled = []
+        cursor = None
+        while True:
+            page = self.pull(self.admin, dict(params, limit=100, **({'cursor': cursor} if cursor else {})))
+            self.assertLessEqual(len(page), 100)
+            if not page:
+                break
+            pulled.extend(page)
+            cursor = page[-1]['cursor']
+        self.assertEqual([row['id'] for row in pulled], expected)
+        self.assertEqual(pulled, full)
+
+    def test_filters_apply(self):
+        day = _weekdays(HISTORY_DAYS, 0)[-2]
+        rows = self.pull(self.admin, {
+            'from': day.isoformat(), 'to': day.isoformat(), 'branch': CLASS_DEPT.lower(),
+            'year': f' {CLASS_YEAR}', 'section': CLASS_SECTION.lower(), 'subject': f' {CLASS_SUBJECT.upper()} ',
+        })
+        expected = AttendanceRecord.objects.filter(
+            date=day, student__department=CLASS_DEPT, student__year=CLASS_YEAR,
+            student__section=CLASS_SECTION, subject=CLASS_SUBJECT,
+        ).order_by('date', 'time', 'id')
+        self.assertEqual([int(row['id']) for row in rows], list(expected.values_list('id', flat=True)))
+        self.assertEqual(len(rows), STUDENTS_PER_CLASS)
+        self.assertEqual({(row['date'], row['department'], row['year'], row['section'], row['subject']) for row in rows},
+                         {(day.isoformat(), CLASS_DEPT, CLASS_YEAR, CLASS_SECTION, CLASS_SUBJECT)})
+
+    def test_teacher_gets_assigned_subjects_only(self):
+        day = _weekdays(HISTORY_DAYS, 0)[-2]
+        rows = self.pull(self.teacher, {'format': 'jsonl', 'from': day.isoformat(), 'to': day.isoformat()})
+        self.assertEqual({row['subject'] for row in rows}, {CLASS_SUBJECT})
+        self.assertEqual(len(rows), AttendanceRecord.objects.filter(date=day, subject=CLASS_SUBJECT).count())
+
+
+class CoordinatorTests(InstitutionTestCase):
+    """A coordinator's class is matched on department code and normalized year/section, however it was typed."""
+
+    def setUp(self):
+        self.coordinator.department = 'Dept. CSE'
+        self.coordinator.year = f' {CLASS_YEAR} '
+        self.coordinator.section = CLASS_SECTION.lower()
+        self.coordinator.save()
+
+    def test_find_class_coordinator(self):
+        self.assertEqual(find_class_coordinator(self.student), self.coordinator)
+
+    def test_resolve_application(self):
+        application = StudentApplication.objects.filter(student=self.student).get()
+        self.client.force_login(self.teacher)
+        self.client.post(f'/core/coordinator/application/resolve/{application.id}/', {'action': 'approve'})
+        application.refresh_from_db()
+        self.assertEqual(application.status, 'Approved')
+
+    def exported_rolls(self):
+        import openpyxl
+        self.client.force_login(self.teacher)
+        response = self.client.get(f'/core/coordinator/export/excel/{self.coordinator.id}/')
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        sheet = openpyxl.load_workbook(io.BytesIO(content)).active
+        rolls = set(Student.objects.values_list('roll_number', flat=True))
+        return [row[1] for row in sheet.iter_rows(values_only=True) if len(row) > 1 and row[1] in rolls]
+
+    def test_excel_export_students(self):
+        self.assertEqual(self.exported_rolls(), list(
+            Student.objects.filter(department=CLASS_DEPT, year=CLASS_YEAR, section=CLASS_SECTION)
+            .order_by('roll_number').values_list('roll_number', flat=True)))
+
+    def test_excel_export_section_only(self):
+        # Unlike coordinator_students(), the export never falls back to the whole department and year
+        self.coordinator.section = 'C'
+        self.coordinator.save()
+        self.assertEqual(self.exported_rolls(), [])
+
+    def test_coordinator_students(self):
+        self.assertEqual(
+            list(coordinator_students(self.coordinator)),
+            list(Student.objects.filter(department=CLASS_DEPT, year=CLASS_YEAR, section=CLASS_SECTION)
+                 .order_by('roll_number')),
+        )
+
+
+class MarkingTestCase(InstitutionTestCase):
+    """Uploads go to a temporary MEDIA_ROOT; recognition is mocked with `recognize()`."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.class_query = f'subject={CLASS_SUBJECT}&year={CLASS_YEAR}&section={CLASS_SECTION}'
+
+    def recognize(self, students):
+        """Every frame "recognizes" `students` plus a stranger."""
+        predictions = [
+            {'name': s.name, 'roll_number': s.roll_number, 'location': (10, 60, 60, 10)} for s in students
+        ] + [{'name': 'Unknown', 'roll_number': None, 'location': (10, 160, 60, 110)}]
+        patcher = mock.patch('core.views.identify_faces',
+                             side_effect=lambda *a, **kw: [dict(p) for p in predictions])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def class_students(self):
+        return Student.objects.filter(
+            department=CLASS_DEPT, year=CLASS_YEAR, section=CLASS_SECTION).order_by('roll_number')
+
+
+class AttendanceMarkingQueryTests(MarkingTestCase):
+    """Each frame "recognizes" the same five students of the class."""
+
+    def setUp(self):
+        super().setUp()
+        self.recognize(self.class_students()[:5])
+
+    def test_upload_attendance(self):
+        def upload():
+            return {'class_image': SimpleUploadedFile('class.jpg', b'\xff\xd8\xff\xd9', content_type='image/jpeg')}
+        self.assertScales(self.teacher, f'/core/upload_attendance/?{self.class_query}', method='post', data=upload)
+
+    def test_process_live_frame(self):
+        import cv2
+        import numpy as np
+        ok, jpeg = cv2.imencode('.jpg', np.zeros((48, 64, 3), np.uint8))
+        frame = json.dumps({
+            'image': 'data:image/jpeg;base64,' + base64.b64encode(jpeg.tobytes()).decode(),
+            'subject': CLASS_SUBJECT, 'year': CLASS_YEAR, 'section': CLASS_SECTION,
+            'start_time': f'{CLASS_HOUR:02d}:00',
+        })
+        self.assertScales(self.teacher, '/core/process_live_frame/', method='post', data=frame)
+
+    def test_manual_attendance_form(self):
+        self.assertScales(self.teacher, f'/core/manual_attendance/?{self.class_query}'
+                          f'&start_time={CLASS_HOUR:02d}:00')
+
+    def test_manual_attendance_submit(self):
+        def submit():
+            present = Student.objects.filter(
+                department=CLASS_DEPT, year=CLASS_YEAR, section=CLASS_SECTION).values_list('id', flat=True)
+            return {'date': datetime.date.today().isoformat(), 'time': f'{CLASS_HOUR:02d}:00',
+                    'student_ids': [str(pk) for pk in present][::2]}
+        self.assertScales(self.teacher, f'/core/manual_attendance/?{self.class_query}', method='post',
+                          data=submit, expected_status=302)
+
+
+class UploadAttendanceTests(MarkingTestCase):
+    """What an upload records and reports, beyond its query count."""
+
+    def setUp(self):
+        super().setUp()
+        # The generated history may include today's lecture; start from an unmarked one
+        today = {'date': datetime.date.today(), 'subject_key': normalize_key(CLASS_SUBJECT)}
+        AttendanceRecord.objects.filter(**today).delete()
+        ClassSession.objects.filter(**today).delete()
+
+    def upload(self):
+        self.client.force_login(self.teacher)
+        image = SimpleUploadedFile('class.jpg', b'\xff\xd8\xff\xd9', content_type='image/jpeg')
+        response = self.client.post(f'/core/upload_attendance/?{self.class_query}', {'class_image': image})
+        self.assertEqual(response.status_code, 200)
+        return [str(m) for m in get_messages(response.wsgi_request)], response.context['predictions']
+
+    def test_other_class_student_opens_no_session(self):
+        other = Student.objects.exclude(year=CLASS_YEAR).order_by('roll_number').first()
+        self.recognize(list(self.class_students()[:2]) + [other])
+        sessions = ClassSession.objects.filter(date=datetime.date.today(), subject_key=normalize_key(CLASS_SUBJECT))
+        other_before = sessions.filter(year=other.year).count()
+        _, predictions = self.upload()
+        statuses = {p['roll_number']: p['status'] for p in predictions}
+        self.assertEqual(statuses[other.roll_number], f"Wrong Year ({other.year})")
+        self.assertEqual(sessions.filter(year=other.year).count(), other_before)
+
+    def test_counts_only_inserted_records(self):
+        # Section "A" is not a department code, so the roster is year + section across departments
+        students = list(Student.objects.filter(year=CLASS_YEAR, section=CLASS_SECTION).order_by('roll_number'))
+        self.recognize(students[:2])
+        last_id = AttendanceRecord.objects.latest('id').id
+        first, _ = self.upload()
+        self.assertEqual(first, [f"Present: 2, Absent: {len(students) - 2}, Unknown: 1"])
+
+        # A second upload that missed the first one's records (as a concurrent upload would):
+        # every insert is dropped by unique_session_student, nothing is reported as marked,
+        # and a student it recognizes whom the first upload marked absent becomes present.
+        self.recognize(students[1:3])
+        with mock.patch('core.views.get_session_records', return_value={}):
+            second, predictions = self.upload()
+        self.assertEqual(second, ["Present: 1, Absent: 0, Unknown: 1"])
+        statuses = {p['roll_number']: p['status'] for p in predictions}
+        self.assertEqual(statuses[students[1].roll_number], f"Already Marked Present ({CLASS_SUBJECT})")
+        self.assertEqual(statuses[students[2].roll_number], f"Marked Present (Was Absent) - ({CLASS_SUBJECT})")
+        records = AttendanceRecord.objects.filter(id__gt=last_id)
+        self.assertEqual(records.count(), len(students))
+        self.assertEqual(records.filter(status='Present').count(), 3)
+
+    def test_section_spelling_shares_session(self):
+        students = list(Student.objects.filter(year=CLASS_YEAR, section=CLASS_SECTION).order_by('roll_number'))
+        self.recognize(students[:1])
+        self.upload()
+        # The same lecture asked for as section " a": same session, same records
+        self.class_query = self.class_query.replace(f'section={CLASS_SECTION}', f'section=+{CLASS_SECTION.lower()}')
+        self.recognize(students[:2])
+        messages, predictions = self.upload()
+        self.assertEqual(messages, ["Present: 1, Absent: 0, Unknown: 1"])
+        statuses = {p['roll_number']: p['status'] for p in predictions}
+        self.assertEqual(statuses[students[0].roll_number], f"Already Marked Present ({CLASS_SUBJECT})")
+        self.assertEqual(statuses[students[1].roll_number], f"Marked Present (Was Absent) - ({CLASS_SUBJECT})")
+        sessions = ClassSession.objects.filter(date=datetime.date.today(), subject_key=normalize_key(CLASS_SUBJECT))
+        self.assertEqual(sessions.filter(year_key=normalize_key(CLASS_YEAR)).count(), 1)
+
+
+class AttendanceSummaryTests(MarkingTestCase):
+    """The incrementally maintained summaries equal a full rebuild after every kind of write."""
+
+    def snapshot(self):
+        return (
+            set(AttendanceSummary.objects.values_list('student_id', 'subject_key', 'present', 'absent', 'total')),
+            set(CohortAttendanceSummary.objects.values_list(
+                'year_key', 'section_key', 'department_key', 'subject_key', 'lectures')),
+        )
+
+    def assertSummariesCurrent(self):
+        maintained = self.snapshot()
+        rebuild_summaries()
+        self.assertEqual(maintained, self.snapshot())
+
+    def lectures(self, student, subject_key):
+        return CohortAttendanceSummary.objects.get(
+            year_key=student.year_key, section_key=student.section_key,
+            department_key=student.department_key, subject_key=subject_key).lectures
+
+    def test_fixture(self):
+        self.assertSummariesCurrent()
+
+    def test_single_saves_and_deletes(self):
+        student, classmate = self.class_students()[:2]
+        key = normalize_key(CLASS_SUBJECT)
+        lectures = self.lectures(student, key)
+        extra = datetime.time(CLASS_HOUR + 5)
+
+        record = AttendanceRecord.objects.create(student=student, subject=CLASS_SUBJECT, time=extra, status='Absent')
+        self.assertEqual(self.lectures(student, key), lectures + 1)
+        self.assertSummariesCurrent()
+        AttendanceRecord.objects.create(student=classmate, subject=CLASS_SUBJECT, time=extra)
+        self.assertEqual(self.lectures(student, key), lectures + 1)
+
+        record.status = 'Present'
+        record.save()
+        self.assertSummariesCurrent()
+        record.subject = 'Chemistry'
+        record.save()
+        self.assertSummariesCurrent()
+        record.delete()
+        self.assertSummariesCurrent()
+        AttendanceRecord.objects.filter(student=classmate, time=extra).get().delete()
+        self.assertEqual(self.lectures(student, key), lectures)
+        self.assertSummariesCurrent()
+
+    def test_upload_and_manual_attendance(self):
+        AttendanceRecord.objects.filter(date=datetime.date.today()).delete()
+        rebuild_summaries()
+        self.recognize(self.class_students()[:3])
+        self.client.force_login(self.teacher)
+        image = SimpleUploadedFile('class.jpg', b'\xff\xd8\xff\xd9', content_type='image/jpeg')
+        self.client.post(f'/core/upload_attendance/?{self.class_query}', {'class_image': image})
+        self.assertSummariesCurrent()
+
+        present = list(self.class_students().values_list('id', flat=True))[1::2]
+        self.client.post(f'/core/manual_attendance/?{self.class_query}', {
+            'date': datetime.date.today().isoformat(), 'time': f'{CLASS_HOUR:02d}:30',
+            'student_ids': [str(pk) for pk in present],
+        })
+        self.assertSummariesCurrent()
+
+    def test_live_frame_updates_once(self):
+        import cv2
+        import numpy as np
+        AttendanceRecord.objects.filter(date=datetime.date.today()).delete()
+        rebuild_summaries()
+        self.recognize(self.class_students()[:5])
+        ok, jpeg = cv2.imencode('.jpg', np.zeros((48, 64, 3), np.uint8))
+        frame = json.dumps({
+            'image': 'data:image/jpeg;base64,' + base64.b64encode(jpeg.tobytes()).decode(),
+            'subject': CLASS_SUBJECT, 'year': CLASS_YEAR, 'section': CLASS_SECTION,
+            'start_time': f'{CLASS_HOUR:02d}:00',
+        })
+        self.client.force_login(self.teacher)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/core/process_live_frame/', frame, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        summary_updates = [q['sql'] for q in queries.captured_queries
+                           if q['sql'].startswith('UPDATE "core_attendancesummary"')]
+        self.assertEqual(len(summary_updates), 1)
+        self.assertSummariesCurrent()
+
+
+class StoreQueryTests(InstitutionTestCase):
+
+    def test_admin_store_dashboard(self):
+        self.assertScales(self.admin, '/core/store_dashboard/')
+
+    def test_hod_store_requests(self):
+        self.assertScales(self.teacher, '/core/hod/store/')
+
+    def test_my_store_requests(self):
+        self.assertScales(self.teacher, '/core/store_request/mine/')
+
+    def test_store_head_dashboard(self):
+        self.assertScales(self.store_head.user, '/core/store_head/')
+
+    def test_store_staff_tasks(self):
+        self.assertScales(self.store_staff[0].user, '/core/store_staff/tasks/')
+
+    def test_teacher_store(self):
+        self.assertScales(self.teacher, '/core/store/')
+
+
+class ModelDirTestCase(SimpleTestCase):
+    """MODEL_DIR (gallery versions, training status and locks) in a temporary directory."""
+
+    def setUp(self):
+        self.model_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.model_dir, ignore_errors=True)
+        override = override_settings(MODEL_DIR=self.model_dir, MODEL_PATH=os.path.join(self.model_dir, 'model.pkl'))
+        override.enable()
+        self.addCleanup(override.disable)
+
+
+class TrainingCoordinatorTests(ModelDirTestCase):
+    DEBOUNCE = 0.2
+
+    def setUp(self):
+        super().setUp()
+        self.coordinator = TrainingCoordinator(debounce_seconds=self.DEBOUNCE)
+        self.builds = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+        patcher = mock.patch('core.utils.train_model', side_effect=self.build)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def build(self):
+        self.builds += 1
+        self.started.set()
+        self.release.wait(10)
+        return True, f'Build {self.builds}'
+
+    def wait_until_idle(self, timeout=10):
+        """The status once no build is running or scheduled."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.coordinator._lock:
+                if not self.coordinator._running and self.coordinator._timer is None:
+                    return get_training_status()
+            time.sleep(0.02)
+        self.fail("training did not finish")
+
+    def test_requests_in_window_build_once(self):
+        for reason in ('enroll', 'upload', 'delete'):
+            self.assertEqual(self.coordinator.request(reason)['state'], 'pending')
+        status = self.wait_until_idle()
+        self.assertEqual(self.builds, 1)
+        self.assertEqual((status['state'], status['message']), ('idle', 'Build 1'))
+        self.assertFalse(os.path.exists(os.path.join(self.model_dir, 'training.pending')))
+
+    def test_request_during_build_runs_again(self):
+        self.release.clear()
+        self.coordinator.request('first')
+        self.assertTrue(self.started.wait(10))
+        self.coordinator.request('second')
+        self.coordinator.request('third')
+        self.release.set()
+        status = self.wait_until_idle()
+        self.assertEqual(self.builds, 2)
+        self.assertEqual((status['state'], status['message']), ('idle', 'Build 2'))
+
+    def test_resume_builds_request_of_another_worker(self):
+        # Recorded in the shared marker by a worker recycled before its timer fired
+        _mark_pending()
+        self.coordinator.resume()
+        self.wait_until_idle()
+        self.assertEqual(self.builds, 1)
+        self.coordinator.resume()
+        self.wait_until_idle()
+        self.assertEqual(self.builds, 1)
+
+
+class ModelStoreTests(ModelDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.forget_gallery()
+        self.addCleanup(self.forget_gallery)
+
+    @staticmethod
+    def forget_gallery():
+        # Process-wide state: the cached gallery and the mapping of GENERATION
+        model_store._cached_gallery = None
+        model_store._generation_map = None
+
+    def publish(self, seed, size=20):
+        rng = np.random.default_rng(seed)
+        encodings = rng.normal(0, 0.1, (size, 128))
+        labels = np.array([f'R{seed}{i:03d}' for i in range(size)])
+        manifest = model_store.publish_gallery(encodings, labels, students={labels[0]: {'name': 'First'}})
+        return manifest['version'], encodings, labels
+
+    def test_publish_makes_version_current(self):
+        version, encodings, labels = self.publish(1)
+        gallery = model_store.get_gallery()
+        self.assertEqual(gallery.version, version)
+        self.assertEqual(gallery.threshold, settings.RECOGNITION_THRESHOLD)
+        self.assertEqual(gallery.students, {labels[0]: {'name': 'First'}})
+        np.testing.assert_array_equal(gallery.encodings, encodings)
+        nearest, distances = gallery.nearest(encodings[:5])
+        self.assertEqual(list(nearest), list(labels[:5]))
+        np.testing.assert_allclose(distances, 0, atol=1e-6)
+        self.assertIsNotNone(model_store.load_gallery(verify=True))
+
+    def test_publish_and_rollback_bump_generation(self):
+        first, _, _ = self.publish(1)
+        generation = model_store._read_generation()
+        self.assertEqual(model_store.get_gallery().version, first)
+
+        second, _, _ = self.publish(2)
+        self.assertEqual(model_store._read_generation(), generation + 1)
+        self.assertEqual(model_store.get_gallery().version, second)
+
+        self.assertEqual(model_store.rollback(), first)
+        self.assertEqual(model_store._read_generation(), generation + 2)
+        self.assertEqual(model_store.get_gallery().version, first)
+        self.assertIsNone(model_store.rollback())  # nothing older than the first version
+        self.assertIsNone(model_store.rollback('v999999'))
+        self.assertEqual(model_store.rollback(second), second)
+        self.assertEqual(model_store.get_gallery().version, second)
+
+    def test_generation_created_for_existing_version(self):
+        version, _, _ = self.publish(1)
+        # Published before the counter existed
+        os.remove(os.path.join(self.model_dir, model_store.GENERATION_FILE))
+        self.forget_gallery()
+        gallery = model_store.get_gallery()
+        self.assertEqual(gallery.version, version)
+        self.assertEqual(model_store._read_generation(), 0)
+        self.assertEqual(gallery.generation, 0)
+        with mock.patch('core.model_store.get_current_version') as current:
+            self.assertIs(model_store.get_gallery(), gallery)
+        current.assert_not_called()
+
+    @override_settings(MODEL_KEEP_VERSIONS=2)
+    def test_old_versions_pruned(self):
+        versions = [self.publish(seed)[0] for seed in range(1, 4)]
+        self.assertEqual(model_store.list_versions(), versions[1:])
+        self.assertEqual(model_store.get_current_version(), versions[-1])
+
+
+class RecognitionCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.cache = RecognitionCache(max_size=2, ttl=10)
+        self.frame = np.zeros((4, 4, 3), np.uint8)
+        self.predictions = [{'name': 'First', 'roll_number': 'R1', 'location': (0, 1, 1, 0)}]
+
+    def test_new_model_version_misses(self):
+        self.cache.set(self.cache.make_key(self.frame, 'v000001'), self.predictions)
+        self.assertEqual(self.cache.get(self.cache.make_key(self.frame, 'v000001')), self.predictions)
+        self.assertIsNone(self.cache.get(self.cache.make_key(self.frame, 'v000002')))
+
+    def test_different_frame_misses(self):
+        self.cache.set(self.cache.make_key(self.frame, 'v000001'), self.predictions)
+        changed = self.frame.copy()
+        changed[0, 0, 0] = 1
+        self.assertIsNone(self.cache.get(self.cache.make_key(changed, 'v000001')))
+        # Same bytes, other shape
+        self.assertIsNone(self.cache.get(self.cache.make_key(self.frame.reshape(2, 8, 3), 'v000001')))
+
+    def test_entries_expire(self):
+        key = self.cache.make_key(self.frame, 'v000001')
+        with mock.patch('core.recognition_cache.time.monotonic', return_value=100.0):
+            self.cache.set(key, self.predictions)
+        with mock.patch('core.recognition_cache.time.monotonic', return_value=109.0):
+            self.assertEqual(self.cache.get(key), self.predictions)
+        with mock.patch('core.recognition_cache.time.monotonic', return_value=110.5):
+            self.assertIsNone(self.cache.get(key))
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    def test_least_recently_used_evicted(self):
+        keys = [self.cache.make_key(self.frame + i, 'v000001') for i in range(3)]
+        self.cache.set(keys[0], self.predictions)
+        self.cache.set(keys[1], self.predictions)
+        self.cache.get(keys[0])
+        self.cache.set(keys[2], self.predictions)
+        self.assertIsNone(self.cache.get(keys[1]))
+        self.assertIsNotNone(self.cache.get(keys[0]))
+        self.assertIsNotNone(self.cache.get(keys[2]))
+
+    def test_hits_are_copies(self):
+        key = self.cache.make_key(self.frame, 'v000001')
+        self.cache.set(key, self.predictions)
+        self.predictions[0]['status'] = 'Marked Present'
+        self.cache.get(key)[0]['status'] = 'Already Marked'
+        self.assertNotIn('status', self.cache.get(key)[0])
+
+
+class BackfillMigrationTests(TransactionTestCase):
+    """Each data migration run on rows written with the historical models just before it."""
+
+    def migrate(self, target):
+        """Migrate core to `target`; returns the historical apps at that state."""
+        executor = MigrationExecutor(connection)
+        executor.migrate([('core', target)])
+        executor.loader.build_graph()
+        return executor.loader.project_state([('core', target)]).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+        super().tearDown()
+
+    def test_0029_backfill_class_sessions(self):
+        apps = self.migrate('0028_classsession')
+        Student = apps.get_model('core', 'Student')
+        AttendanceRecord = apps.get_model('core', 'AttendanceRecord')
+        teacher = apps.get_model('auth', 'User').objects.create(username='teacher')
+        day = datetime.date(2026, 10, 12)  # a Monday
+        apps.get_model('core', 'TeacherSubject').objects.create(
+            teacher=teacher, subject='Programming', year='2', section='A', day=day.weekday(),
+            start_time=datetime.time(11), end_time=datetime.time(12))
+        upper = Student.objects.create(name='Upper', roll_number='R1', year='2', section='A')
+        lower = Student.objects.create(name='Lower', roll_number='R2', year='2', section='a ')
+        other = Student.objects.create(name='Other', roll_number='R3', year='2', section='B')
+
+        def record(student, subject, hour, minute):
+            return AttendanceRecord.objects.create(student=student, subject=subject, status='Present',
+                                                   date=day, time=datetime.time(hour, minute)).id
+
+        first = record(upper, 'Programming', 11, 5)
+        same_cohort = record(lower, 'programming ', 11, 20)
+        double_marked = record(upper, 'Programming', 11, 30)
+        other_section = record(other, 'Programming', 11, 5)
+        unscheduled = record(lower, 'Lab', 14, 0)
+        within_hour = record(upper, 'Lab', 14, 30)
+        later = record(upper, 'Lab', 15, 31)
+
+        apps = self.migrate('0029_backfill_class_sessions')
+        ClassSession = apps.get_model('core', 'ClassSession')
+        session_of = dict(apps.get_model('core', 'AttendanceRecord').objects.values_list('id', 'session_id'))
+
+        self.assertEqual(session_of[first], session_of[same_cohort])
+        self.assertIsNone(session_of[double_marked])
+        self.assertNotEqual(session_of[other_section], session_of[first])
+        self.assertEqual(session_of[unscheduled], session_of[within_hour])
+        self.assertNotEqual(session_of[later], session_of[unscheduled])
+        scheduled = ClassSession.objects.get(id=session_of[first])
+        self.assertEqual((scheduled.section, scheduled.section_key, scheduled.subject_key),
+                         ('A', 'a', 'programming'))
+        self.assertEqual((scheduled.start_time, scheduled.end_time), (datetime.time(11), datetime.time(12)))
+        self.assertEqual(ClassSession.objects.get(id=session_of[later]).start_time, datetime.time(15, 31))
+        self.assertEqual(ClassSession.objects.count(), 4)
+
+    def test_0032_backfill_normalized_keys(self):
+        apps = self.migrate('0031_normalized_keys')
+        teacher = apps.get_model('auth', 'User').objects.create(username='teacher')
+        student = apps.get_model('core', 'Student').objects.create(
+            name='Student', roll_number='R1', department=' Computer  Science ', year=' 2 ', section='A')
+        slot = apps.get_model('core', 'TeacherSubject').objects.create(
+            teacher=teacher, subject='Data  Structures', year='2', section='a', day=0,
+            start_time=datetime.time(9), end_time=datetime.time(10))
+        AttendanceRecord = apps.get_model('core', 'AttendanceRecord')
+        for subject in ('Data  Structures ', 'data structures', None):
+            AttendanceRecord.objects.create(student=student, subject=subject, status='Present',
+                                            date=datetime.date(2026, 10, 12), time=datetime.time(9))
+
+        apps = self.migrate('0032_backfill_normalized_keys')
+        student = apps.get_model('core', 'Student').objects.get(id=student.id)
+        self.assertEqual((student.department_key, student.year_key, student.section_key),
+                         ('computer science', '2', 'a'))
+        slot = apps.get_model('core', 'TeacherSubject').objects.get(id=slot.id)
+        self.assertEqual((slot.subject_key, slot.year_key, slot.section_key), ('data structures', '2', 'a'))
+        self.assertEqual(
+            sorted(apps.get_model('core', 'AttendanceRecord').objects.values_list('subject_key', flat=True)),
+            ['', 'data structures', 'data structures'])
+
+    def test_0035_backfill_attendance_summaries(self):
+        apps = self.migrate('0034_attendance_summaries')
+        Student = apps.get_model('core', 'Student')
+        AttendanceRecord = apps.get_model('core', 'AttendanceRecord')
+        keys = {'department_key': 'cse', 'year_key': '2', 'section_key': 'a'}
+        first = Student.objects.create(name='First', roll_number='R1', department='CSE', year='2', section='A', **keys)
+        second = Student.objects.create(name='Second', roll_number='R2', department='CSE', year='2', section='A', **keys)
+        monday, tuesday = datetime.date(2026, 10, 12), datetime.date(2026, 10, 13)
+        for student, day, status in ((first, monday, 'Present'), (second, monday, 'Absent'),
+                                     (first, tuesday, 'Present')):
+            AttendanceRecord.objects.create(student=student, subject='Physics', subject_key='physics',
+                                            status=status, date=day, time=datetime.time(10))
+
+        apps = self.migrate('0035_backfill_attendance_summaries')
+        summaries = {
+            row[0]: row[1:] for row in apps.get_model('core', 'AttendanceSummary').objects.values_list(
+                'student_id', 'subject_key', 'present', 'absent', 'total')
+        }
+        self.assertEqual(summaries, {first.id: ('physics', 2, 0, 2), second.id: ('physics', 0, 1, 1)})
+        self.assertEqual(
+            list(apps.get_model('core', 'CohortAttendanceSummary').objects.values_list(
+                'year_key', 'section_key', 'department_key', 'subject_key', 'lectures')),
+            [('2', 'a', 'cse', 'physics', 2)])
+
+        # The same rows rebuild_summaries() computes from the current models
+        def snapshot():
+            return (sorted(AttendanceSummary.objects.values_list('student_id', 'subject_key', 'present', 'absent', 'total')),
+                    sorted(CohortAttendanceSummary.objects.values_list(
+                        'year_key', 'section_key', 'department_key', 'subject_key', 'lectures')))
+        migrated = snapshot()
+        rebuild_summaries()
+        self.assertEqual(snapshot(), migrated)
+
+
+class EvaluateModelMetricsTests(SimpleTestCase):
+    """evaluate_model's vectorised metrics against the plain loops they replaced."""
+
+    @classmethod
+    def setUpClass(cls):
+        if not all(importlib.util.find_spec(name) for name in ('face_recognition', 'sklearn')):
+            raise unittest.SkipTest("evaluate_model needs face_recognition and scikit-learn")
+        super().setUpClass()
+        spec = importlib.util.spec_from_file_location('evaluate_model', settings.BASE_DIR.parent / 'evaluate_model.py')
+        cls.em = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(cls.em)
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        identities = rng.integers(0, 12, 90)
+        self.labels = np.array([f'R{i:03d}' for i in identities])
+        self.encodings = rng.normal(0, 0.1, (90, 128)) + identities[:, None] * 0.01
+        self.rng = rng
+
+    def loop_pairs(self):
+        euc, cos, same = [], [], []
+        for i, j in itertools.combinations(range(len(self.labels)), 2):
+            a, b = self.encodings[i], self.encodings[j]
+            euc.append(np.linalg.norm(a - b))
+            cos.append(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+            same.append(self.labels[i] == self.labels[j])
+        return np.array(euc), np.array(cos), np.array(same)
+
+    def test_pairwise_matches_loop(self):
+        euc, cos, same = self.loop_pairs()
+        for block_size in (None, 1, 7):
+            pairs = self.em.compute_pairwise(self.encodings, self.labels, block_size)
+            np.testing.assert_allclose(pairs['euclidean'], euc, atol=1e-9)
+            np.testing.assert_allclose(pairs['cosine'], cos, atol=1e-9)
+            np.testing.assert_array_equal(pairs['genuine'], same)
+
+    def test_streaming_statistics_match_loop(self):
+        euc, cos, same = self.loop_pairs()
+        stats = self.em.accumulate_pair_statistics(self.encodings, self.labels, bins=200, block_size=7)
+        np.testing.assert_allclose(stats['gen_euc'], euc[same], atol=1e-9)
+        np.testing.assert_allclose(stats['gen_cos'], cos[same], atol=1e-9)
+        self.assertEqual(stats['n_imp'], int((~same).sum()))
+        scores = np.clip(1.0 - euc[~same], *self.em.SCORE_RANGE)
+        np.testing.assert_array_equal(stats['imp_score_hist'], np.histogram(scores, bins=stats['score_edges'])[0])
+        self.assertAlmostEqual(stats['imp_sum_euc'], float(euc[~same].sum()), places=6)
+        self.assertAlmostEqual(stats['imp_sum_euc_sq'], float((euc[~same] ** 2).sum()), places=6)
+
+    def test_error_rates_match_loop(self):
+        genuine, impostor = self.rng.uniform(0.3, 1.0, 80), self.rng.uniform(-0.2, 0.6, 300)
+        thresholds = np.linspace(-0.2, 1.0, 25)
+        far, frr = self.em.error_rates(genuine, impostor, thresholds)
+        np.testing.assert_allclose(far, [np.mean([s >= t for s in impostor]) for t in thresholds])
+        np.testing.assert_allclose(frr, [np.mean([s < t for s in genuine]) for t in thresholds])
+
+    def test_threshold_sweep_and_top_k_match_loop(self):
+        true = self.labels
+        nn_labels = self.rng.choice(np.unique(self.labels), (len(true), 3))
+        nn_labels[::2, 0] = true[::2]
+        nn_dist = np.sort(self.rng.uniform(0.2, 0.8, (len(true), 3)), axis=1)
+        thresholds = [0.3, 0.45, 0.53, 0.7]
+
+        sweep = self.em.threshold_sweep(true, nn_dist, nn_labels, thresholds)
+        for i, threshold in enumerate(thresholds):
+            accepted = [d[0] <= threshold for d in nn_dist]
+            correct = [a and l[0] == t for a, l, t in zip(accepted, nn_labels, true)]
+            wrong = [a and l[0] != t for a, l, t in zip(accepted, nn_labels, true)]
+            self.assertAlmostEqual(sweep['accuracy'][i], np.mean(correct))
+            self.assertAlmostEqual(sweep['false_accept_rate'][i], np.mean(wrong))
+            self.assertAlmostEqual(sweep['unknown_rate'][i], 1 - np.mean(accepted))
+
+        top_k = self.em.top_k_accuracy(true, nn_dist, nn_labels, 0.53)
+        for k in range(1, 4):
+            hits = [any(l == t and d <= 0.53 for l, d in zip(ls[:k], ds[:k]))
+                    for ls, ds, t in zip(nn_labels, nn_dist, true)]
+            self.assertAlmostEqual(top_k[k - 1], np.mean(hits))
@@ -0,0 +1,210 @@
+"""
+Background model training coordinator.
+
+Enrollment, admin uploads and bulk deletes all need the face model to be
+rebuilt. Instead of every caller running train_model() (or spawning its own
+thread), they call request_training(). Requests arriving within the debounce
+window are coalesced into a single build, and at most one build runs at a time
+(guarded in-process by a lock and across gunicorn workers by a lock file that
+the building worker touches every TRAINING_LOCK_HEARTBEAT seconds).
+
+A request is recorded in a shared marker file as well as in the requesting
+worker's timer, and the marker is only cleared by a build that started after
+it was last touched. If that worker is recycled (or dies mid-build) before the
+build runs, the next status poll in any worker re-arms it.
+
+The job status is written to a small JSON file next to the model so any
+worker can answer the UI's status poll; updates are read-modify-write under
+their own short lock and replace the file atomically.
+"""
+import os
+import json
+import time
+import threading
+from django.conf import settings
+from .file_lock import FileLock
+
+STATUS_LOCK_STALE_AFTER = 10  # seconds
+
+
+def _model_path(name):
+    return os.path.join(str(settings.MODEL_DIR), name)
+
+
+def _status_path():
+    return _model_path('training_status.json')
+
+
+def _pending_path():
+    return _model_path('training.pending')
+
+
+def _build_lock():
+    return FileLock(_model_path('training.lock'), getattr(settings, 'TRAINING_LOCK_TIMEOUT', 5 * 60))
+
+
+def get_training_status():
+    """Return the last published training status (shared across workers)."""
+    try:
+        with open(_status_path()) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'state': 'idle', 'message': '', 'requested_at': None, 'started_at': None, 'finished_at': None}
+
+
+def _update_status(**changes):
+    """Merge `changes` into the status file under the status lock; returns the new status."""
+    path = _status_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with FileLock(f"{path}.lock", STATUS_LOCK_STALE_AFTER):
+        status = get_training_status()
+        status.update(changes)
+        # Replaced atomically so pollers never read a partial file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(status, f)
+        os.replace(tmp_path, path)
+    return status
+
+
+def _pending_since():
+    """mtime of the shared pending-request marker, or None if no build is pending."""
+    try:
+        return os.path.getmtime(_pending_path())
+    except OSError:
+        return None
+
+
+def _mark_pending():
+    path = _pending_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a'):
+        pass
+    os.utime(path)
+
+
+class TrainingCoordinator:
+    def __init__(self, debounce_seconds):
+        self.debounce_seconds = debounce_seconds
+        self._lock = threading.Lock()
+        self._timer = None
+        self._running = False
+        self._dirty = False
+        self._reasons = []
+
+    def request(self, reason=''):
+        """Schedule a model rebuild. Returns immediately."""
+        with self._lock:
+            if reason:
+                self._reasons.append(reason)
+            _mark_pending()
+            if self._running:
+                # A build is in progress; run once more after it finishes.
+                self._dirty = True
+            else:
+                self._schedule()
+            return _update_status(state='pending', requested_at=time.time())
+
+    def resume(self):
+        """Arm a build for a request recorded by another (possibly recycled) worker."""
+        pending_since = _pending_since()
+        if pending_since is None:
+            return
+        with self._lock:
+            if self._running or self._timer is not None:
+                return
+            self._schedule(max(0.0, self.debounce_seconds - (time.time() - pending_since)))
+
+    def _schedule(self, delay=None):
+        # Called with self._lock held. Each new request pushes the build back.
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(self.debounce_seconds if delay is None else delay, self._run)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _run(self):
+        from .utils import train_model
+
+        build_lock = _build_lock()
+        with self._lock:
+            self._timer = None
+            if self._running:
+                self._dirty = True
+                return
+            pending_since = _pending_since()
+            if pending_since is None:
+                return  # another worker already built for these requests
+            if not build_lock.acquire():
+                # Another worker is building; try again once it has had time to finish.
+                self._schedule()
+                return
+            self._running = True
+            self._dirty = False
+            reasons, self._reasons = self._reasons, []
+
+        started_at = time.time()
+        _update_status(state='running', started_at=started_at)
+        print(f"[Training] Build started ({len(reasons)} request(s): {', '.join(reasons) or 'manual'})")
+
+        stop_heartbeat = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._heartbeat, args=(build_lock, stop_heartbeat), daemon=True)
+        heartbeat.start()
+        try:
+            success, msg = train_model()
+        except Exception as e:
+            success, msg = False, f"Training error: {e}"
+        finally:
+            stop_heartbeat.set()
+            heartbeat.join()
+            # Requests made after the build read the data are still pending
+            if _pending_since() == pending_since:
+                try:
+                    os.remove(_pending_path())
+                except OSError:
+                    pass
+            build_lock.release()
+
+        print(f"[Training] Build finished in {time.time() - started_at:.1f}s: {msg}")
+
+        with self._lock:
+            self._running = False
+            more = self._dirty or _pending_since() is not None
+            _update_status(
+                state='pending' if more else ('idle' if success else 'failed'),
+                finished_at=time.time(),
+                success=success,
+                message=msg,
+            )
+            if more:
+                self._schedule()
+
+    @staticmethod
+    def _heartbeat(build_lock, stop):
+        interval = getattr(settings, 'TRAINING_LOCK_HEARTBEAT', 30)
+        while not stop.wait(interval):
+            build_lock.touch()
+
+
+_coordinator = None
+_coordinator_lock = threading.Lock()
+
+
+def get_coordinator():
+    global _coordinator
+    with _coordinator_lock:
+        if _coordinator is None:
+            _coordinator = TrainingCoordinator(getattr(settings, 'TRAINING_DEBOUNCE_SECONDS', 5))
+        return _coordinator
+
+
+def request_training(reason=''):
+    """Queue a debounced model rebuild and return the current job status."""
+    return get_coordinator().request(reason)
+
+
+def poll_training_status():
+    """Status for the UI poll; re-arms a pending build whose worker went away."""
+    get_coordinator().resume()
+    return get_training_status()
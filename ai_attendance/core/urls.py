@@ -12,6 +12,10 @@ urlpatterns = [
     path('add_student/', views.add_student, name='add_student'),
     path('add_teacher/', views.add_teacher, name='add_teacher'),
     path('train/', views.train, name='train'),
+    path('train/status/', views.training_status, name='training_status'),
+    path('recognition/cache_stats/', views.recognition_cache_stats, name='recognition_cache_stats'),
+    path('metrics/', views.metrics, name='metrics'),
+    path('profiling/', views.profiling_summary, name='profiling_summary'),
     path('take_attendance_selector/', views.take_attendance_selector, name='take_attendance_selector'),
     path('upload_attendance/', views.upload_attendance, name='upload_attendance'),
     path('manual_attendance/', views.manual_attendance, name='manual_attendance'),
@@ -24,6 +28,7 @@ urlpatterns = [
     path('process_live_frame/', views.process_live_frame, name='process_live_frame'),
     path('manage_students/', views.manage_students, name='manage_students'),
     path('download_attendance/', views.download_attendance, name='download_attendance'),
+    path('api/attendance/export/', views.export_attendance_api, name='export_attendance_api'),
     path('edit_student/<int:student_id>/', views.edit_student, name='edit_student'),
     path('delete_student/<int:student_id>/', views.delete_student, name='delete_student'),
     path('bulk_delete_students/', views.bulk_delete_students, name='bulk_delete_students'),
@@ -1,102 +1,332 @@
 import os
 import pickle
+import logging
 import numpy as np
 from django.conf import settings
 import datetime
+from django.db import transaction
 from django.utils import timezone
-from .models import Student, AttendanceRecord, TeacherSubject, TimeTable
+from .models import Student, AttendanceRecord, ClassSession, normalize_key, canonical_department, DEPARTMENT_CODES
+from .attendance_summary import apply_changes, summary_row
+from .model_store import publish_gallery, get_gallery
+from .recognition_cache import recognition_cache
+from .slot_index import slot_index
+from .metrics import STAGE_SECONDS, FRAMES, FACES_DETECTED, FACES_MATCHED
+
+logger = logging.getLogger(__name__)
+
+# An unscheduled lecture (no slot covers it) is one session from its first
+# marking until this many minutes later.
+UNSCHEDULED_SESSION_MINUTES = 60
+
+def get_class_sessions(cohorts, subject, date, ref_time=None, create=False):
+    """
+    The ClassSession of `subject` on `date` covering ref_time for each
+    (year_key, section_key) cohort: {(year_key, section_key): session}.
+    `cohorts` may map each key pair to the (year, section) spelling new
+    sessions are created with; it defaults to the keys themselves.
+
+    A lecture inside a TeacherSubject/TimeTable slot (+/- 45 minutes) is the
+    session starting at the slot's start time. Otherwise it is the session
+    of that cohort started closest to ref_time within the last
+    UNSCHEDULED_SESSION_MINUTES (an extra class). With create=True, missing
+    sessions are created, starting at the slot start (or ref_time).
+    """
+    if ref_time is None:
+        ref_time = datetime.datetime.now().time()
+    labels = cohorts if isinstance(cohorts, dict) else {}
+    cohorts = {(normalize_key(year), normalize_key(section)) for year, section in cohorts}
+    if not cohorts:
+        return {}
+    subject_key = normalize_key(subject)
+    slot = slot_index.slot_times(subject, date, ref_time)
+
+    sessions = ClassSession.objects.filter(
+        subject_key=subject_key, date=date,
+        year_key__in={year for year, _ in cohorts}, section_key__in={section for _, section in cohorts},
+    )
+    if slot:
+        start_time, end_time = slot
+        sessions = sessions.filter(start_time=start_time)
+    else:
+        start_time, end_time = ref_time.replace(microsecond=0), None
+        ref_dt = datetime.datetime.combine(date, ref_time)
+        earliest = ref_dt - datetime.timedelta(minutes=UNSCHEDULED_SESSION_MINUTES)
+        sessions = sessions.filter(
+            start_time__gte=max(earliest, datetime.datetime.combine(date, datetime.time.min)).time(),
+            start_time__lte=ref_time,
+        )
+
+    found = {}
+    for session in sessions.order_by('start_time'):
+        cohort = (session.year_key, session.section_key)
+        if cohort in cohorts:
+            # Ascending start: the latest session started before ref_time wins
+            found[cohort] = session
+
+    if create:
+        for cohort in cohorts - found.keys():
+            year, section = labels.get(cohort, cohort)
+            found[cohort], _ = ClassSession.objects.get_or_create(
+                subject_key=subject_key, year_key=cohort[0], section_key=cohort[1], date=date, start_time=start_time,
+                defaults={'subject': subject, 'year': year or '', 'section': section or '', 'end_time': end_time},
+            )
+    return found
+
+def get_session_records(sessions, student_ids):
+    """{student_id: record} for the given students' records in any of `sessions`, in one query."""
+    return {
+        record.student_id: record
+        for record in AttendanceRecord.objects.filter(
+            session__in=list(sessions), student_id__in=list(student_ids)
+        )
+    }
 
 def get_existing_attendance_record(student, subject, date, ref_time=None):
     """
     Finds an existing attendance record for the student/subject/date 
-    that matches the lecture slot covering ref_time, or a fall-back window.
+    in the lecture (ClassSession) covering ref_time.
     Params:
     - student: Student object
     - subject: Subject name (string)
     - date: datetime.date object
     - ref_time: datetime.time object (marking time). Defaults to now.
     """
-    if ref_time is None:
-        ref_time = datetime.datetime.now().time()
+    return get_existing_attendance_records([student], subject, date, ref_time).get(student.id)
 
-    # 1. Try to find the Class Slot (TeacherSubject or TimeTable)
-    # Convert date to weekday (0=Mon, 6=Sun)
-    weekday = date.weekday()
-    
-    # Check TeacherSubject first (Assigned Classes)
-    # Find a class for this subject on this day where ref_time is close to start/end
-    # We'll consider a "Slot" relevant if marking happens between Start-45min and End+45min
-    
-    # We need to filter by subject matching.
-    # Note: Subject names might be loose, but we'll try exact first.
-    
-    matched_slot = None
-    
-    # Logic: Look for any slot for this subject on this day
-    # Then see if ref_time is "within range" of that slot.
-    
-    slots = TeacherSubject.objects.filter(subject__iexact=subject, day=weekday)
-    if not slots.exists():
-        # Fallback to TimeTable
-        slots = TimeTable.objects.filter(subject__iexact=subject, day=weekday)
+def get_existing_attendance_records(students, subject, date, ref_time=None):
+    """
+    get_existing_attendance_record() for a whole class: {student_id: record}
+    for the students that already have a record in the lecture.
+    """
+    sessions = get_class_sessions({(s.year_key, s.section_key) for s in students}, subject, date, ref_time)
+    if not sessions:
+        return {}
+    return get_session_records(sessions.values(), [s.id for s in students])
+
+def get_student_display_metadata(roll_numbers):
+    """Display fields for the given roll numbers in one query, keyed by roll number."""
+    return {
+        row['roll_number']: {
+            'name': row['name'],
+            'department': row['department'],
+            'year': row['year'],
+            'section': row['section'],
+        }
+        for row in Student.objects.filter(roll_number__in=list(roll_numbers)).values(
+            'roll_number', 'name', 'department', 'year', 'section'
+        )
+    }
+
+def mark_class_attendance(predictions, subject=None, year=None, section=None):
+    """
+    Write an uploaded class photo's attendance: recognized students of the class
+    are marked Present and, in class mode (subject and year), the rest of the
+    roster Absent, one record per student per lecture session. Sets each
+    prediction's 'status'; returns (predictions, marked, absent, unknown).
+    """
+    with STAGE_SECONDS.time(stage='db_mark'):
+        marked_count = 0
+        unknown_count = 0
+        absent_count = 0
         
-    for slot in slots:
-        if slot.start_time and slot.end_time:
-            # Create full datetimes for comparison
-            # Handle crossing midnight? Unlikely for classes, but safe to assume same day.
-            
-            start_dt = datetime.datetime.combine(date, slot.start_time)
-            end_dt = datetime.datetime.combine(date, slot.end_time)
-            
-            # Add buffers
-            window_start = start_dt - datetime.timedelta(minutes=45)
-            window_end = end_dt + datetime.timedelta(minutes=45)
-            
-            check_dt = datetime.datetime.combine(date, ref_time)
-            
-            if window_start <= check_dt <= window_end:
-                matched_slot = slot
-                break
-    
-    # Query for existing records for this student, subject, date
-    existing_records = AttendanceRecord.objects.filter(student=student, subject__iexact=subject, date=date)
-    
-    if matched_slot:
-        # If we found a slot, we want ANY record that corresponds to this slot.
-        # i.e., any record whose 'time' is also within this slot's window.
+        checked_rolls = set()
+        present_roll_numbers = set()
+        final_predictions = []
         
-        start_dt = datetime.datetime.combine(date, matched_slot.start_time)
-        end_dt = datetime.datetime.combine(date, matched_slot.end_time)
-        window_start = start_dt - datetime.timedelta(minutes=45)
-        window_end = end_dt + datetime.timedelta(minutes=45)
+        today = datetime.date.today()
+        now_time = datetime.datetime.now().time()
         
-        for record in existing_records:
-            # Check if record time is in window
-            record_dt = datetime.datetime.combine(record.date, record.time)
-            if window_start <= record_dt <= window_end:
-                return record
-                
-    else:
-        # No slot found (e.g. extra class, different time, or no schedule).
-        # Fallback to pure time window (e.g. +/- 60 mins from ref_time)
-        # Check against ref_time
+        # Resolve every recognized roll number in one query
+        students_by_roll = Student.objects.in_bulk(
+            list({pred['roll_number'] for pred in predictions if pred['roll_number']}),
+            field_name='roll_number'
+        )
+        
+        # Class roster for auto-absent - ONLY if Subject is defined (Class Mode)
+        # CRITICAL FIX: Only fetch students for this specific YEAR (and section)
+        class_students = []
+        if subject and year:
+            filter_kwargs = {'year_key': normalize_key(year)}
+            if section:
+                filter_kwargs['section_key'] = normalize_key(section)
+            class_qs = Student.objects.filter(**filter_kwargs)
+            # If section name is a department code, ensure student's department also matches to avoid cross-branch matching
+            if section and section.upper() in DEPARTMENT_CODES:
+                class_qs = class_qs.filter(department_key=canonical_department(section))
+            class_students = list(class_qs)
+        
+        def cohort_mismatch(student):
+            # Why a recognized student doesn't belong to the requested class, or None
+            if year and student.year_key != normalize_key(year):
+                return f"Wrong Year ({student.year})"
+            if section and student.section_key != normalize_key(section):
+                return f"Wrong Section ({student.section})"
+            # Verify student belongs to this department/branch if section is a department code
+            if section and section.upper() in DEPARTMENT_CODES and student.department_key != canonical_department(section):
+                return f"Wrong Branch ({student.department})"
+            return None
+
+        # This lecture's session per cohort and its existing records, for the class and the recognized
+        # students who belong to it (no sessions are opened for other classes' cohorts)
+        sessions = {}
+        records_by_student = {}
+        if subject:
+            involved = class_students + [s for s in students_by_roll.values() if cohort_mismatch(s) is None]
+            sessions = get_class_sessions(
+                {(s.year_key, s.section_key): (s.year, s.section) for s in involved}, subject, today, now_time, create=True
+            )
+            records_by_student = get_session_records(sessions.values(), {s.id for s in involved})
+        else:
+            # Global cooldown only looks back an hour, so yesterday onwards is enough
+            latest_by_student = {}
+            recent = AttendanceRecord.objects.filter(
+                student_id__in=[s.id for s in students_by_roll.values()],
+                date__gte=today - datetime.timedelta(days=1)
+            ).order_by('date', 'time')
+            for record in recent:
+                latest_by_student[record.student_id] = record
         
-        check_dt = datetime.datetime.combine(date, ref_time)
-        window_start = check_dt - datetime.timedelta(minutes=60)
-        window_end = check_dt + datetime.timedelta(minutes=60)
+        to_create = []
+        to_update = []
+        replaced_rows = []  # summary rows of the records in to_update before their change
+        created_preds = {}  # student_id -> prediction of a new Present record
         
-        for record in existing_records:
-            record_dt = datetime.datetime.combine(record.date, record.time)
-            if window_start <= record_dt <= window_end:
-                return record
+        # 1. Process Detected Faces (Mark Present)
+        for pred in predictions:
+            roll_number = pred['roll_number']
+            if roll_number:
+                present_roll_numbers.add(roll_number)
+                
+                # Deduplication: Check if we already processed this student in this frame
+                if roll_number in checked_rolls:
+                    continue
+                
+                checked_rolls.add(roll_number)
+                
+                student = students_by_roll.get(roll_number)
+                if student is None:
+                    logger.warning("Student with roll number %s not found in DB", roll_number)
+                    pred['status'] = 'Student Not Found'
+                    final_predictions.append(pred)
+                    continue
+                
+                # Verify student belongs to this year/section (and branch)
+                mismatch = cohort_mismatch(student)
+                if mismatch:
+                    pred['status'] = mismatch
+                    final_predictions.append(pred)
+                    continue
+
+                status_text = "Marked Present"
+                if subject:
+                     status_text += f" ({subject})"
+                
+                can_mark = True
                 
-    return None
+                if subject:
+                     existing_record = records_by_student.get(student.id)
+                     
+                     if existing_record:
+                         if existing_record.status == 'Absent':
+                             replaced_rows.append(summary_row(existing_record, student))
+                             existing_record.status = 'Present'
+                             to_update.append(existing_record)
+                             status_text = f"Marked Present (Was Absent) - ({subject})"
+                             marked_count += 1
+                             can_mark = False # Handled update
+                         else:
+                             can_mark = False
+                             status_text = f"Already Marked Present ({subject})"
+                else:
+                    # Fallback Global Cooldown
+                    last_attendance = latest_by_student.get(student.id)
+                    if last_attendance:
+                        last_datetime_naive = datetime.datetime.combine(last_attendance.date, last_attendance.time)
+                        if timezone.is_naive(last_datetime_naive):
+                            last_datetime = timezone.make_aware(last_datetime_naive, timezone.get_current_timezone())
+                        else:
+                            last_datetime = last_datetime_naive
+                            
+                        time_diff = timezone.now() - last_datetime
+                        if time_diff.total_seconds() < 3600 and last_attendance.status == 'Present':
+                            can_mark = False
+                            status_text = f"Already Marked ({int(time_diff.total_seconds() // 60)}m ago)"
+
+                if can_mark:
+                     session = sessions.get((student.year_key, student.section_key))
+                     to_create.append(AttendanceRecord(
+                         student=student, session=session, subject=subject, subject_key=normalize_key(subject), status='Present'
+                     ))
+                     created_preds[student.id] = pred
+                     
+                pred['status'] = status_text
+            else:
+                unknown_count += 1
+                pred['status'] = 'Unknown'
+            
+            final_predictions.append(pred)
+
+        # 2. Process Missing Students (Auto-Absent): anyone without a record in this lecture's session
+        for student in class_students:
+            if student.roll_number in present_roll_numbers or student.id in records_by_student:
+                continue
+            session = sessions.get((student.year_key, student.section_key))
+            to_create.append(AttendanceRecord(
+                student=student, session=session, subject=subject, subject_key=normalize_key(subject), status='Absent'
+            ))
+
+        with transaction.atomic():
+            if to_update:
+                AttendanceRecord.objects.bulk_update(to_update, ['status'])
+            # A concurrent upload for the same lecture may have marked some of these already;
+            # unique_session_student drops those rows instead of failing the whole batch, so
+            # the session is re-read to count only the rows that were actually inserted.
+            inserted_ids = {r.student_id for r in to_create}
+            overruled_ids = set()  # absent in the concurrent upload's record, present here
+            students_by_id = {s.id: s for s in class_students + list(students_by_roll.values())}
+            if subject and to_create:
+                session_records = AttendanceRecord.objects.filter(
+                    session__in=list(sessions.values()), student_id__in=inserted_ids)
+                existing = set(session_records.values_list('student_id', flat=True))
+                AttendanceRecord.objects.bulk_create(to_create, ignore_conflicts=True)
+                inserted_ids -= existing
+                # Recognized here but marked absent by the other upload: present wins
+                overruled = list(session_records.filter(
+                    student_id__in=existing & created_preds.keys(), status='Absent'))
+                if overruled:
+                    session_records.filter(id__in=[r.id for r in overruled]).update(status='Present')
+                    for record in overruled:
+                        replaced_rows.append(summary_row(record, students_by_id[record.student_id]))
+                        record.status = 'Present'
+                        to_update.append(record)
+                        overruled_ids.add(record.student_id)
+            else:
+                AttendanceRecord.objects.bulk_create(to_create)
+            apply_changes(
+                removed=replaced_rows,
+                added=[summary_row(r, students_by_id[r.student_id]) for r in to_update]
+                + [summary_row(r, r.student) for r in to_create if r.student_id in inserted_ids],
+            )
+
+        for record in to_create:
+            if record.student_id in inserted_ids:
+                if record.status == 'Absent':
+                    absent_count += 1
+                else:
+                    marked_count += 1
+            elif record.status == 'Present':
+                if record.student_id in overruled_ids:
+                    marked_count += 1
+                    created_preds[record.student_id]['status'] = f"Marked Present (Was Absent) - ({subject})"
+                else:
+                    created_preds[record.student_id]['status'] = f"Already Marked Present ({subject})"
+
+    return final_predictions, marked_count, absent_count, unknown_count
 
 def train_model():
     import face_recognition
-    from sklearn import neighbors
     dataset_dir = settings.DATASET_DIR
-    model_path = settings.MODEL_PATH
     cache_path = os.path.join(settings.BASE_DIR, 'encodings_cache.pkl')
     
     X = []
@@ -191,151 +421,205 @@ def train_model():
     
     # Save cache
     try:
-        with open(cache_path, 'wb') as f:
+        tmp_cache_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_cache_path, 'wb') as f:
             pickle.dump(clean_cache, f)
+        os.replace(tmp_cache_path, cache_path)
         print(f"Cache updated. New: {new_encodings_count}, Total Cached: {len(clean_cache)}")
     except Exception as e:
         print(f"Error saving cache: {e}")
         
-    # Train KNN
-    # Use 1-NN (nearest neighbor) for face recognition to find the exact closest matching profile
+    # Publish gallery
+    # Recognition is 1-NN (nearest neighbor) over these encodings to find the exact closest matching profile
     # and prevent class density bias (e.g. recognizing as someone else who has more photos).
-    n_neighbors = 1
-        
-    knn_clf = neighbors.KNeighborsClassifier(n_neighbors=n_neighbors, algorithm='ball_tree', weights='distance')
-    knn_clf.fit(X, y)
-    
-    # Save model
-    with open(model_path, 'wb') as f:
-        pickle.dump(knn_clf, f)
-        
-    return True, f"Model updated! Processed {new_encodings_count} new images. Total faces: {len(X)}."
+    manifest = publish_gallery(np.array(X), np.array(y), students=get_student_display_metadata(set(y)))
+
+    return True, f"Model {manifest['version']} published! Processed {new_encodings_count} new images. Total faces: {len(X)}."
 
 def identify_faces(image_path=None, image_content=None):
     import face_recognition
     import cv2
     
-    model_path = settings.MODEL_PATH
-    if not os.path.exists(model_path):
+    gallery = get_gallery()
+    if gallery is None or len(gallery) == 0:
         return []
-        
-    print(f"Loading model from {model_path}")
-    with open(model_path, 'rb') as f:
-        knn_clf = pickle.load(f)
-        
+
     if image_content is not None:
         image = image_content
     else:
-        image = face_recognition.load_image_file(image_path)
+        with STAGE_SECONDS.time(stage='decode'):
+            image = face_recognition.load_image_file(image_path)
+
+    # Identical frames (retries, double submits) reuse the stored predictions
+    cache_key = recognition_cache.make_key(image, gallery.version)
+    cached = recognition_cache.get(cache_key)
+    if cached is not None:
+        FRAMES.inc(cache='hit')
+        logger.debug("Recognition cache hit, skipping detection")
+        return cached
+    FRAMES.inc(cache='miss')
+
+    predictions = _detect_and_match(image, gallery)
+    recognition_cache.set(cache_key, predictions)
+    return predictions
+
+DETECTION_SCALE_FACTOR = 2
+
+_haar_cascades = {}
+
+def _get_haar_cascade(name):
+    """Load a Haar cascade once per process instead of on every frame."""
+    import cv2
+    cascade = _haar_cascades.get(name)
+    if cascade is None:
+        cascade = cv2.CascadeClassifier(cv2.data.haarcascades + name)
+        _haar_cascades[name] = cascade
+    return cascade
+
+def downscale_image(image, scale_factor=DETECTION_SCALE_FACTOR):
+    import cv2
+    height, width = image.shape[:2]
+    return cv2.resize(image, (width // scale_factor, height // scale_factor))
+
+def detect_faces_hog(small_image, scale_factor=DETECTION_SCALE_FACTOR):
+    """HOG detection on the downscaled image; boxes are returned at full resolution."""
+    import face_recognition
+    locations_small = face_recognition.face_locations(small_image)
+    # Scale face locations back up to original image resolution
+    return [(t * scale_factor, r * scale_factor, b * scale_factor, l * scale_factor) for (t, r, b, l) in locations_small]
+
+def detect_faces_haar(gray_small, cascade_name, scale_factor=DETECTION_SCALE_FACTOR):
+    """Haar cascade detection on the downscaled grayscale image; boxes are returned at full resolution."""
+    # minNeighbors lowered to 5 to be more sensitive to tilted/side faces
+    rects = _get_haar_cascade(cascade_name).detectMultiScale(gray_small, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
+    locations = []
+    for (x, y, w, h) in rects:
+        t = y * scale_factor
+        r = (x + w) * scale_factor
+        b = (y + h) * scale_factor
+        l = x * scale_factor
+        locations.append((t, r, b, l))
+    return locations
+
+def calculate_iou(boxA, boxB):
+    # box: (top, right, bottom, left)
+    tA, rA, bA, lA = boxA
+    tB, rB, bB, lB = boxB
+    
+    xA = max(lA, lB)
+    yA = max(tA, tB)
+    xB = min(rA, rB)
+    yB = min(bA, bB)
+    
+    interArea = max(0, xB - xA) * max(0, yB - yA)
+    
+    boxAArea = (rA - lA) * (bA - tA)
+    boxBArea = (rB - lB) * (bB - tB)
+    
+    iou = interArea / float(boxAArea + boxBArea - interArea)
+    return iou
+
+def merge_detections(primary, secondary, iou_threshold=0.3):
+    """Add boxes from `secondary` that don't overlap (IOU > threshold) any box already kept."""
+    merged = list(primary)
+    for loc in secondary:
+        is_duplicate = False
+        for existing_loc in merged:
+            if calculate_iou(loc, existing_loc) > iou_threshold:
+                is_duplicate = True
+                break
+        if not is_duplicate:
+            merged.append(loc)
+    return merged
+
+def encode_faces(image, face_locations):
+    """128-D encodings from the full-resolution image at the given locations."""
+    import face_recognition
+    return face_recognition.face_encodings(image, known_face_locations=face_locations)
+
+def detect_faces(image):
+    """HOG + Haar (frontal and profile) detection, merged by IOU."""
+    import cv2
     
     # 1. Resize image for faster face detection (2x downscaling)
-    scale_factor = 2
-    height, width = image.shape[:2]
-    small_image = cv2.resize(image, (width // scale_factor, height // scale_factor))
+    with STAGE_SECONDS.time(stage='downscale'):
+        small_image = downscale_image(image)
     
-    print("Detecting face locations with HOG on downscaled image...")
-    # Run HOG on downscaled image
-    hog_face_locations_small = face_recognition.face_locations(small_image)
-    # Scale face locations back up to original image resolution
-    hog_face_locations = [(t * scale_factor, r * scale_factor, b * scale_factor, l * scale_factor) for (t, r, b, l) in hog_face_locations_small]
-    print(f"HOG found {len(hog_face_locations)} faces")
+    with STAGE_SECONDS.time(stage='detect_hog'):
+        hog_face_locations = detect_faces_hog(small_image)
+    FACES_DETECTED.inc(len(hog_face_locations), detector='hog')
+    logger.debug("HOG found %d faces", len(hog_face_locations))
 
     # 2. Haar Cascade Detection on downscaled image (frontal + profile face support)
-    print("Detecting face locations with Haar Cascade...")
     try:
-        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        profile_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_profileface.xml')
-        
         gray_small = cv2.cvtColor(small_image, cv2.COLOR_RGB2GRAY)
-        
-        # Frontal face (lowered minNeighbors to 5 to be more sensitive to tilted/side faces)
-        haar_faces_rects = face_cascade.detectMultiScale(gray_small, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
-        
-        haar_face_locations = []
-        for (x, y, w, h) in haar_faces_rects:
-            t = y * scale_factor
-            r = (x + w) * scale_factor
-            b = (y + h) * scale_factor
-            l = x * scale_factor
-            haar_face_locations.append((t, r, b, l))
-            
+        with STAGE_SECONDS.time(stage='detect_haar_frontal'):
+            frontal = detect_faces_haar(gray_small, 'haarcascade_frontalface_default.xml')
+        FACES_DETECTED.inc(len(frontal), detector='haar_frontal')
         # Profile face (side view / tilted backup)
-        haar_profile_rects = profile_cascade.detectMultiScale(gray_small, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
-        for (x, y, w, h) in haar_profile_rects:
-            t = y * scale_factor
-            r = (x + w) * scale_factor
-            b = (y + h) * scale_factor
-            l = x * scale_factor
-            haar_face_locations.append((t, r, b, l))
-            
-        print(f"Haar found {len(haar_face_locations)} faces (frontal + profile)")
+        with STAGE_SECONDS.time(stage='detect_haar_profile'):
+            profile = detect_faces_haar(gray_small, 'haarcascade_profileface.xml')
+        FACES_DETECTED.inc(len(profile), detector='haar_profile')
+        haar_face_locations = frontal + profile
+        logger.debug("Haar found %d faces (frontal + profile)", len(haar_face_locations))
     except Exception as e:
-        print(f"Haar Cascade error: {e}")
+        logger.warning("Haar Cascade error: %s", e)
         haar_face_locations = []
 
     # 3. Merge Detections (Avoid duplicates using IOU)
-    final_face_locations = list(hog_face_locations)
-    
-    def calculate_iou(boxA, boxB):
-        # box: (top, right, bottom, left)
-        tA, rA, bA, lA = boxA
-        tB, rB, bB, lB = boxB
-        
-        xA = max(lA, lB)
-        yA = max(tA, tB)
-        xB = min(rA, rB)
-        yB = min(bA, bB)
-        
-        interArea = max(0, xB - xA) * max(0, yB - yA)
-        
-        boxAArea = (rA - lA) * (bA - tA)
-        boxBArea = (rB - lB) * (bB - tB)
-        
-        iou = interArea / float(boxAArea + boxBArea - interArea)
-        return iou
+    with STAGE_SECONDS.time(stage='merge'):
+        merged = merge_detections(hog_face_locations, haar_face_locations)
+    FACES_DETECTED.inc(len(merged), detector='merged')
+    return merged
 
-    for h_loc in haar_face_locations:
-        is_duplicate = False
-        for existing_loc in final_face_locations:
-            iou = calculate_iou(h_loc, existing_loc)
-            if iou > 0.3: # Threshold for overlap
-                is_duplicate = True
-                break
-        
-        if not is_duplicate:
-            final_face_locations.append(h_loc)
-            
-    print(f"DEBUG: Total unique faces found: {len(final_face_locations)}")
+def _detect_and_match(image, gallery):
+    final_face_locations = detect_faces(image)
+    logger.debug("Total unique faces found: %d", len(final_face_locations))
     
     if len(final_face_locations) == 0:
-        print("DEBUG: No faces found.")
         return []
         
     # Get high-quality encodings from original full-resolution image using scaled locations
-    faces_encodings = face_recognition.face_encodings(image, known_face_locations=final_face_locations)
-    print(f"DEBUG: Encodings generated: {len(faces_encodings)}")
+    with STAGE_SECONDS.time(stage='encode'):
+        faces_encodings = encode_faces(image, final_face_locations)
+    logger.debug("Encodings generated: %d", len(faces_encodings))
     
     if len(faces_encodings) == 0:
          return []
 
-    print("Finding closest neighbors...")
-    closest_distances = knn_clf.kneighbors(faces_encodings, n_neighbors=1)
-    
+    with STAGE_SECONDS.time(stage='match'):
+        return match_faces(gallery, faces_encodings, final_face_locations)
+
+def match_faces(gallery, faces_encodings, face_locations):
+    """1-NN match against the gallery and format predictions."""
+    logger.debug("Finding closest neighbors...")
+    closest_labels, distances = gallery.nearest(faces_encodings)
+
     # Balanced threshold: 0.53 (more lenient than 0.48 to recognize tilted/different lighting faces, but tight enough for accuracy)
-    threshold = 0.53
-    are_matches = [closest_distances[0][i][0] <= threshold for i in range(len(faces_encodings))]
-    
+    # The threshold is stored in the model manifest (settings.RECOGNITION_THRESHOLD at build time).
+    threshold = gallery.threshold
+    are_matches = distances <= threshold
+    recognized = int(np.count_nonzero(are_matches))
+    FACES_MATCHED.inc(recognized, result='recognized')
+    FACES_MATCHED.inc(len(are_matches) - recognized, result='unknown')
+
+    # Display names come from the metadata stored with the gallery; only rolls
+    # missing from it (e.g. an imported legacy model) are looked up, in one query.
+    students_meta = gallery.students
+    missing = {str(l) for l, rec in zip(closest_labels, are_matches) if rec and str(l) not in students_meta}
+    if missing:
+        students_meta = {**students_meta, **get_student_display_metadata(missing)}
+
     predictions = []
-    distances = closest_distances[0]
-    
-    for i, (pred, loc, rec, dist) in enumerate(zip(knn_clf.predict(faces_encodings), final_face_locations, are_matches, distances)):
-        distance_val = round(dist[0], 2)
+
+    for i, (pred, loc, rec, dist) in enumerate(zip(closest_labels, face_locations, are_matches, distances)):
+        distance_val = round(float(dist), 2)
         if rec:
-            roll_number = pred
-            try:
-                student = Student.objects.get(roll_number=roll_number)
-                name = f"{student.name} ({distance_val})"
-            except Student.DoesNotExist:
+            roll_number = str(pred)
+            meta = students_meta.get(roll_number)
+            if meta:
+                name = f"{meta['name']} ({distance_val})"
+            else:
                 name = "Unknown"
                 roll_number = None
         else:
@@ -1,18 +1,24 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth import login, authenticate, logout
-from .models import Student, AttendanceRecord, TimeTable, TeacherSubject, Notification, AssessmentRequest, AccessoryRequest, TeacherProfile, StoreStaff, StoreRequest, StoreRequestItem, StoreNotification, CourseMaterial, StudentSubmission, LateSubmissionRequest, ClassCoordinator, StudentApplication, StudentNote
-from .utils import train_model, identify_faces, detect_and_crop_face, get_existing_attendance_record
+from .models import Student, AttendanceRecord, AttendanceSummary, CohortAttendanceSummary, TimeTable, TeacherSubject, Notification, AssessmentRequest, AccessoryRequest, TeacherProfile, StoreStaff, StoreRequest, StoreRequestItem, StoreNotification, CourseMaterial, StudentSubmission, LateSubmissionRequest, ClassCoordinator, StudentApplication, StudentNote, normalize_key, canonical_department, DEPARTMENT_CODES
+from .attendance_summary import apply_changes, batched_summaries, summary_row
+from .attendance_matrix import attendance_columns, attendance_pivot, column_faculty
+from .excel_export import new_workbook, styled, estimate_width, set_column_widths, xlsx_response
+from .utils import identify_faces, mark_class_attendance, detect_and_crop_face, get_existing_attendance_records, get_class_sessions, get_session_records
+from .training import request_training, poll_training_status
+from .metrics import registry as metrics_registry, timed, STAGE_SECONDS, REQUEST_SECONDS, ATTENDANCE_MARKED
 from django.conf import settings
 from django.core.files.storage import FileSystemStorage
 from django.core.files.base import ContentFile
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse, HttpResponseForbidden, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import user_passes_test
 from django.db import transaction
-from django.db.models import Q, Count
+from django.db.models import Q, Count, Sum
 import os
+import time
 import datetime
 import json
 import base64
@@ -21,6 +27,9 @@ from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
 import threading
+import logging
+
+logger = logging.getLogger(__name__)
 
 def is_admin(u):
     return getattr(u, 'is_superuser', False)
@@ -171,9 +180,8 @@ def register_activate(request):
         if success_count == 0:
             return JsonResponse({'status': 'error', 'message': 'No face could be detected in any of the captured images. Please capture again in a well-lit room.'})
             
-        train_success, train_msg = train_model()
-        if not train_success:
-            print(f"Model training failed: {train_msg}")
+        # Model rebuild runs in the background; the client can poll training_status
+        training = request_training(f"register {student.roll_number}")
             
         student.is_registered = True
         student.save()
@@ -183,7 +191,8 @@ def register_activate(request):
         
         return JsonResponse({
             'status': 'ok',
-            'message': f'Account activated successfully! {success_count} face photos processed and model trained.'
+            'model_status': training['state'],
+            'message': f'Account activated successfully! {success_count} face photos processed. Model update pending.'
         })
 
     return JsonResponse({'status': 'error', 'message': 'GET method not supported.'})
@@ -223,11 +232,8 @@ def home(request):
 
 def train(request):
     if request.method == 'POST':
-        success, msg = train_model()
-        if success:
-            messages.success(request, msg)
-        else:
-            messages.error(request, msg)
+        request_training("manual retrain")
+        messages.success(request, "Model update queued. It will be rebuilt in the background shortly.")
     if request.user.is_authenticated:
         if request.user.is_superuser:
             return redirect('admin_dashboard')
@@ -237,6 +243,47 @@ def train(request):
             return redirect('student_dashboard')
     return redirect('login')
 
+@user_passes_test(is_admin)
+def recognition_cache_stats(request):
+    """API: hit/miss counters of this worker's recognition result cache."""
+    from .recognition_cache import recognition_cache
+    return JsonResponse({'status': 'success', 'cache': recognition_cache.stats()})
+
+@login_required
+def training_status(request):
+    """API polled by the UI while a background model build is pending/running."""
+    return JsonResponse({'status': 'success', 'training': poll_training_status()})
+
+def metrics(request):
+    """
+    Recognition metrics of this worker in Prometheus text format (?format=json
+    for JSON). Open to admins and to scrapers sending
+    "Authorization: Bearer <METRICS_TOKEN>". The client address is not
+    trusted: behind the reverse proxy every request comes from 127.0.0.1.
+    """
+    import hmac
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    scheme, _, credentials = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    authorized = bool(token) and scheme.lower() == 'bearer' and hmac.compare_digest(credentials.strip(), token)
+    if not authorized and not is_admin(request.user):
+        return HttpResponseForbidden("Forbidden")
+    if request.GET.get('format') == 'json':
+        data = metrics_registry.to_dict()
+        data['pid'] = os.getpid()
+        return JsonResponse(data)
+    return HttpResponse(metrics_registry.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@user_passes_test(is_admin)
+def profiling_summary(request):
+    """Per-view wall time / SQL summary of the profiling log (all workers)."""
+    from .profiling import read_log, summarize
+    summary = summarize(read_log())
+    return render(request, 'profiling_summary.html', {
+        'summary': summary,
+        'enabled': getattr(settings, 'PROFILING_ENABLED', False),
+        'log_path': settings.PROFILING_LOG_PATH,
+    })
+
 @login_required
 def take_attendance_selector(request):
     if not request.user.is_staff:
@@ -247,6 +294,7 @@ def take_attendance_selector(request):
     return render(request, 'take_attendance_selector.html', {'assigned_classes': assigned_classes})
 
 @login_required
+@timed(REQUEST_SECONDS, view='upload_attendance')
 def upload_attendance(request):
     # Get params
     subject = request.GET.get('subject') or request.POST.get('subject')
@@ -267,146 +315,58 @@ def upload_attendance(request):
         
         predictions = identify_faces(file_path)
         
-        marked_count = 0
-        unknown_count = 0
-        absent_count = 0
-        
-        checked_rolls = set()
-        present_roll_numbers = set()
-        final_predictions = []
-        
-        today = datetime.date.today()
-        
-        # 1. Process Detected Faces (Mark Present)
-        for pred in predictions:
-            roll_number = pred['roll_number']
-            if roll_number:
-                present_roll_numbers.add(roll_number)
-                
-                # Deduplication: Check if we already processed this student in this frame
-                if roll_number in checked_rolls:
-                    continue
-                
-                checked_rolls.add(roll_number)
-                
-                try:
-                    student = Student.objects.get(roll_number=roll_number)
-                    
-                    # Verify student belongs to this year/section
-                    if year and str(student.year) != str(year):
-                        pred['status'] = f"Wrong Year ({student.year})"
-                        final_predictions.append(pred)
-                        continue
-                    if section and str(student.section).lower() != str(section).lower():
-                        pred['status'] = f"Wrong Section ({student.section})"
-                        final_predictions.append(pred)
-                        continue
-                    # Verify student belongs to this department/branch if section is a department code
-                    dept_codes = ['CSE', 'IT', 'ECE', 'EE', 'ME', 'CE', 'AIDS', 'AIML']
-                    if section and section.upper() in dept_codes:
-                        if not student.department or section.lower() not in student.department.lower():
-                            pred['status'] = f"Wrong Branch ({student.department})"
-                            final_predictions.append(pred)
-                            continue
-                        
-                    status_text = "Marked Present"
-                    if subject:
-                         status_text += f" ({subject})"
-                    
-                    can_mark = True
-                    
-                    if subject:
-                         # Use unified helper for duplicate check
-                         # Fix: Use local time for check matching TimeTable slots
-                         existing_record = get_existing_attendance_record(student, subject, today, datetime.datetime.now().time())
-                         
-                         if existing_record:
-                             if existing_record.status == 'Absent':
-                                 existing_record.status = 'Present'
-                                 existing_record.save()
-                                 status_text = f"Marked Present (Was Absent) - ({subject})"
-                                 marked_count += 1
-                                 can_mark = False # Handled update
-                             else:
-                                 can_mark = False
-                                 status_text = f"Already Marked Present ({subject})"
-                    else:
-                        # Fallback Global Cooldown
-                        last_attendance = AttendanceRecord.objects.filter(student=student).order_by('-date', '-time').first()
-                        if last_attendance:
-                            last_datetime_naive = datetime.datetime.combine(last_attendance.date, last_attendance.time)
-                            if timezone.is_naive(last_datetime_naive):
-                                last_datetime = timezone.make_aware(last_datetime_naive, timezone.get_current_timezone())
-                            else:
-                                last_datetime = last_datetime_naive
-                                
-                            time_diff = timezone.now() - last_datetime
-                            if time_diff.total_seconds() < 3600 and last_attendance.status == 'Present':
-                                can_mark = False
-                                status_text = f"Already Marked ({int(time_diff.total_seconds() // 60)}m ago)"
-
-                    if can_mark:
-                         AttendanceRecord.objects.create(student=student, subject=subject, status='Present')
-                         marked_count += 1
-                         
-                    pred['status'] = status_text
-                    
-                except Student.DoesNotExist:
-                    print(f"DEBUG: Student with roll number {roll_number} not found in DB.")
-                    pred['status'] = 'Student Not Found'
-                    pass
-            else:
-                unknown_count += 1
-                pred['status'] = 'Unknown'
-            
-            final_predictions.append(pred)
-
-        # 2. Process Missing Students (Auto-Absent) - ONLY if Subject is defined (Class Mode)
-        # CRITICAL FIX: Only fetch students for this specific YEAR (and section)
-        if subject and year:
-            filter_kwargs = {'year': year}
-            if section:
-                filter_kwargs['section'] = section
-                
-            class_students = Student.objects.filter(**filter_kwargs)
-            # If section name is a department code, ensure student's department also matches to avoid cross-branch matching
-            dept_codes = ['CSE', 'IT', 'ECE', 'EE', 'ME', 'CE', 'AIDS', 'AIML']
-            if section and section.upper() in dept_codes:
-                class_students = class_students.filter(department__icontains=section)
-            
-            for student in class_students:
-                if student.roll_number not in present_roll_numbers:
-                    # Check if recent record exists
-                    recent_exists = False
-                    cutoff_time = timezone.now() - datetime.timedelta(minutes=60)
-                    recs = AttendanceRecord.objects.filter(student=student, date=today, subject=subject)
-                    for r in recs:
-                        dt_n = datetime.datetime.combine(r.date, r.time)
-                        if timezone.is_naive(dt_n):
-                            dt_a = timezone.make_aware(dt_n, timezone.get_current_timezone())
-                        else:
-                            dt_a = dt_n
-                        if dt_a > cutoff_time:
-                            recent_exists = True
-                            break
-                            
-                    if not recent_exists:
-                         AttendanceRecord.objects.create(student=student, subject=subject, status='Absent')
-                         absent_count += 1
-                
+        final_predictions, marked_count, absent_count, unknown_count = mark_class_attendance(
+            predictions, subject, year, section)
+        ATTENDANCE_MARKED.inc(marked_count, view='upload_attendance', status='present')
+        ATTENDANCE_MARKED.inc(absent_count, view='upload_attendance', status='absent')
         messages.success(request, f"Present: {marked_count}, Absent: {absent_count}, Unknown: {unknown_count}")
         return render(request, 'attendance_result.html', {'predictions': final_predictions, 'image_url': fs.url(filename)})
         
     return render(request, 'upload_attendance.html', {'subject': subject, 'year': year, 'section': section})
 
+def _attendance_page(request, records):
+    """
+    One newest-first page of `records` filtered by the request's from/to/branch/
+    year/section/subject, after its ?cursor=. Template context with query
+    strings (filters kept) for the first and next page; ValueError on bad input.
+    """
+    from .attendance_export import filter_records, decode_cursor, keyset_page
+    cursor = decode_cursor(request.GET['cursor']) if request.GET.get('cursor') else None
+    page, next_cursor = keyset_page(filter_records(records, request.GET), cursor)
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    first_query = params.urlencode()
+    next_query = None
+    if next_cursor:
+        params['cursor'] = next_cursor
+        next_query = params.urlencode()
+    return {
+        'records': page,
+        'filters': {name: request.GET.get(name, '') for name in ('from', 'to', 'branch', 'year', 'section', 'subject')},
+        'is_first_page': cursor is None,
+        'first_query': first_query,
+        'next_query': next_query,
+    }
+
 def attendance_list(request):
-    records = AttendanceRecord.objects.all().order_by('-date', '-time')
-    return render(request, 'attendance_list.html', {'records': records})
+    try:
+        context = _attendance_page(request, AttendanceRecord.objects.select_related('student'))
+    except ValueError:
+        messages.error(request, "Invalid filter or page.")
+        return redirect(request.path)
+    return render(request, 'attendance_list.html', context)
 
 def student_attendance(request, student_id):
     student = get_object_or_404(Student, id=student_id)
-    records = AttendanceRecord.objects.filter(student=student).order_by('-date')
-    return render(request, 'student_attendance.html', {'student': student, 'records': records})
+    try:
+        context = _attendance_page(request, AttendanceRecord.objects.filter(student=student))
+    except ValueError:
+        messages.error(request, "Invalid filter or page.")
+        return redirect(request.path)
+    # Total from the attendance summary rather than counting the student's history
+    context['total_records'] = student.attendance_summaries.aggregate(total=Sum('total'))['total'] or 0
+    context['student'] = student
+    return render(request, 'student_attendance.html', context)
 
 @login_required
 def manual_attendance(request):
@@ -418,13 +378,12 @@ def manual_attendance(request):
     # Fetch students for this class
     students = Student.objects.none()
     if year:
-        students = Student.objects.filter(year__icontains=year)
+        students = Student.objects.filter(year_key=normalize_key(year))
         if section:
-            students = students.filter(section__icontains=section)
+            students = students.filter(section_key=normalize_key(section))
             # If section name is a department code, ensure student's department also matches to avoid cross-branch matching
-            dept_codes = ['CSE', 'IT', 'ECE', 'EE', 'ME', 'CE', 'AIDS', 'AIML']
-            if section.upper() in dept_codes:
-                students = students.filter(department__icontains=section)
+            if section.upper() in DEPARTMENT_CODES:
+                students = students.filter(department_key=canonical_department(section))
         students = students.order_by('roll_number')
 
     if request.method == 'POST':
@@ -451,44 +410,60 @@ def manual_attendance(request):
                 pass # Fallback to now
         
         with transaction.atomic():
-            for student in students:
-                # Lock the student row to prevent race conditions (double submission)
-                # We simply fetch it with lock; we can continue using the loop variable 'student' or the locked instance.
-                # Since 'student' variable is already populated, we just hold the lock.
-                Student.objects.select_for_update().get(id=student.id)
-                
+            # Lock the class's student rows in one query to prevent race conditions (double submission)
+            class_students = list(students.select_for_update())
+            # This lecture's session per cohort and the class's records in it; use provided time or current time for reference
+            sessions = get_class_sessions(
+                {(s.year_key, s.section_key): (s.year, s.section) for s in class_students}, subject, date_obj, current_time, create=True
+            )
+            existing = get_session_records(sessions.values(), [s.id for s in class_students])
+
+            to_update = []
+            to_create = []
+            replaced_rows, updated_rows = [], []  # summary rows of the records in to_update before and after
+            notifications = []
+            for student in class_students:
                 is_present = str(student.id) in present_student_ids
                 status = 'Present' if is_present else 'Absent'
-            
-                # Unified lookup
-                # Use provided time or current time for reference
-                ref_time = current_time
-                record = get_existing_attendance_record(student, subject, date_obj, ref_time)
 
+                record = existing.get(student.id)
                 if record:
                     # Update existing
+                    replaced_rows.append(summary_row(record, student))
                     record.status = status
                     # Update time if beneficial, or keep original?
                     # If we are "correcting" a record, we might keep time. If we are explicitly setting time, we set it.
                     if time_str:
                          record.time = current_time
-                    record.save()
-                    create_notification(student, f"Attendance updated: {status} for {subject} on {date_obj} at {current_time.strftime('%H:%M')}")
+                    to_update.append(record)
+                    updated_rows.append(summary_row(record, student))
+                    message = f"Attendance updated: {status} for {subject} on {date_obj} at {current_time.strftime('%H:%M')}"
                 else:
                     # Create new
-                    AttendanceRecord.objects.create(
+                    to_create.append(AttendanceRecord(
                         student=student,
+                        session=sessions.get((student.year_key, student.section_key)),
                         date=date_obj,
                         subject=subject,
+                        subject_key=normalize_key(subject),
                         status=status,
                         time=current_time
-                    )
-                    create_notification(student, f"Attendance marked: {status} for {subject} on {date_obj} at {current_time.strftime('%H:%M')}")
-            
+                    ))
+                    message = f"Attendance marked: {status} for {subject} on {date_obj} at {current_time.strftime('%H:%M')}"
+                notifications.append(Notification(recipient=student, message=message, notification_type='Attendance'))
+
                 if is_present:
                     count_present += 1
                 else:
                     count_absent += 1
+
+            AttendanceRecord.objects.bulk_update(to_update, ['status', 'time'])
+            AttendanceRecord.objects.bulk_create(to_create)
+            apply_changes(
+                removed=replaced_rows,
+                added=updated_rows + [summary_row(r, r.student) for r in to_create],
+            )
+            Notification.objects.bulk_create(notifications)
             
         messages.success(request, f"Attendance marked for {subject}: {count_present} Present, {count_absent} Absent.")
         return redirect('teacher_dashboard')
@@ -504,37 +479,16 @@ def manual_attendance(request):
     if default_time:
          try:
             query_time = datetime.datetime.strptime(default_time, '%H:%M').time()
-            cutoff_start = datetime.datetime.combine(datetime.date.today(), query_time) - datetime.timedelta(minutes=20)
-            cutoff_end = datetime.datetime.combine(datetime.date.today(), query_time) + datetime.timedelta(minutes=20)
-            
-            if timezone.is_aware(timezone.now()):
-                 cutoff_start = timezone.make_aware(cutoff_start)
-                 cutoff_end = timezone.make_aware(cutoff_end)
-            
-            existing_records = AttendanceRecord.objects.filter(
-                subject=subject, 
-                date=datetime.date.today()
-            )
-            
-            # Filter in python or complex query for time range
-            # Since we removed auto_now_add, we trust the time field more.
-            # Let's find records in the window.
-            matched_records = []
-            for r in existing_records:
-                dt_naive = datetime.datetime.combine(r.date, r.time)
-                if timezone.is_aware(timezone.now()):
-                    dt_check = timezone.make_aware(dt_naive, timezone.get_current_timezone())
-                else:
-                    dt_check = dt_naive
-                
-                if cutoff_start <= dt_check <= cutoff_end:
-                    matched_records.append(r)
+            # Records of this class in the lecture (session) covering the requested time
+            matched_records = get_existing_attendance_records(
+                list(students), subject, datetime.date.today(), query_time
+            ).values()
             
             if matched_records:
                 attendance_marked = True
                 for r in matched_records:
                     if r.status == 'Present':
-                        present_student_ids.append(r.student.id)
+                        present_student_ids.append(r.student_id)
 
          except ValueError:
              pass
@@ -561,6 +515,7 @@ def live_attendance(request):
     })
 
 @csrf_exempt
+@timed(REQUEST_SECONDS, view='process_live_frame')
 def process_live_frame(request):
     import cv2
     import numpy as np
@@ -574,12 +529,13 @@ def process_live_frame(request):
             req_year = data.get('year')
             req_section = data.get('section')
             
-            print(f"Received live frame request. params: {req_subject}, {req_year}, {req_section}")
+            logger.debug("Live frame request: subject=%s year=%s section=%s", req_subject, req_year, req_section)
             
             if not image_data:
-                print("No image data received")
                 return JsonResponse({'status': 'error', 'message': 'No image data'})
 
+            decode_started = time.perf_counter()
+
             # Decode base64
             if ';base64,' in image_data:
                 format, imgstr = image_data.split(';base64,') 
@@ -589,7 +545,7 @@ def process_live_frame(request):
             try:
                 img_bytes = base64.b64decode(imgstr)
             except Exception as e:
-                print(f"Base64 decode error: {e}")
+                logger.warning("Live frame base64 decode error: %s", e)
                 return JsonResponse({'status': 'error', 'message': 'Invalid base64 data'})
             
             # Convert to numpy array
@@ -597,15 +553,15 @@ def process_live_frame(request):
             img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
             
             if img is None:
-                 print("Failed to decode image from numpy array")
+                 logger.warning("Failed to decode live frame image")
                  return JsonResponse({'status': 'error', 'message': 'Failed to decode image'})
 
             # Convert BGR to RGB (face_recognition uses RGB)
             rgb_img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+            STAGE_SECONDS.observe(time.perf_counter() - decode_started, stage='decode')
             
-            print("Calling identify_faces...")
             predictions = identify_faces(image_content=rgb_img)
-            print(f"Predictions: {predictions}")
+            logger.debug("Predictions: %s", predictions)
             
             if req_subject:
                 # Explicit mode
@@ -647,90 +603,91 @@ def process_live_frame(request):
             
             # Deduplication for this frame
             processed_rolls_in_frame = set()
+            recognized_rolls = list({pred['roll_number'] for pred in predictions if pred['roll_number']})
             
-            for pred in predictions:
-                status_msg = ""
-                roll_number = pred['roll_number']
+            # ATOMIC BLOCK START: Lock all recognized students in one query to prevent race condition duplicates;
+            # the frame's new records update the attendance summaries once, when the block ends
+            with STAGE_SECONDS.time(stage='db_mark'), transaction.atomic(), batched_summaries():
+                students_by_roll = Student.objects.select_for_update().in_bulk(recognized_rolls, field_name='roll_number')
+                # This lecture's sessions and every recognized student's record in them, in two queries;
+                # missing sessions are only created once someone is actually marked
+                today = datetime.date.today()
+                sessions = get_class_sessions(
+                    {(s.year_key, s.section_key) for s in students_by_roll.values()}, current_subject, today, current_time
+                )
+                existing_by_student = get_session_records(sessions.values(), [s.id for s in students_by_roll.values()])
                 
-                if roll_number:
-                     # Check if we already processed this student in this frame
-                    if roll_number in processed_rolls_in_frame:
-                        continue # Skip duplicate
-                    else:
-                        processed_rolls_in_frame.add(roll_number)
-                        try:
-                            # ATOMIC BLOCK START: Lock student to prevent race condition duplicates
-                            with transaction.atomic():
-                                student = Student.objects.select_for_update().get(roll_number=roll_number)
-                                
+                for pred in predictions:
+                    status_msg = ""
+                    roll_number = pred['roll_number']
+                    
+                    if roll_number:
+                         # Check if we already processed this student in this frame
+                        if roll_number in processed_rolls_in_frame:
+                            continue # Skip duplicate
+                        else:
+                            processed_rolls_in_frame.add(roll_number)
+                            student = students_by_roll.get(roll_number)
+                            if student is None:
+                                status_msg = "Student Not Found"
+                            else:
                                 # Validate logic if year/section provided
                                 if req_year:
-                                    if str(student.year) != str(req_year):
+                                    if student.year_key != normalize_key(req_year):
                                         continue # Skip wrong year
                                 if req_section:
-                                    if str(student.section).lower() != str(req_section).lower():
+                                    if student.section_key != normalize_key(req_section):
                                         continue # Skip wrong section
                                     
                                     # Verify student belongs to this department/branch if section is a department code
-                                    dept_codes = ['CSE', 'IT', 'ECE', 'EE', 'ME', 'CE', 'AIDS', 'AIML']
-                                    if req_section.upper() in dept_codes:
-                                        if not student.department or req_section.lower() not in student.department.lower():
+                                    if req_section.upper() in DEPARTMENT_CODES:
+                                        if student.department_key != canonical_department(req_section):
                                             continue # Skip wrong branch/department
                                         
                                 can_mark = True
                                 
-                                if req_subject:
-                                     # Explicit Subject Mode (Dashboard)
-                                     # Use unified helper
-                                     existing_record = get_existing_attendance_record(student, req_subject, datetime.date.today(), current_time)
-                                     
-                                     if existing_record:
-                                         can_mark = False
-                                         status_msg = f"Already Marked ({existing_record.time.strftime('%H:%M')})"
-                                else:
-                                    # Fallback / Timetable Mode (Auto-detect)
-                                    # Use Global Cooldown (1 hour) to prev spam
-                                    last_attendance = AttendanceRecord.objects.filter(student=student).order_by('-date', '-time').first()
-                                    if last_attendance:
-                                        last_datetime_naive = datetime.datetime.combine(last_attendance.date, last_attendance.time)
-                                        if timezone.is_aware(timezone.now()):
-                                             last_datetime = timezone.make_aware(last_datetime_naive, datetime.timezone.utc)
-                                        else:
-                                             last_datetime = last_datetime_naive
-                                        
-                                        time_diff = timezone.now() - last_datetime
-                                        if time_diff.total_seconds() < 3600:
-                                            can_mark = False
-                                            status_msg = f"Already Marked ({int(time_diff.total_seconds() // 60)}m ago)"
+                                # Explicit subject or timetable mode alike: one record per student per session
+                                existing_record = existing_by_student.get(student.id)
+                                if existing_record:
+                                    can_mark = False
+                                    status_msg = f"Already Marked ({existing_record.time.strftime('%H:%M')})"
                                 
                                 if can_mark:
                                     try:
-                                        AttendanceRecord.objects.create(student=student, subject=current_subject, time=current_time)
+                                        cohort = (student.year_key, student.section_key)
+                                        if cohort not in sessions:
+                                            sessions.update(get_class_sessions(
+                                                {cohort: (student.year, student.section)}, current_subject, today, current_time, create=True
+                                            ))
+                                        # Savepoint so a failed insert (unique_session_student) doesn't abort the frame's transaction
+                                        with transaction.atomic():
+                                            AttendanceRecord.objects.create(
+                                                student=student, session=sessions[cohort], subject=current_subject, time=current_time
+                                            )
                                         create_notification(student, f"Marked Present for {current_subject} via Face ID")
                                         status_msg = f"Marked Present ({current_subject})"
+                                        ATTENDANCE_MARKED.inc(view='process_live_frame', status='present')
                                     except Exception as e:
                                          status_msg = f"Already Marked Today ({current_subject})"
-                                    
-                        except Student.DoesNotExist:
-                            status_msg = "Student Not Found"
-                else:
-                    status_msg = "Unknown"
-                
-                # Convert location tuple values from numpy.int32 to native Python int
-                loc = pred['location']
-                if loc is not None:
-                    loc = tuple(int(v) for v in loc)
-                results.append({
-                    'name': pred['name'],
-                    'roll_number': roll_number,
-                    'location': loc,
-                    'status': status_msg
-                })
+                                         ATTENDANCE_MARKED.inc(view='process_live_frame', status='duplicate')
+                    else:
+                        status_msg = "Unknown"
+                    
+                    # Convert location tuple values from numpy.int32 to native Python int
+                    loc = pred['location']
+                    if loc is not None:
+                        loc = tuple(int(v) for v in loc)
+                    results.append({
+                        'name': pred['name'],
+                        'roll_number': roll_number,
+                        'location': loc,
+                        'status': status_msg
+                    })
             
             return JsonResponse({'status': 'success', 'results': results})
             
         except Exception as e:
-            print(f"Error in process_live_frame: {e}")
+            logger.exception("Error in process_live_frame")
             return JsonResponse({'status': 'error', 'message': str(e)})
             
     return JsonResponse({'status': 'error', 'message': 'Invalid request'})
@@ -882,8 +839,8 @@ def add_student(request):
                             s.save()
                         except Exception as e:
                             print(f"Error updating student registration: {e}")
-                        train_model()
-                        print(f"Background: {count} faces processed, model retrained for student {student_id}.")
+                        request_training(f"add_student {student_id}")
+                        print(f"Background: {count} faces processed, model update queued for student {student_id}.")
                     else:
                         print(f"Background: only {count} faces found for student {student_id}. Model not retrained.")
                 except Exception as e:
@@ -899,7 +856,7 @@ def add_student(request):
             messages.success(
                 request,
                 f"✅ Student '{name}' added! {len(images)} photo(s) are being processed in the background. "
-                f"The model will retrain automatically once done."
+                f"The model will be updated automatically once done."
             )
         else:
             messages.success(request, f"✅ Student '{name}' account created. The student can register their face from their portal.")
@@ -913,9 +870,9 @@ def add_student(request):
 
 @user_passes_test(is_admin_or_staff)
 def download_attendance(request):
-    import openpyxl
-    from openpyxl.styles import Font
-    from django.http import HttpResponse
+    from openpyxl.styles import Font, NamedStyle
+    from django.db.models import Max
+    from django.db.models.functions import Length
 
     # Get filter parameters
     branch = request.GET.get('branch')
@@ -925,61 +882,99 @@ def download_attendance(request):
     # Fetch Data (Reuse logic)
     if branch and year and section:
         students = Student.objects.filter(
-            department__icontains=branch,
-            year__icontains=year,
-            section__icontains=section
+            department_key=canonical_department(branch),
+            year_key=normalize_key(year),
+            section_key=normalize_key(section)
         ).order_by('roll_number')
     else:
         students = Student.objects.none()
 
+    # Determine if user is a teacher and filter subjects
+    summary_filter = None
+    if not request.user.is_superuser and request.user.is_staff:
+        assigned_subjects = TeacherSubject.objects.filter(teacher=request.user).values_list('subject_key', flat=True)
+        summary_filter = Q(attendance_summaries__subject_key__in=assigned_subjects)
+
+    # Every row in one aggregate query over the attendance summary, streamed
+    rows = students.annotate(
+        record_count=Sum('attendance_summaries__total', filter=summary_filter),
+        present_total=Sum('attendance_summaries__present', filter=summary_filter),
+    ).values_list('roll_number', 'name', 'department', 'year', 'section', 'record_count', 'present_total')
+    lengths = students.aggregate(
+        roll_number=Max(Length('roll_number')), name=Max(Length('name')), department=Max(Length('department'))
+    )
+
     # Create Workbook
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    assert ws is not None
-    ws.title = "Attendance Report"
+    header_style = NamedStyle(name='report_header')
+    header_style.font = Font(bold=True)
+    wb, ws = new_workbook("Attendance Report", [header_style])
+    set_column_widths(ws, [
+        estimate_width(lengths['roll_number']),
+        estimate_width(lengths['name']),
+        estimate_width(lengths['department']),
+        8, 8, 14, 10, 14,
+    ])
 
     # Headers
     headers = ['Roll Number', 'Name', 'Department', 'Year', 'Section', 'Total Classes', 'Present', 'Attendance %']
-    ws.append(headers)
-
-    # Style Header
-    for cell in ws[1]:
-        cell.font = Font(bold=True)
-
-    # Determine if user is a teacher and filter subjects
-    assigned_subjects = None
-    if not request.user.is_superuser and request.user.is_staff:
-        assigned_subjects = TeacherSubject.objects.filter(teacher=request.user).values_list('subject', flat=True)
+    ws.append([styled(ws, header, 'report_header') for header in headers])
 
     # Add Data
-    for student in students:
-        records = AttendanceRecord.objects.filter(student=student)
-        if assigned_subjects is not None:
-            records = records.filter(subject__in=assigned_subjects)
-            
-        total_classes = records.count()
-        present_count = records.filter(status='Present').count()
+    for roll_number, name, department, student_year, student_section, total_classes, present_count in rows.iterator(chunk_size=2000):
+        total_classes = total_classes or 0
+        present_count = present_count or 0
         if total_classes > 0:
             percentage = round((present_count / total_classes) * 100, 1)
         else:
             percentage = 0
         
         ws.append([
-            student.roll_number,
-            student.name,
-            student.department,
-            student.year,
-            student.section,
+            roll_number,
+            name,
+            department,
+            student_year,
+            student_section,
             total_classes,
             present_count,
             f"{percentage}%"
         ])
 
-    # Create Response
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = f'attachment; filename="Attendance_Report_{branch}_{year}_{section}.xlsx"'
+    return xlsx_response(wb, f"Attendance_Report_{branch}_{year}_{section}.xlsx")
+
+@user_passes_test(is_admin_or_staff)
+def export_attendance_api(request):
+    """
+    API: attendance records as CSV (default) or JSON lines (?format=jsonl),
+    oldest first, filtered by from/to/branch/year/section/subject. Each row
+    ends with its cursor; ?cursor=<last one received> resumes after it and
+    ?limit=N stops after N rows. Teachers only get their assigned subjects.
+    """
+    from .attendance_export import filter_records, decode_cursor, export_rows, csv_lines, jsonl_lines
+
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in ('csv', 'jsonl'):
+        return JsonResponse({'status': 'error', 'message': 'format must be csv or jsonl'}, status=400)
+    try:
+        records = filter_records(AttendanceRecord.objects.all(), request.GET)
+        cursor = decode_cursor(request.GET['cursor']) if request.GET.get('cursor') else None
+        limit = int(request.GET['limit']) if request.GET.get('limit') else None
+        if limit is not None and limit < 1:
+            raise ValueError("limit must be positive")
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
 
-    wb.save(response)
+    if not request.user.is_superuser:
+        assigned_subjects = TeacherSubject.objects.filter(teacher=request.user).values_list('subject_key', flat=True)
+        records = records.filter(subject_key__in=assigned_subjects)
+
+    rows = export_rows(records, cursor=cursor, limit=limit)
+    if export_format == 'jsonl':
+        response = StreamingHttpResponse(jsonl_lines(rows), content_type='application/x-ndjson')
+        filename = 'attendance.jsonl'
+    else:
+        response = StreamingHttpResponse(csv_lines(rows), content_type='text/csv')
+        filename = 'attendance.csv'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
     return response
 
 @user_passes_test(is_admin_or_staff)
@@ -992,9 +987,9 @@ def manage_students(request):
     # Base QuerySet
     if branch and year and section:
          students = Student.objects.filter(
-            department__icontains=branch,
-            year__icontains=year,
-            section__icontains=section
+            department_key=canonical_department(branch),
+            year_key=normalize_key(year),
+            section_key=normalize_key(section)
         ).order_by('roll_number')
     else:
         # Default behavior if no filter found
@@ -1006,24 +1001,34 @@ def manage_students(request):
     # Determine if user is a teacher and filter subjects
     assigned_subjects = None
     if not request.user.is_superuser and request.user.is_staff:
-        assigned_subjects = TeacherSubject.objects.filter(teacher=request.user).values_list('subject', flat=True)
+        assigned_subjects = TeacherSubject.objects.filter(teacher=request.user).values_list('subject_key', flat=True)
 
-    # Calculate attendance for each student (common logic)
-    for student in students:
-        records = AttendanceRecord.objects.filter(student=student)
-        
-        cohort_records = AttendanceRecord.objects.filter(
-            student__department=student.department,
-            student__year=student.year,
-            student__section=student.section
+    # Present counts per student, annotated onto the student query
+    present_filter = None
+    cohort_summaries = CohortAttendanceSummary.objects.all()
+    if assigned_subjects is not None:
+        present_filter = Q(attendance_summaries__subject_key__in=assigned_subjects)
+        cohort_summaries = cohort_summaries.filter(subject_key__in=assigned_subjects)
+    students = students.annotate(present_total=Sum('attendance_summaries__present', filter=present_filter))
+
+    # Lectures held per cohort, computed once per cohort rather than once per student
+    if branch and year and section:
+        cohort_summaries = cohort_summaries.filter(
+            department_key=canonical_department(branch),
+            year_key=normalize_key(year),
+            section_key=normalize_key(section)
         )
+    cohort_lectures = {
+        (row['department_key'], row['year_key'], row['section_key']): row['lecture_count']
+        for row in cohort_summaries.values('department_key', 'year_key', 'section_key').annotate(
+            lecture_count=Sum('lectures')
+        ).order_by()
+    }
 
-        if assigned_subjects is not None:
-            records = records.filter(subject__in=assigned_subjects)
-            cohort_records = cohort_records.filter(subject__in=assigned_subjects)
-            
-        total_classes = cohort_records.values('date', 'time', 'subject').distinct().count()
-        present_count = records.filter(status='Present').count()
+    # Calculate attendance for each student (common logic)
+    for student in students:
+        total_classes = cohort_lectures.get((student.department_key, student.year_key, student.section_key), 0)
+        present_count = student.present_total or 0
         absent_count = total_classes - present_count
         
         if total_classes > 0:
@@ -1106,9 +1111,7 @@ def bulk_delete_students(request):
         messages.success(request, f"Successfully deleted {deleted_count} student(s).")
         # Retrain model if faces were removed
         if deleted_count > 0:
-            import threading
-            t = threading.Thread(target=train_model, daemon=True)
-            t.start()
+            request_training(f"bulk_delete {deleted_count}")
             
     return redirect('manage_students')
 
@@ -1437,38 +1440,22 @@ def student_dashboard(request):
     start_week = today - datetime.timedelta(days=today.weekday())
     end_week = start_week + datetime.timedelta(days=6)
     
-    # Calculate attendance stats
-    current_attendance_count = AttendanceRecord.objects.filter(student=student, status='Present').count()
-    
-    # Subject-wise Attendance Logic
-    all_records = AttendanceRecord.objects.filter(student=student)
-    subject_stats = {}
-    
-    for record in all_records:
-        # Use subject from record, default to "General" if None
-        subj = record.subject if record.subject else "General"
-        
-        if subj not in subject_stats:
-            subject_stats[subj] = {'present': 0, 'total': 0}
-            
-        subject_stats[subj]['total'] += 1
-        if record.status == 'Present':
-            subject_stats[subj]['present'] += 1
-            
+    # Subject-wise Attendance from the per-subject summary (one row per subject)
+    summaries = list(AttendanceSummary.objects.filter(student=student))
     subject_attendance = []
-    for subj, stats in subject_stats.items():
-        total = stats['total']
-        present = stats['present']
-        percentage = (present / total * 100) if total > 0 else 0
+    for summary in summaries:
+        percentage = (summary.present / summary.total * 100) if summary.total > 0 else 0
         subject_attendance.append({
-            'subject': subj,
-            'present': present,
-            'total': total,
+            # Records without a subject are grouped as "General"
+            'subject': summary.subject or "General",
+            'present': summary.present,
+            'total': summary.total,
             'percentage': round(percentage, 1)
         })
     
     # Overall Statistics
-    total_classes = all_records.count()
+    current_attendance_count = sum(summary.present for summary in summaries)
+    total_classes = sum(summary.total for summary in summaries)
     overall_percentage = (current_attendance_count / total_classes * 100) if total_classes > 0 else 0
     
     # Prediction Logic
@@ -1510,12 +1497,12 @@ def teacher_dashboard(request):
     # Filter by Year
     year_query = request.GET.get('year')
     if year_query:
-        assigned_classes = assigned_classes.filter(year__icontains=year_query)
+        assigned_classes = assigned_classes.filter(year_key=normalize_key(year_query))
         
     # Filter by Section
     section_query = request.GET.get('section')
     if section_query:
-        assigned_classes = assigned_classes.filter(section__icontains=section_query)
+        assigned_classes = assigned_classes.filter(section_key=normalize_key(section_query))
         
     # Calculate Stats for Dashboard
     # Total assigned classes
@@ -1529,13 +1516,12 @@ def teacher_dashboard(request):
     relevant_students_ids = set()
     
     for year, section in class_specs:
-        q = Student.objects.filter(year__icontains=year)
+        q = Student.objects.filter(year_key=normalize_key(year))
         if section:
-            q = q.filter(section__icontains=section)
+            q = q.filter(section_key=normalize_key(section))
             # If section name is a department code, ensure student's department also matches to avoid cross-branch matching
-            dept_codes = ['CSE', 'IT', 'ECE', 'EE', 'ME', 'CE', 'AIDS', 'AIML']
-            if section.upper() in dept_codes:
-                q = q.filter(department__icontains=section)
+            if section.upper() in DEPARTMENT_CODES:
+                q = q.filter(department_key=canonical_department(section))
         ids = q.values_list('id', flat=True)
         relevant_students_ids.update(ids)
         
@@ -1574,7 +1560,7 @@ def teacher_dashboard(request):
 
 @user_passes_test(is_admin)
 def manage_teacher_subjects(request):
-    subjects = TeacherSubject.objects.all().order_by('teacher__username', 'day')
+    subjects = TeacherSubject.objects.select_related('teacher').order_by('teacher__username', 'day')
     return render(request, 'manage_teacher_subjects.html', {'subjects': subjects})
 
 @user_passes_test(is_admin)
@@ -2843,14 +2829,25 @@ def resolve_late_request(request, request_id):
     return redirect('view_submissions', material_id=assignment.id)
 
 
-def depts_match(dept1, dept2):
-    """Return True if two department strings represent the same department.
-    Handles mismatches like 'CS' vs 'CSE' via two-way case-insensitive substring check."""
-    d1 = (dept1 or '').strip().upper()
-    d2 = (dept2 or '').strip().upper()
-    if not d1 or not d2:
-        return False
-    return d1 == d2 or d1 in d2 or d2 in d1
+def coordinator_students(coordinator):
+    """Students of a coordinator's class by department code, year and section.
+    Falls back to department + year when no student is recorded in that section."""
+    students = Student.objects.filter(department_key=coordinator.department_key, year_key=coordinator.year_key)
+    in_section = students.filter(section_key=coordinator.section_key)
+    if in_section.exists():
+        students = in_section
+    return students.order_by('roll_number')
+
+
+def find_class_coordinator(student):
+    """Coordinator for the student's department code and year, preferring their own section."""
+    coordinators = list(ClassCoordinator.objects.filter(
+        department_key=student.department_key, year_key=student.year_key
+    ).select_related('teacher'))
+    for coord in coordinators:
+        if coord.section_key == student.section_key:
+            return coord
+    return coordinators[0] if coordinators else None
 
 
 @login_required
@@ -2870,25 +2867,7 @@ def student_applications(request):
             messages.error(request, 'Title and description are required.')
         else:
             # Resolve coordinator
-            coordinator = ClassCoordinator.objects.filter(
-                department=student.department,
-                year=student.year,
-                section=student.section
-            ).first()
-            
-            if not coordinator:
-                # Fallback: match by year + section + fuzzy department
-                for coord in ClassCoordinator.objects.filter(year=student.year, section=student.section):
-                    if depts_match(coord.department, student.department):
-                        coordinator = coord
-                        break
-
-            if not coordinator:
-                # Last resort: match only by year + fuzzy department (ignore section)
-                for coord in ClassCoordinator.objects.filter(year=student.year):
-                    if depts_match(coord.department, student.department):
-                        coordinator = coord
-                        break
+            coordinator = find_class_coordinator(student)
 
             StudentApplication.objects.create(
                 student=student,
@@ -2905,23 +2884,7 @@ def student_applications(request):
             return redirect('student_applications')
 
     applications = StudentApplication.objects.filter(student=student)
-    coordinator = ClassCoordinator.objects.filter(
-        department=student.department,
-        year=student.year,
-        section=student.section
-    ).first()
-    
-    if not coordinator:
-        for coord in ClassCoordinator.objects.filter(year=student.year, section=student.section):
-            if depts_match(coord.department, student.department):
-                coordinator = coord
-                break
-
-    if not coordinator:
-        for coord in ClassCoordinator.objects.filter(year=student.year):
-            if depts_match(coord.department, student.department):
-                coordinator = coord
-                break
+    coordinator = find_class_coordinator(student)
 
     return render(request, 'student_portal/applications.html', {
         'student': student,
@@ -2949,33 +2912,20 @@ def coordinator_dashboard(request):
         current_coord = coordinators.first()
     assert current_coord is not None
 
-    # First try: exact year + section + fuzzy department match
-    students_qs = Student.objects.filter(year=current_coord.year, section=current_coord.section)
-    students_list = [s.id for s in students_qs if depts_match(current_coord.department, s.department)]
+    students = coordinator_students(current_coord)
 
-    # Fallback: if no students found with section filter, try year + fuzzy department only
-    if not students_list:
-        students_qs_fallback = Student.objects.filter(year=current_coord.year)
-        students_list = [s.id for s in students_qs_fallback if depts_match(current_coord.department, s.department)]
-
-    students = Student.objects.filter(id__in=students_list).order_by('roll_number')
-
-    applications = StudentApplication.objects.filter(student__in=students)
+    applications = StudentApplication.objects.filter(student__in=students).select_related('student')
     pending_applications_count = applications.filter(status='Pending').count()
 
-    # Attendance Matrix
-    records = AttendanceRecord.objects.filter(student__in=students)
-    attendance_cols = records.values_list('date', 'subject').distinct().order_by('-date', 'subject')[:30]
+    # Attendance Matrix: latest 30 (date, subject) columns, every status in one query
+    attendance_cols = attendance_columns(students, limit=30, newest_first=True)
+    pivot = attendance_pivot(students, attendance_cols)
 
     cols_headers = [{'date': date, 'subject': subject} for date, subject in attendance_cols]
 
     attendance_matrix = []
     for s in students:
-        s_records = { (r.date, r.subject): r.status for r in records.filter(student=s) }
-        statuses = []
-        for date, subject in attendance_cols:
-            status = s_records.get((date, subject), '-')
-            statuses.append(status)
+        statuses = pivot.get(s.id, ['-'] * len(attendance_cols))
         
         present_count = sum(1 for status in statuses if status == 'Present')
         total_count = sum(1 for status in statuses if status in ('Present', 'Absent'))
@@ -3011,17 +2961,10 @@ def coordinator_resolve_application(request, app_id):
     student = application.student
 
     # Find if the logged-in teacher is the coordinator for this student
-    coordinators = ClassCoordinator.objects.filter(teacher=request.user)
-    is_coordinator = False
-
-    for coord in coordinators:
-        year_matches = (coord.year == student.year)
-        dept_ok = depts_match(coord.department, student.department)
-        # Match if year + department match (section can differ due to naming inconsistencies)
-        section_matches = (coord.section == student.section) or dept_ok
-        if year_matches and dept_ok and section_matches:
-            is_coordinator = True
-            break
+    # (year + department code; section can differ due to naming inconsistencies)
+    is_coordinator = ClassCoordinator.objects.filter(
+        teacher=request.user, department_key=student.department_key, year_key=student.year_key
+    ).exists()
 
     if not is_coordinator:
         messages.error(request, 'Access denied. You are not the coordinator for this student.')
@@ -3046,10 +2989,8 @@ def coordinator_resolve_application(request, app_id):
 
 @login_required
 def export_coordinator_attendance_excel(request, coord_id):
-    import openpyxl
-    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side, NamedStyle
     from openpyxl.utils import get_column_letter
-    from django.http import HttpResponse
 
     if not request.user.is_staff and not request.user.is_superuser:
         messages.error(request, 'Access denied.')
@@ -3060,25 +3001,16 @@ def export_coordinator_attendance_excel(request, coord_id):
     else:
         coordinator = get_object_or_404(ClassCoordinator, id=coord_id, teacher=request.user)
 
-    students = Student.objects.filter(
-        year=coordinator.year,
-        section=coordinator.section
-    )
-    dept_codes = ['CSE', 'IT', 'ECE', 'EE', 'ME', 'CE', 'AIDS', 'AIML']
-    if coordinator.section and coordinator.section.upper() in dept_codes:
-        students = students.filter(department__icontains=coordinator.section)
+    # The class's year and section; a section named after a department code selects that department
+    students = Student.objects.filter(year_key=coordinator.year_key, section_key=coordinator.section_key)
+    if coordinator.section and coordinator.section.upper() in DEPARTMENT_CODES:
+        students = students.filter(department_key=canonical_department(coordinator.section))
     else:
-        students = students.filter(department__icontains=coordinator.department)
+        students = students.filter(department_key=coordinator.department_key)
     students = students.order_by('roll_number')
-
-    records = AttendanceRecord.objects.filter(student__in=students)
-    col_pairs = list(records.values_list('date', 'subject').distinct().order_by('date', 'subject'))
-
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    assert ws is not None
-    ws.title = "Attendance Sheet"
-    ws.views.sheetView[0].showGridLines = True
+    col_pairs = attendance_columns(students)
+    pivot = attendance_pivot(students, col_pairs)
+    faculty = column_faculty(col_pairs, coordinator.year, coordinator.section)
 
     thin_border = Border(
         left=Side(style='thin', color='D0D0D0'),
@@ -3087,11 +3019,49 @@ def export_coordinator_attendance_excel(request, coord_id):
         bottom=Side(style='thin', color='D0D0D0')
     )
 
-    max_col = max(3, 4 + len(col_pairs) - 1)
+    # Named styles, registered once per workbook instead of styling every cell
+    def cell_style(name, font, horizontal="center", fill=None, wrap_text=False):
+        style = NamedStyle(name=name, font=font, border=thin_border,
+                           alignment=Alignment(horizontal=horizontal, vertical="center", wrap_text=wrap_text))
+        if fill:
+            style.fill = PatternFill(start_color=fill, end_color=fill, fill_type="solid")
+        return style
+
+    header_fill = "F2F2F2"
+    wb, ws = new_workbook("Attendance Sheet", [
+        cell_style('title', Font(name="Calibri", size=13, bold=True, color="FFFFFF"), fill="5C59E8"),
+        cell_style('label', Font(name="Calibri", size=10, italic=True), horizontal="right"),
+        cell_style('label_bold', Font(name="Calibri", size=10, bold=True), horizontal="left"),
+        cell_style('plain', Font(name="Calibri", size=10)),
+        cell_style('plain_left', Font(name="Calibri", size=10), horizontal="left"),
+        cell_style('bold', Font(name="Calibri", size=10, bold=True)),
+        cell_style('subject', Font(name="Calibri", size=10, bold=True), wrap_text=True),
+        cell_style('header', Font(name="Calibri", size=11, bold=True), fill=header_fill),
+        cell_style('column_header', Font(name="Calibri", size=10, bold=True), fill=header_fill),
+        cell_style('present', Font(name="Calibri", size=10, bold=True, color="2E7D32"), fill="E8F5E9"),
+        cell_style('absent', Font(name="Calibri", size=10, bold=True, color="C62828"), fill="FFEBEE"),
+        cell_style('none', Font(name="Calibri", size=10, color="757575")),
+    ])
+
+    def cell(value, style='plain'):
+        return styled(ws, value, style)
+
+    first_col = 4
+    max_col = max(3, first_col + len(col_pairs) - 1)
+    date_labels = [date.strftime('%d/%m/%y %a') if date else "-" for date, _ in col_pairs]
+
+    # Widths and heights go out before the first row in write-only mode: estimated
+    # from the column headers (date, subject, faculty) rather than measured per cell
+    set_column_widths(ws, [8, 18, 25] + [
+        estimate_width(max(len(label), len(str(subject or '')), len(initials)))
+        for label, (_, subject), initials in zip(date_labels, col_pairs, faculty)
+    ])
+    ws.sheet_format.defaultRowHeight = 20
+    ws.sheet_format.customHeight = True
+    ws.row_dimensions[1].height = 40
+    ws.row_dimensions[4].height = 25
 
     # 1. Title Row (Row 1)
-    ws.merge_cells(start_row=1, start_column=1, end_row=1, end_column=max_col)
-    title_cell = ws.cell(row=1, column=1)
     YEAR_ROMAN = {1: 'I', 2: 'II', 3: 'III', 4: 'IV'}
     try:
         yr_val = int(coordinator.year)
@@ -3099,200 +3069,48 @@ def export_coordinator_attendance_excel(request, coord_id):
     except ValueError:
         roman_year = coordinator.year
 
-    title_cell.value = f"Sri Aurobindo Institute of Technology, Indore, {coordinator.department} dept. Attendance Record {roman_year} YEAR {coordinator.section}"
-    title_cell.font = Font(name="Calibri", size=13, bold=True, color="FFFFFF")
-    title_cell.fill = PatternFill(start_color="5C59E8", end_color="5C59E8", fill_type="solid")
-    title_cell.alignment = Alignment(horizontal="center", vertical="center")
-    ws.row_dimensions[1].height = 40
+    title = f"Sri Aurobindo Institute of Technology, Indore, {coordinator.department} dept. Attendance Record {roman_year} YEAR {coordinator.section}"
+    ws.append([cell(title, 'title')] + [cell(None, 'title') for _ in range(max_col - 1)])
+    ws.merged_cells.add(f"A1:{get_column_letter(max_col)}1")
 
-    for c in range(1, max_col + 1):
-        ws.cell(row=1, column=c).border = thin_border
-
-    # 2. Date Row (Row 2)
-    ws.cell(row=2, column=2).value = "Date------>"
-    ws.cell(row=2, column=2).font = Font(name="Calibri", size=10, italic=True)
-    ws.cell(row=2, column=2).alignment = Alignment(horizontal="right", vertical="center")
-    
-    current_date = None
-    start_col = 4
-    
-    for idx, (date, subject) in enumerate(col_pairs):
-        col_idx = 4 + idx
-        cell = ws.cell(row=2, column=col_idx)
-        date_str = date.strftime('%d/%m/%y %a') if date else "-"
-        cell.value = date_str
-        cell.alignment = Alignment(horizontal="center", vertical="center")
-        cell.font = Font(name="Calibri", size=10, bold=True)
-        
-        if current_date is None:
-            current_date = date
-            start_col = col_idx
-        elif date != current_date:
-            if col_idx - 1 > start_col:
-                ws.merge_cells(start_row=2, start_column=start_col, end_row=2, end_column=col_idx - 1)
-            current_date = date
-            start_col = col_idx
-
-    if len(col_pairs) > 0 and (4 + len(col_pairs) - 1) > start_col:
-        ws.merge_cells(start_row=2, start_column=start_col, end_row=2, end_column=4 + len(col_pairs) - 1)
+    # 2. Date Row (Row 2), consecutive lectures of one date merged
+    ws.append([cell(None), cell("Date------>", 'label'), cell(None)] + [cell(label, 'bold') for label in date_labels])
+    run_start = first_col
+    for idx in range(1, len(col_pairs) + 1):
+        if idx == len(col_pairs) or col_pairs[idx][0] != col_pairs[idx - 1][0]:
+            run_end = first_col + idx - 1
+            if run_end > run_start:
+                ws.merged_cells.add(f"{get_column_letter(run_start)}2:{get_column_letter(run_end)}2")
+            run_start = run_end + 1
 
     # 3. Lecture Row (Row 3)
-    ws.cell(row=3, column=2).value = "Lecture No ------>"
-    ws.cell(row=3, column=2).font = Font(name="Calibri", size=10, italic=True)
-    ws.cell(row=3, column=2).alignment = Alignment(horizontal="right", vertical="center")
-    
     lecture_counters = {}
-    for idx, (date, subject) in enumerate(col_pairs):
-        col_idx = 4 + idx
+    lecture_labels = []
+    for date, subject in col_pairs:
         lecture_counters[date] = lecture_counters.get(date, 0) + 1
-        cell = ws.cell(row=3, column=col_idx)
-        cell.value = f"L{lecture_counters[date]}"
-        cell.alignment = Alignment(horizontal="center", vertical="center")
-        cell.font = Font(name="Calibri", size=10)
+        lecture_labels.append(f"L{lecture_counters[date]}")
+    ws.append([cell(None), cell("Lecture No ------>", 'label'), cell(None)] + [cell(label) for label in lecture_labels])
 
     # 4. Subject Row (Row 4)
-    ws.cell(row=4, column=2).value = "SUBJECT"
-    ws.cell(row=4, column=2).font = Font(name="Calibri", size=10, bold=True)
-    ws.cell(row=4, column=2).alignment = Alignment(horizontal="left", vertical="center")
-    ws.cell(row=4, column=3).value = "------->"
-    ws.cell(row=4, column=3).alignment = Alignment(horizontal="center", vertical="center")
-    
-    for idx, (date, subject) in enumerate(col_pairs):
-        col_idx = 4 + idx
-        cell = ws.cell(row=4, column=col_idx)
-        cell.value = subject
-        cell.alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
-        cell.font = Font(name="Calibri", size=10, bold=True)
+    ws.append([cell(None), cell("SUBJECT", 'label_bold'), cell("------->")]
+              + [cell(subject, 'subject') for _, subject in col_pairs])
 
     # 5. Faculty Row (Row 5)
-    ws['B5'] = "FACULTY NAME"
-    ws['B5'].font = Font(name="Calibri", size=10, bold=True)
-    ws['B5'].alignment = Alignment(horizontal="left", vertical="center")
-    ws['C5'] = "------->"
-    ws['C5'].alignment = Alignment(horizontal="center", vertical="center")
-    
-    for idx, (date, subject) in enumerate(col_pairs):
-        col_idx = 4 + idx
-        cell = ws.cell(row=5, column=col_idx)
-        
-        initials = "-"
-        ts = TeacherSubject.objects.filter(
-            subject__iexact=subject,
-            year=coordinator.year,
-            section=coordinator.section
-        ).first()
-        if not ts:
-            ts = TeacherSubject.objects.filter(subject__iexact=subject).first()
-            
-        if ts and ts.teacher:
-            first = ts.teacher.first_name
-            last = ts.teacher.last_name
-            if first and last:
-                initials = f"{first[0].upper()}{last[0].upper()}"
-            elif first:
-                initials = first[:2].upper()
-            else:
-                initials = ts.teacher.username[:3].upper()
-                
-        cell.value = initials
-        cell.alignment = Alignment(horizontal="center", vertical="center")
-        cell.font = Font(name="Calibri", size=10)
+    ws.append([cell(None), cell("FACULTY NAME", 'label_bold'), cell("------->")]
+              + [cell(initials) for initials in faculty])
 
     # 6. Headers (Row 6)
-    ws['A6'] = "S.No."
-    ws['B6'] = "Enrollment_No"
-    ws['C6'] = "Student_Name"
-    
-    header_fill = PatternFill(start_color="F2F2F2", end_color="F2F2F2", fill_type="solid")
-    for cell_ref in ['A6', 'B6', 'C6']:
-        cell = ws[cell_ref]
-        cell.font = Font(name="Calibri", size=11, bold=True)
-        cell.alignment = Alignment(horizontal="center", vertical="center")
-        cell.fill = header_fill
-        
-    for idx, (date, subject) in enumerate(col_pairs):
-        col_idx = 4 + idx
-        cell = ws.cell(row=6, column=col_idx)
-        cell.value = idx + 1
-        cell.alignment = Alignment(horizontal="center", vertical="center")
-        cell.font = Font(name="Calibri", size=10, bold=True)
-        cell.fill = header_fill
-
-    for r in range(2, 7):
-        for c in range(1, max_col + 1):
-            ws.cell(row=r, column=c).border = thin_border
+    ws.append([cell("S.No.", 'header'), cell("Enrollment_No", 'header'), cell("Student_Name", 'header')]
+              + [cell(idx + 1, 'column_header') for idx in range(len(col_pairs))])
 
     # 7. Student rows (Row 7+)
-    fill_present = PatternFill(start_color="E8F5E9", end_color="E8F5E9", fill_type="solid")
-    font_present = Font(name="Calibri", size=10, bold=True, color="2E7D32")
-    fill_absent = PatternFill(start_color="FFEBEE", end_color="FFEBEE", fill_type="solid")
-    font_absent = Font(name="Calibri", size=10, bold=True, color="C62828")
-    font_none = Font(name="Calibri", size=10, color="757575")
-
-    for s_idx, s in enumerate(students):
-        row_idx = 7 + s_idx
-        
-        c_sno = ws.cell(row=row_idx, column=1, value=s_idx + 1)
-        c_sno.alignment = Alignment(horizontal="center", vertical="center")
-        
-        c_roll = ws.cell(row=row_idx, column=2, value=s.roll_number)
-        c_roll.alignment = Alignment(horizontal="center", vertical="center")
-        
-        c_name = ws.cell(row=row_idx, column=3, value=s.name)
-        c_name.alignment = Alignment(horizontal="left", vertical="center")
-        
-        for c in [c_sno, c_roll, c_name]:
-            c.font = Font(name="Calibri", size=10)
-            c.border = thin_border
-            
-        s_records = { (r.date, r.subject): r.status for r in records.filter(student=s) }
-        
-        for col_i, (date, subject) in enumerate(col_pairs):
-            col_idx = 4 + col_i
-            status = s_records.get((date, subject), '-')
-            
-            cell = ws.cell(row=row_idx, column=col_idx)
-            cell.border = thin_border
-            cell.alignment = Alignment(horizontal="center", vertical="center")
-            
-            if status == 'Present':
-                cell.value = 1
-                cell.fill = fill_present
-                cell.font = font_present
-            elif status == 'Absent':
-                cell.value = 0
-                cell.fill = fill_absent
-                cell.font = font_absent
-            else:
-                cell.value = '-'
-                cell.font = font_none
-
-    for col in ws.columns:
-        max_len = 0
-        col_letter = get_column_letter(col[0].column)
-        for cell in col:
-            if cell.row == 1:
-                continue
-            if cell.value:
-                max_len = max(max_len, len(str(cell.value)))
-        ws.column_dimensions[col_letter].width = max(max_len + 4, 12)
-        
-    ws.column_dimensions['A'].width = 8
-    ws.column_dimensions['B'].width = 18
-    ws.column_dimensions['C'].width = 25
-    
-    ws.row_dimensions[2].height = 20
-    ws.row_dimensions[3].height = 20
-    ws.row_dimensions[4].height = 25
-    ws.row_dimensions[5].height = 20
-    ws.row_dimensions[6].height = 20
-    
-    for r in range(7, 7 + len(students)):
-        ws.row_dimensions[r].height = 20
+    marks = {'Present': (1, 'present'), 'Absent': (0, 'absent')}
+    empty_row = ['-'] * len(col_pairs)
+    rows = students.values_list('id', 'roll_number', 'name')
+    for s_idx, (student_id, roll_number, name) in enumerate(rows.iterator(chunk_size=2000)):
+        ws.append([cell(s_idx + 1), cell(roll_number), cell(name, 'plain_left')] + [
+            cell(*marks.get(status, ('-', 'none'))) for status in pivot.get(student_id, empty_row)
+        ])
 
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
     filename = f"attendance_{coordinator.department}_{coordinator.year}_{coordinator.section}.xlsx"
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    
-    wb.save(response)
-    return response
+    return xlsx_response(wb, filename)
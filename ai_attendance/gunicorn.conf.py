@@ -0,0 +1,25 @@
+"""
+Gunicorn settings.
+
+    gunicorn -c gunicorn.conf.py ai_attendance.wsgi
+
+The app is preloaded in the master and the current face gallery is mapped
+there before workers are forked. The gallery arrays are read-only, file-backed
+mmaps (see core/model_store.py), so all workers share the same physical pages;
+adding workers does not multiply gallery memory. New model versions published
+by the trainer are picked up by each worker via the shared generation counter.
+"""
+import os
+import multiprocessing
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+preload_app = True
+
+
+def when_ready(server):
+    from core.model_store import get_gallery
+    gallery = get_gallery()
+    if gallery is not None:
+        server.log.info(f"Face gallery {gallery.version} mapped ({len(gallery)} faces)")
@@ -7,9 +7,15 @@ Covers three evaluation axes:
   1. Classification  -> Accuracy, Precision, Recall, F1, Confusion Matrix
   2. Verification    -> ROC Curve, AUC, EER, FAR / FRR
   3. Embedding       -> RMSE, Cosine Similarity, Euclidean Distance
+plus runtime (match latency, model load time, gallery memory).
 
 Run from the project root:
     python evaluate_model.py
+    python evaluate_model.py --update-baseline   # accept current metrics
+
+Metrics are written to evaluation_output/metrics.json and metrics.csv. If
+evaluation_baseline.json exists, the script exits with status 1 when any
+metric regresses beyond its tolerance (see REGRESSION_TOLERANCES).
 
 Requirements (already in requirements.txt):
     face_recognition, scikit-learn, numpy, opencv-python
@@ -18,15 +24,19 @@ Requirements (already in requirements.txt):
 
 import sys
 import io
-# Force UTF-8 on Windows console to avoid cp1252 errors
-sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8", errors="replace")
+if __name__ == "__main__":
+    # Force UTF-8 on Windows console to avoid cp1252 errors (not when imported, e.g. by core.tests)
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8", errors="replace")
 
 import os
+import json
+import time
 import pickle
+import argparse
 import warnings
 import numpy as np
 from pathlib import Path
-from itertools import combinations
+from concurrent.futures import ProcessPoolExecutor
 
 warnings.filterwarnings("ignore")
 
@@ -60,11 +70,67 @@ except ImportError:
 ROOT         = Path(__file__).parent
 DATASET_ROOT = ROOT / "database" / "dataset"
 MODEL_PATH   = ROOT / "database" / "model.pkl"
+MODEL_DIR    = ROOT / "database" / "models"
+BASELINE_PATH = ROOT / "evaluation_baseline.json"
 CACHE_PATH   = ROOT / "ai_attendance" / "encodings_cache.pkl"
 OUTPUT_DIR   = ROOT / "evaluation_output"
 OUTPUT_DIR.mkdir(exist_ok=True)
 
-RECOGNITION_THRESHOLD = 0.53   # same as utils.py
+# -- Django (production gallery format + 1-NN search) -------------------------
+# Set up from main only: the cross-validation workers are spawned processes that
+# re-import this module, and they need neither Django nor the database.
+DJANGO_PROJECT = ROOT / "ai_attendance"
+
+
+def setup_django():
+    """Configure Django; returns the threshold the app matches with."""
+    sys.path.insert(0, str(DJANGO_PROJECT))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ai_attendance.settings")
+    import django
+    django.setup()
+    from django.conf import settings
+    from core.model_store import load_gallery, get_current_version
+    # The served gallery's manifest records the threshold it was built for
+    gallery = load_gallery() if get_current_version() else None
+    return gallery.threshold if gallery is not None else settings.RECOGNITION_THRESHOLD
+
+
+RECOGNITION_THRESHOLD = None   # set by setup_django() in main
+PAIR_BLOCK_BYTES      = 64 * 1024 * 1024   # working memory of one block of pairwise distances
+PAIR_BLOCK_TEMPORARIES = 6                 # block x N float64 arrays alive at once in iter_pair_blocks
+
+# Streaming mode: impostor pairs are histogrammed instead of stored
+STREAMING_MAX_PAIR_BYTES = 256 * 1024 * 1024   # switch to streaming when all-pairs arrays would exceed this
+PAIR_BYTES               = 8 + 8 + 1           # euclidean + cosine + genuine flag per stored pair
+SCORE_RANGE             = (-1.0, 1.0)    # score = 1 - euclidean distance
+SCORE_BINS              = 4000           # histogram resolution: 0.0005 per bin
+
+# Threshold / top-k sweep over cached cross-validation neighbours
+TOP_K            = 5
+SWEEP_THRESHOLDS = np.round(np.arange(0.30, 0.7001, 0.01), 2)
+SCAN_INTERVAL    = 1.0   # seconds between auto-scans on the live attendance page
+
+# Runtime timing
+MATCH_BATCH_FACES = 30   # faces per frame in a full classroom
+MATCH_REPEATS     = 50
+
+# Regression gate: metric -> (better direction, tolerance, "abs" | "rel"[, floor])
+# A "rel" rule allows max(tolerance * baseline, floor): sub-millisecond timings
+# jitter by more than their relative tolerance between identical runs.
+REGRESSION_TOLERANCES = {
+    "accuracy":              ("higher", 0.01,  "abs"),
+    "f1":                    ("higher", 0.01,  "abs"),
+    "auc":                   ("higher", 0.005, "abs"),
+    "eer":                   ("lower",  0.01,  "abs"),
+    "far":                   ("lower",  0.01,  "abs"),
+    "frr":                   ("lower",  0.02,  "abs"),
+    "match_latency_mean_ms": ("lower",  0.25,  "rel", 0.5),
+    "model_load_ms":         ("lower",  0.50,  "rel", 5.0),
+    "gallery_memory_mb":     ("lower",  0.10,  "rel"),
+}
+
+EUC_PLOT_BINS = np.linspace(0, 1.4, 50)
+COS_PLOT_BINS = np.linspace(-0.2, 1.05, 50)
 
 SEP = "=" * 60
 
@@ -153,7 +219,42 @@ def load_dataset():
 #  STEP 2  Classification Metrics  (cross-validated KNN)
 # =============================================================================
 
-def evaluate_classification(encodings, labels, names):
+def fold_neighbors(X_train, y_train, X_test, k):
+    """Worker: k nearest training neighbours (distances, labels) of each test encoding."""
+    knn = KNeighborsClassifier(n_neighbors=1, algorithm="ball_tree")
+    knn.fit(X_train, y_train)
+    distances, idx = knn.kneighbors(X_test, n_neighbors=k)
+    return distances, y_train[idx]
+
+
+def threshold_sweep(true, nn_dist, nn_labels, thresholds):
+    """
+    Accuracy / false-accept / unknown rate for every threshold from the cached
+    nearest-neighbour distances. Sorting once turns each threshold into a
+    searchsorted count, so the sweep costs O(T log N).
+    """
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    correct    = nn_labels[:, 0] == true
+    n          = len(true)
+    ok    = np.searchsorted(np.sort(nn_dist[correct, 0]),  thresholds, side="right") / n
+    wrong = np.searchsorted(np.sort(nn_dist[~correct, 0]), thresholds, side="right") / n
+    return {
+        "threshold":         thresholds,
+        "accuracy":          ok,
+        "false_accept_rate": wrong,
+        "unknown_rate":      1.0 - ok - wrong,
+        # Auto-scan marks a student once one frame matches; frames are treated as independent
+        "seconds_to_mark":   np.where(ok > 0, SCAN_INTERVAL / np.maximum(ok, 1e-12), np.inf),
+    }
+
+
+def top_k_accuracy(true, nn_dist, nn_labels, threshold):
+    """Fraction of queries whose identity is among the k nearest neighbours within threshold, k = 1..K."""
+    hits = (nn_labels == true[:, None]) & (nn_dist <= threshold)
+    return np.mean(np.cumsum(hits, axis=1) > 0, axis=0)
+
+
+def evaluate_classification(encodings, labels, names, jobs=None, top_k=TOP_K):
     print("\n" + SEP)
     print("  STEP 2 -- Classification Metrics")
     print(SEP)
@@ -169,26 +270,31 @@ def evaluate_classification(encodings, labels, names):
     n_splits = min(5, len(encodings))
     skf = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=42)
 
-    all_true, all_pred = [], []
-
-    for fold, (train_idx, test_idx) in enumerate(skf.split(encodings, labels), 1):
-        X_train, X_test = encodings[train_idx], encodings[test_idx]
-        y_train, y_test = labels[train_idx],   labels[test_idx]
-
-        knn = KNeighborsClassifier(n_neighbors=1, algorithm="ball_tree", weights="distance")
-        knn.fit(X_train, y_train)
-
-        distances, _ = knn.kneighbors(X_test, n_neighbors=1)
-        y_pred_raw   = knn.predict(X_test)
-
-        # Apply distance threshold -> UNKNOWN if too far
-        y_pred = np.where(distances[:, 0] <= RECOGNITION_THRESHOLD, y_pred_raw, "UNKNOWN")
+    folds = list(skf.split(encodings, labels))
+    k     = max(1, min(top_k, min(len(train_idx) for train_idx, _ in folds)))
+    jobs  = jobs or min(len(folds), os.cpu_count() or 1)
+
+    # Neighbours for every fold are computed once (in parallel processes) and
+    # cached; the threshold and top-k sweeps below only re-read them.
+    fold_args = (
+        [encodings[tr] for tr, _ in folds],
+        [labels[tr]    for tr, _ in folds],
+        [encodings[te] for _, te in folds],
+        [k] * len(folds),
+    )
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(fold_neighbors, *fold_args))
+    else:
+        results = list(map(fold_neighbors, *fold_args))
+    print(f"  {len(folds)} folds, {k} neighbours each, {jobs} process(es)")
 
-        all_true.extend(y_test)
-        all_pred.extend(y_pred)
+    all_true  = np.concatenate([labels[te] for _, te in folds])
+    nn_dist   = np.concatenate([d for d, _ in results])
+    nn_labels = np.concatenate([l for _, l in results])
 
-    all_true = np.array(all_true)
-    all_pred = np.array(all_pred)
+    # Apply distance threshold -> UNKNOWN if too far
+    all_pred = np.where(nn_dist[:, 0] <= RECOGNITION_THRESHOLD, nn_labels[:, 0], "UNKNOWN")
 
     acc  = accuracy_score(all_true, all_pred)
     prec = precision_score(all_true, all_pred, labels=list(unique_classes),
@@ -247,19 +353,240 @@ def evaluate_classification(encodings, labels, names):
         plt.close()
         print(f"\n  [OK] Saved: {path}")
 
+    # Threshold / top-k sweep over the cached neighbours
+    sweep = threshold_sweep(all_true, nn_dist, nn_labels, SWEEP_THRESHOLDS)
+    topk  = top_k_accuracy(all_true, nn_dist, nn_labels, RECOGNITION_THRESHOLD)
+
+    print(f"\n  Top-k accuracy (threshold = {RECOGNITION_THRESHOLD}):")
+    for i, v in enumerate(topk, 1):
+        print(f"    top-{i}: {v*100:6.2f}%")
+
+    print(f"\n  Threshold sweep (auto-scan every {SCAN_INTERVAL:g}s):")
+    print(f"  {'Thr':>5} {'Acc%':>7} {'FalseAcc%':>10} {'Unknown%':>9} {'Time-to-mark':>13}")
+    for i, thr in enumerate(sweep["threshold"]):
+        if round(thr * 100) % 5 and thr != RECOGNITION_THRESHOLD:
+            continue
+        mark = sweep["seconds_to_mark"][i]
+        mark = f"{mark:.1f}s" if np.isfinite(mark) else "never"
+        print(f"  {thr:5.2f} {sweep['accuracy'][i]*100:7.2f} {sweep['false_accept_rate'][i]*100:10.2f} "
+              f"{sweep['unknown_rate'][i]*100:9.2f} {mark:>13}")
+
+    path = OUTPUT_DIR / "threshold_sweep.csv"
+    with open(path, "w") as f:
+        f.write("threshold,accuracy,false_accept_rate,unknown_rate,seconds_to_mark\n")
+        for row in zip(*(sweep[c] for c in ("threshold", "accuracy", "false_accept_rate",
+                                            "unknown_rate", "seconds_to_mark"))):
+            f.write(",".join(f"{v:.6g}" for v in row) + "\n")
+    print(f"  [OK] Saved: {path}")
+
+    if HAS_MATPLOTLIB:
+        fig, ax = plt.subplots(figsize=(9, 5))
+        ax.plot(sweep["threshold"], sweep["accuracy"] * 100, color="#2ecc71", lw=2, label="Accuracy (%)")
+        ax.plot(sweep["threshold"], sweep["false_accept_rate"] * 100, color="#e74c3c", lw=2, label="False accept (%)")
+        ax.plot(sweep["threshold"], sweep["unknown_rate"] * 100, color="#95a5a6", lw=2, label="Unknown (%)")
+        ax.axvline(RECOGNITION_THRESHOLD, color="orange", linestyle="--",
+                   label=f"System thr ({RECOGNITION_THRESHOLD})")
+        ax.set_xlabel("Distance Threshold")
+        ax.set_ylabel("Rate (%)")
+        ax2 = ax.twinx()
+        finite = np.isfinite(sweep["seconds_to_mark"])
+        ax2.plot(sweep["threshold"][finite], sweep["seconds_to_mark"][finite], color="#4f86f7",
+                 lw=2, linestyle=":", label="Expected time-to-mark (s)")
+        ax2.set_ylabel("Expected time-to-mark (s)")
+        lines = ax.get_legend_handles_labels()
+        lines2 = ax2.get_legend_handles_labels()
+        ax.legend(lines[0] + lines2[0], lines[1] + lines2[1], loc="center right")
+        ax.set_title("Threshold Sweep -- Accuracy vs Time-to-Mark")
+        ax.grid(alpha=0.3)
+        plt.tight_layout()
+        path = OUTPUT_DIR / "threshold_sweep.png"
+        plt.savefig(path, dpi=150)
+        plt.close()
+        print(f"  [OK] Saved: {path}")
+
     return {
         "accuracy": acc, "precision": prec,
         "recall": rec,   "f1": f1,
         "unknown_rate": unknown_rate / 100,
         "confusion_matrix": cm,
+        "top_k": topk,
+        "sweep": sweep,
+    }
+
+
+# =============================================================================
+#  Pairwise distances  (shared by STEP 3 and STEP 4)
+# =============================================================================
+
+def pair_block_size(n, budget=PAIR_BLOCK_BYTES):
+    """Rows per block so that one block's temporaries over N columns fit in `budget` bytes."""
+    return max(1, int(budget // (PAIR_BLOCK_TEMPORARIES * 8 * max(n, 1))))
+
+
+def pair_array_bytes(n):
+    """Memory compute_pairwise needs to keep all n * (n - 1) / 2 pairs."""
+    return n * (n - 1) // 2 * PAIR_BYTES
+
+
+def iter_pair_blocks(encodings, labels, block_size=None):
+    """
+    Yield (euclidean, cosine, is_genuine) arrays for all pairs i < j, one block
+    of rows at a time, in the same order as itertools.combinations.
+    Uses the Gram matrix: ||a - b||^2 = ||a||^2 + ||b||^2 - 2 a.b
+    The block size defaults to pair_block_size(N), so a block's temporaries
+    stay within PAIR_BLOCK_BYTES however large N gets.
+    """
+    X      = np.asarray(encodings, dtype=np.float64)
+    labels = np.asarray(labels)
+    sq     = np.einsum("ij,ij->i", X, X)
+    norms  = np.sqrt(sq)
+    n      = len(X)
+    block_size = block_size or pair_block_size(n)
+
+    for start in range(0, n - 1, block_size):
+        stop = min(start + block_size, n)
+        gram = X[start:stop] @ X[start + 1:].T
+        # In place, so a block holds gram, euc, cos and the masked copies at most
+        euc  = np.add.outer(sq[start:stop], sq[start + 1:])
+        euc -= gram
+        euc -= gram
+        np.sqrt(np.maximum(euc, 0.0, out=euc), out=euc)
+        cos  = np.multiply.outer(norms[start:stop], norms[start + 1:])
+        cos += 1e-10
+        np.divide(gram, cos, out=cos)
+        del gram
+        upper = np.arange(start + 1, n)[None, :] > np.arange(start, stop)[:, None]
+        same  = labels[start:stop, None] == labels[None, start + 1:]
+        yield euc[upper], cos[upper], same[upper]
+
+
+def compute_pairwise(encodings, labels, block_size=None):
+    """
+    All-pairs euclidean / cosine / genuine arrays, computed once in blocks.
+    Needs pair_array_bytes(N); above STREAMING_MAX_PAIR_BYTES use
+    accumulate_pair_statistics instead.
+    """
+    n = len(encodings)
+    m = n * (n - 1) // 2
+    euc  = np.empty(m, dtype=np.float64)
+    cos  = np.empty(m, dtype=np.float64)
+    same = np.empty(m, dtype=bool)
+    pos = 0
+    for e, c, s in iter_pair_blocks(encodings, labels, block_size):
+        k = len(e)
+        euc[pos:pos + k], cos[pos:pos + k], same[pos:pos + k] = e, c, s
+        pos += k
+    return {"euclidean": euc, "cosine": cos, "genuine": same}
+
+
+def error_rates(genuine_scores, impostor_scores, thresholds):
+    """FAR / FRR at each score threshold (accept if score >= t), via sorted search."""
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    imp = np.sort(impostor_scores)
+    gen = np.sort(genuine_scores)
+    far = (len(imp) - np.searchsorted(imp, thresholds, side="left")) / len(imp) if len(imp) else np.zeros_like(thresholds)
+    frr = np.searchsorted(gen, thresholds, side="left") / len(gen) if len(gen) else np.zeros_like(thresholds)
+    return far, frr
+
+
+# =============================================================================
+#  Streaming pair statistics  (large datasets, constant memory)
+# =============================================================================
+
+def wilson_interval(k, n, z=1.96):
+    """95% Wilson score interval for a proportion k / n."""
+    if n == 0:
+        return (0.0, 1.0)
+    p      = k / n
+    denom  = 1.0 + z * z / n
+    centre = (p + z * z / (2 * n)) / denom
+    half   = z * np.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+    return (float(max(0.0, centre - half)), float(min(1.0, centre + half)))
+
+
+def accumulate_pair_statistics(encodings, labels, bins=SCORE_BINS, block_size=None):
+    """
+    One pass over all pairs without keeping them:
+      - genuine pairs are kept in full (there are comparatively few)
+      - impostor pairs go into a fixed-bin score histogram plus running
+        sums for the embedding means / RMSE
+    Memory is O(bins + genuine pairs), independent of the impostor count.
+    """
+    score_edges    = np.linspace(SCORE_RANGE[0], SCORE_RANGE[1], bins + 1)
+    imp_score_hist = np.zeros(bins, dtype=np.int64)
+    imp_euc_hist   = np.zeros(len(EUC_PLOT_BINS) - 1, dtype=np.int64)
+    imp_cos_hist   = np.zeros(len(COS_PLOT_BINS) - 1, dtype=np.int64)
+    gen_euc, gen_cos = [], []
+    n_imp = 0
+    imp_sum_euc = imp_sum_euc_sq = imp_sum_cos = 0.0
+
+    for euc, cos, same in iter_pair_blocks(encodings, labels, block_size):
+        gen_euc.append(euc[same])
+        gen_cos.append(cos[same])
+        e, c = euc[~same], cos[~same]
+        score = np.clip(1.0 - e, SCORE_RANGE[0], SCORE_RANGE[1])
+        imp_score_hist += np.histogram(score, bins=score_edges)[0]
+        imp_euc_hist   += np.histogram(e, bins=EUC_PLOT_BINS)[0]
+        imp_cos_hist   += np.histogram(c, bins=COS_PLOT_BINS)[0]
+        n_imp          += len(e)
+        imp_sum_euc    += float(e.sum())
+        imp_sum_euc_sq += float(np.dot(e, e))
+        imp_sum_cos    += float(c.sum())
+
+    return {
+        "score_edges":    score_edges,
+        "imp_score_hist": imp_score_hist,
+        "imp_euc_hist":   imp_euc_hist,
+        "imp_cos_hist":   imp_cos_hist,
+        "gen_euc":        np.concatenate(gen_euc) if gen_euc else np.empty(0),
+        "gen_cos":        np.concatenate(gen_cos) if gen_cos else np.empty(0),
+        "n_imp":          n_imp,
+        "imp_sum_euc":    imp_sum_euc,
+        "imp_sum_euc_sq": imp_sum_euc_sq,
+        "imp_sum_cos":    imp_sum_cos,
     }
 
 
+def plot_verification(fpr, tpr, eer_point, roc_auc, eer, thr_range, far_v, frr_v, verify_thr, eer_thr):
+    fig, axes = plt.subplots(1, 2, figsize=(14, 5))
+
+    # ROC Curve
+    axes[0].plot(fpr, tpr, color="#4f86f7", lw=2,
+                 label=f"ROC (AUC = {roc_auc:.4f})")
+    axes[0].scatter([eer_point[0]], [eer_point[1]], color="red",
+                    zorder=5, s=80, label=f"EER = {eer*100:.1f}%")
+    axes[0].plot([0, 1], [0, 1], "k--", lw=1, alpha=0.5)
+    axes[0].set_xlabel("False Positive Rate (FAR)")
+    axes[0].set_ylabel("True Positive Rate (1 - FRR)")
+    axes[0].set_title("ROC Curve -- Verification Task")
+    axes[0].legend(loc="lower right")
+    axes[0].grid(alpha=0.3)
+
+    # FAR / FRR vs threshold
+    axes[1].plot(thr_range, far_v * 100, color="#e74c3c", lw=2, label="FAR (%)")
+    axes[1].plot(thr_range, frr_v * 100, color="#2ecc71", lw=2, label="FRR (%)")
+    axes[1].axvline(verify_thr, color="orange", linestyle="--",
+                    label=f"System thr ({verify_thr:.2f})")
+    axes[1].axvline(eer_thr, color="purple", linestyle=":",
+                    label=f"EER thr ({eer_thr:.2f})")
+    axes[1].set_xlabel("Score Threshold  (1 - Euclidean Dist)")
+    axes[1].set_ylabel("Error Rate (%)")
+    axes[1].set_title("FAR / FRR vs Threshold")
+    axes[1].legend()
+    axes[1].grid(alpha=0.3)
+
+    plt.tight_layout()
+    path = OUTPUT_DIR / "roc_far_frr.png"
+    plt.savefig(path, dpi=150)
+    plt.close()
+    print(f"  [OK] Saved: {path}")
+
+
 # =============================================================================
 #  STEP 3  Verification Metrics  (ROC, AUC, EER, FAR / FRR)
 # =============================================================================
 
-def evaluate_verification(encodings, labels):
+def evaluate_verification(encodings, labels, pairs=None):
     """
     For every pair (i, j):
       score = 1 - euclidean_distance   (higher -> more similar)
@@ -273,26 +600,20 @@ def evaluate_verification(encodings, labels):
         print("  [!] Need >= 4 encodings. Skipping.")
         return None
 
-    genuine_sc, impostor_sc = [], []
-    pair_labels, pair_scores = [], []
-
-    for i, j in combinations(range(len(encodings)), 2):
-        dist  = float(np.linalg.norm(encodings[i] - encodings[j]))
-        score = 1.0 - dist
-        is_g  = int(labels[i] == labels[j])
-        pair_labels.append(is_g)
-        pair_scores.append(score)
-        (genuine_sc if is_g else impostor_sc).append(score)
+    if pairs is None:
+        pairs = compute_pairwise(encodings, labels)
 
-    pair_labels = np.array(pair_labels)
-    pair_scores = np.array(pair_scores)
+    pair_scores = 1.0 - pairs["euclidean"]
+    pair_labels = pairs["genuine"].astype(int)
+    genuine_sc  = pair_scores[pairs["genuine"]]
+    impostor_sc = pair_scores[~pairs["genuine"]]
 
     print(f"\n  Pair statistics:")
     print(f"  Genuine pairs    : {len(genuine_sc)}")
     print(f"  Impostor pairs   : {len(impostor_sc)}")
-    if genuine_sc:
+    if genuine_sc.size:
         print(f"  Genuine  score   : mean={np.mean(genuine_sc):.4f}, std={np.std(genuine_sc):.4f}")
-    if impostor_sc:
+    if impostor_sc.size:
         print(f"  Impostor score   : mean={np.mean(impostor_sc):.4f}, std={np.std(impostor_sc):.4f}")
 
     # ROC / AUC
@@ -302,12 +623,8 @@ def evaluate_verification(encodings, labels):
 
     # FAR / FRR at system threshold
     verify_thr = 1.0 - RECOGNITION_THRESHOLD   # score threshold
-    predicted  = (pair_scores >= verify_thr).astype(int)
-    gen_mask   = pair_labels == 1
-    imp_mask   = pair_labels == 0
-
-    far = float(np.mean(predicted[imp_mask] == 1)) if imp_mask.any() else 0.0
-    frr = float(np.mean(predicted[gen_mask] == 0)) if gen_mask.any() else 0.0
+    far_a, frr_a = error_rates(genuine_sc, impostor_sc, [verify_thr])
+    far, frr = float(far_a[0]), float(frr_a[0])
 
     print(f"  Threshold        : {RECOGNITION_THRESHOLD} (dist) / {verify_thr:.3f} (score)")
     print(f"  FAR (False Accept Rate): {far*100:.2f}%")
@@ -321,58 +638,102 @@ def evaluate_verification(encodings, labels):
     print(f"  EER              : {eer*100:.2f}%  (at score threshold {eer_thr:.4f})")
 
     if HAS_MATPLOTLIB:
-        fig, axes = plt.subplots(1, 2, figsize=(14, 5))
-
-        # ROC Curve
-        axes[0].plot(fpr, tpr, color="#4f86f7", lw=2,
-                     label=f"ROC (AUC = {roc_auc:.4f})")
-        axes[0].scatter([fpr[eer_idx]], [tpr[eer_idx]], color="red",
-                        zorder=5, s=80, label=f"EER = {eer*100:.1f}%")
-        axes[0].plot([0, 1], [0, 1], "k--", lw=1, alpha=0.5)
-        axes[0].set_xlabel("False Positive Rate (FAR)")
-        axes[0].set_ylabel("True Positive Rate (1 - FRR)")
-        axes[0].set_title("ROC Curve -- Verification Task")
-        axes[0].legend(loc="lower right")
-        axes[0].grid(alpha=0.3)
-
-        # FAR / FRR vs threshold
         thr_range = np.linspace(float(pair_scores.min()), float(pair_scores.max()), 300)
-        far_v, frr_v = [], []
-        for t in thr_range:
-            p2 = (pair_scores >= t).astype(int)
-            far_v.append(float(np.mean(p2[imp_mask] == 1)) if imp_mask.any() else 0.0)
-            frr_v.append(float(np.mean(p2[gen_mask] == 0)) if gen_mask.any() else 0.0)
-
-        axes[1].plot(thr_range, [v*100 for v in far_v], color="#e74c3c", lw=2, label="FAR (%)")
-        axes[1].plot(thr_range, [v*100 for v in frr_v], color="#2ecc71", lw=2, label="FRR (%)")
-        axes[1].axvline(verify_thr, color="orange", linestyle="--",
-                        label=f"System thr ({verify_thr:.2f})")
-        axes[1].axvline(eer_thr, color="purple", linestyle=":",
-                        label=f"EER thr ({eer_thr:.2f})")
-        axes[1].set_xlabel("Score Threshold  (1 - Euclidean Dist)")
-        axes[1].set_ylabel("Error Rate (%)")
-        axes[1].set_title("FAR / FRR vs Threshold")
-        axes[1].legend()
-        axes[1].grid(alpha=0.3)
-
-        plt.tight_layout()
-        path = OUTPUT_DIR / "roc_far_frr.png"
-        plt.savefig(path, dpi=150)
-        plt.close()
-        print(f"  [OK] Saved: {path}")
+        far_v, frr_v = error_rates(genuine_sc, impostor_sc, thr_range)
+        plot_verification(fpr, tpr, (fpr[eer_idx], tpr[eer_idx]), roc_auc, eer,
+                          thr_range, far_v, frr_v, verify_thr, eer_thr)
 
     return {"auc": roc_auc, "eer": eer, "far": far, "frr": frr,
             "fpr": fpr, "tpr": tpr}
 
 
+def evaluate_verification_streaming(stats):
+    """
+    Verification metrics from accumulate_pair_statistics(). Genuine scores are
+    exact; impostor rates are read off the histogram at bin edges, so
+    thresholds are resolved to one bin width. FAR / FRR / EER carry 95% Wilson
+    intervals (pairs share images, so treat the intervals as optimistic).
+    """
+    print("\n" + SEP)
+    print("  STEP 3 -- Verification Metrics  (streaming, ROC / AUC / EER / FAR / FRR)")
+    print(SEP)
+
+    edges  = stats["score_edges"]
+    hist   = stats["imp_score_hist"]
+    n_imp  = stats["n_imp"]
+    gen_sc = np.sort(1.0 - stats["gen_euc"])
+    n_gen  = len(gen_sc)
+    bin_w  = float(edges[1] - edges[0])
+
+    if n_gen == 0 or n_imp == 0:
+        print("  [!] Need both genuine and impostor pairs. Skipping.")
+        return None
+
+    imp_mean_euc = stats["imp_sum_euc"] / n_imp
+    imp_std      = float(np.sqrt(max(stats["imp_sum_euc_sq"] / n_imp - imp_mean_euc ** 2, 0.0)))
+
+    print(f"\n  Pair statistics:")
+    print(f"  Genuine pairs    : {n_gen}  (kept exactly)")
+    print(f"  Impostor pairs   : {n_imp}  ({len(hist)}-bin histogram, width {bin_w:.5f})")
+    print(f"  Genuine  score   : mean={np.mean(gen_sc):.4f}, std={np.std(gen_sc):.4f}")
+    print(f"  Impostor score   : mean={1.0 - imp_mean_euc:.4f}, std={imp_std:.4f}")
+
+    # Accept if score >= t, evaluated at every bin edge
+    imp_above = np.concatenate([np.cumsum(hist[::-1])[::-1], [0]])
+    gen_below = np.searchsorted(gen_sc, edges, side="left")
+    far_e     = imp_above / n_imp
+    frr_e     = gen_below / n_gen
+
+    # ROC / AUC -- thresholds descending so FPR is ascending
+    fpr     = np.concatenate([[0.0], far_e[::-1]])
+    tpr     = np.concatenate([[0.0], 1.0 - frr_e[::-1]])
+    roc_auc = float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+    print(f"\n  AUC (ROC)        : {roc_auc:.4f}")
+
+    # FAR / FRR at system threshold (FAR at the nearest bin edge, FRR exact)
+    verify_thr = 1.0 - RECOGNITION_THRESHOLD
+    k          = int(np.argmin(np.abs(edges - verify_thr)))
+    n_rej      = int(np.searchsorted(gen_sc, verify_thr, side="left"))
+    far, frr   = float(far_e[k]), n_rej / n_gen
+    far_ci     = wilson_interval(int(imp_above[k]), n_imp)
+    frr_ci     = wilson_interval(n_rej, n_gen)
+
+    print(f"  Threshold        : {RECOGNITION_THRESHOLD} (dist) / {verify_thr:.3f} (score, +/- {bin_w / 2:.5f})")
+    print(f"  FAR (False Accept Rate): {far*100:.2f}%  (95% CI {far_ci[0]*100:.2f}-{far_ci[1]*100:.2f}%)")
+    print(f"  FRR (False Reject Rate): {frr*100:.2f}%  (95% CI {frr_ci[0]*100:.2f}-{frr_ci[1]*100:.2f}%)")
+
+    # EER -- bin edge where FAR meets FRR
+    eer_idx = int(np.argmin(np.abs(far_e - frr_e)))
+    eer     = float((far_e[eer_idx] + frr_e[eer_idx]) / 2)
+    eer_thr = float(edges[eer_idx])
+    lo_far, hi_far = wilson_interval(int(imp_above[eer_idx]), n_imp)
+    lo_frr, hi_frr = wilson_interval(int(gen_below[eer_idx]), n_gen)
+    eer_ci  = (min(lo_far, lo_frr), max(hi_far, hi_frr))
+    print(f"  EER              : {eer*100:.2f}%  (95% CI {eer_ci[0]*100:.2f}-{eer_ci[1]*100:.2f}%, "
+          f"at score threshold {eer_thr:.4f})")
+
+    if HAS_MATPLOTLIB:
+        occupied = np.nonzero(hist)[0]
+        lo = min(gen_sc[0], edges[occupied[0]])
+        hi = max(gen_sc[-1], edges[occupied[-1] + 1])
+        sel = (edges >= lo) & (edges <= hi)
+        plot_verification(fpr, tpr, (far_e[eer_idx], 1.0 - frr_e[eer_idx]), roc_auc, eer,
+                          edges[sel], far_e[sel], frr_e[sel], verify_thr, eer_thr)
+
+    return {"auc": roc_auc, "eer": eer, "far": far, "frr": frr,
+            "fpr": fpr, "tpr": tpr,
+            "far_ci": far_ci, "frr_ci": frr_ci, "eer_ci": eer_ci, "bin_width": bin_w}
+
+
 # =============================================================================
 #  STEP 4  Embedding Similarity Metrics
 # =============================================================================
 
-def evaluate_embeddings(encodings, labels):
+def evaluate_embeddings(encodings, labels, pairs=None, stats=None):
     """
     Pairwise embedding analysis:
       Cosine Similarity, Euclidean Distance, RMSE
+    Impostor figures come from `stats` (streaming mode) when given.
     """
     print("\n" + SEP)
     print("  STEP 4 -- Embedding Similarity Metrics")
@@ -382,42 +743,46 @@ def evaluate_embeddings(encodings, labels):
         print("  [!] Need >= 4 encodings. Skipping.")
         return None
 
-    def cos_sim(a, b):
-        return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b) + 1e-10))
-
-    gen_cos, imp_cos = [], []
-    gen_euc, imp_euc = [], []
-
-    for i, j in combinations(range(len(encodings)), 2):
-        cs  = cos_sim(encodings[i], encodings[j])
-        euc = float(np.linalg.norm(encodings[i] - encodings[j]))
-        if labels[i] == labels[j]:
-            gen_cos.append(cs);  gen_euc.append(euc)
-        else:
-            imp_cos.append(cs);  imp_euc.append(euc)
-
-    gen_cos  = np.array(gen_cos);  imp_cos = np.array(imp_cos)
-    gen_euc  = np.array(gen_euc);  imp_euc = np.array(imp_euc)
+    if stats is not None:
+        gen_cos, gen_euc = stats["gen_cos"], stats["gen_euc"]
+        n_imp = stats["n_imp"]
+        imp_cos_mean    = stats["imp_sum_cos"] / n_imp    if n_imp else 0.0
+        imp_euc_mean    = stats["imp_sum_euc"] / n_imp    if n_imp else 0.0
+        imp_euc_sq_mean = stats["imp_sum_euc_sq"] / n_imp if n_imp else 0.0
+        imp_euc_hist, imp_cos_hist = stats["imp_euc_hist"], stats["imp_cos_hist"]
+    else:
+        if pairs is None:
+            pairs = compute_pairwise(encodings, labels)
+        gen_mask = pairs["genuine"]
+        gen_cos  = pairs["cosine"][gen_mask];     imp_cos = pairs["cosine"][~gen_mask]
+        gen_euc  = pairs["euclidean"][gen_mask];  imp_euc = pairs["euclidean"][~gen_mask]
+        n_imp = imp_euc.size
+        imp_cos_mean    = float(np.mean(imp_cos))      if n_imp else 0.0
+        imp_euc_mean    = float(np.mean(imp_euc))      if n_imp else 0.0
+        imp_euc_sq_mean = float(np.mean(imp_euc ** 2)) if n_imp else 0.0
+        imp_euc_hist = np.histogram(imp_euc, bins=EUC_PLOT_BINS)[0]
+        imp_cos_hist = np.histogram(imp_cos, bins=COS_PLOT_BINS)[0]
 
     # RMSE: genuine pairs vs ideal dist=0, impostor vs ideal dist=1
-    rmse_gen = float(np.sqrt(np.mean(gen_euc ** 2)))         if gen_euc.size  else 0.0
-    rmse_imp = float(np.sqrt(np.mean((1.0 - imp_euc) ** 2))) if imp_euc.size  else 0.0
+    # mean((1 - d)^2) = 1 - 2 mean(d) + mean(d^2)
+    rmse_gen = float(np.sqrt(np.mean(gen_euc ** 2))) if gen_euc.size else 0.0
+    rmse_imp = float(np.sqrt(max(1.0 - 2.0 * imp_euc_mean + imp_euc_sq_mean, 0.0))) if n_imp else 0.0
 
     print("\n  --- Cosine Similarity ---")
     if gen_cos.size:
         print(f"  Genuine  pairs mean : {np.mean(gen_cos):.4f}  (ideal -> 1.00)")
-    if imp_cos.size:
-        print(f"  Impostor pairs mean : {np.mean(imp_cos):.4f}  (ideal -> 0.00 or lower)")
-    if gen_cos.size and imp_cos.size:
-        print(f"  Separation          : {np.mean(gen_cos) - np.mean(imp_cos):.4f}")
+    if n_imp:
+        print(f"  Impostor pairs mean : {imp_cos_mean:.4f}  (ideal -> 0.00 or lower)")
+    if gen_cos.size and n_imp:
+        print(f"  Separation          : {np.mean(gen_cos) - imp_cos_mean:.4f}")
 
     print("\n  --- Euclidean Distance ---")
     if gen_euc.size:
         print(f"  Genuine  pairs mean : {np.mean(gen_euc):.4f}  (ideal -> 0.00)")
-    if imp_euc.size:
-        print(f"  Impostor pairs mean : {np.mean(imp_euc):.4f}  (ideal -> > {RECOGNITION_THRESHOLD})")
-    if gen_euc.size and imp_euc.size:
-        print(f"  Separation          : {np.mean(imp_euc) - np.mean(gen_euc):.4f}")
+    if n_imp:
+        print(f"  Impostor pairs mean : {imp_euc_mean:.4f}  (ideal -> > {RECOGNITION_THRESHOLD})")
+    if gen_euc.size and n_imp:
+        print(f"  Separation          : {imp_euc_mean - np.mean(gen_euc):.4f}")
 
     print("\n  --- RMSE ---")
     print(f"  RMSE genuine  (vs ideal 0) : {rmse_gen:.4f}")
@@ -426,11 +791,12 @@ def evaluate_embeddings(encodings, labels):
     if HAS_MATPLOTLIB:
         fig, axes = plt.subplots(1, 2, figsize=(14, 5))
 
-        bins = np.linspace(0, 1.4, 50)
+        # Impostors are drawn from pre-binned counts so both modes share one path
         if gen_euc.size:
-            axes[0].hist(gen_euc,  bins=bins, alpha=0.7, color="#2ecc71", label="Genuine Pairs")
-        if imp_euc.size:
-            axes[0].hist(imp_euc, bins=bins, alpha=0.7, color="#e74c3c", label="Impostor Pairs")
+            axes[0].hist(gen_euc, bins=EUC_PLOT_BINS, alpha=0.7, color="#2ecc71", label="Genuine Pairs")
+        if n_imp:
+            axes[0].hist(EUC_PLOT_BINS[:-1], bins=EUC_PLOT_BINS, weights=imp_euc_hist,
+                         alpha=0.7, color="#e74c3c", label="Impostor Pairs")
         axes[0].axvline(RECOGNITION_THRESHOLD, color="orange", linestyle="--", lw=2,
                         label=f"Threshold ({RECOGNITION_THRESHOLD})")
         axes[0].set_xlabel("Euclidean Distance")
@@ -438,11 +804,11 @@ def evaluate_embeddings(encodings, labels):
         axes[0].set_title("Euclidean Distance Distribution")
         axes[0].legend(); axes[0].grid(alpha=0.3)
 
-        bins_c = np.linspace(-0.2, 1.05, 50)
         if gen_cos.size:
-            axes[1].hist(gen_cos,  bins=bins_c, alpha=0.7, color="#2ecc71", label="Genuine Pairs")
-        if imp_cos.size:
-            axes[1].hist(imp_cos, bins=bins_c, alpha=0.7, color="#e74c3c", label="Impostor Pairs")
+            axes[1].hist(gen_cos, bins=COS_PLOT_BINS, alpha=0.7, color="#2ecc71", label="Genuine Pairs")
+        if n_imp:
+            axes[1].hist(COS_PLOT_BINS[:-1], bins=COS_PLOT_BINS, weights=imp_cos_hist,
+                         alpha=0.7, color="#e74c3c", label="Impostor Pairs")
         cos_thr = 1.0 - RECOGNITION_THRESHOLD
         axes[1].axvline(cos_thr, color="orange", linestyle="--", lw=2,
                         label=f"Equiv. Cosine Thr ({cos_thr:.2f})")
@@ -461,19 +827,147 @@ def evaluate_embeddings(encodings, labels):
 
     return {
         "cosine_genuine_mean"   : float(np.mean(gen_cos))  if gen_cos.size  else 0.0,
-        "cosine_impostor_mean"  : float(np.mean(imp_cos))  if imp_cos.size  else 0.0,
+        "cosine_impostor_mean"  : float(imp_cos_mean),
         "euclidean_genuine_mean": float(np.mean(gen_euc))  if gen_euc.size  else 0.0,
-        "euclidean_impostor_mean":float(np.mean(imp_euc))  if imp_euc.size  else 0.0,
+        "euclidean_impostor_mean":float(imp_euc_mean),
         "rmse_genuine"          : rmse_gen,
         "rmse_impostor"         : rmse_imp,
     }
 
 
 # =============================================================================
-#  STEP 5  Summary Report
+#  STEP 5  Runtime Metrics  (model load, gallery memory, match latency)
+# =============================================================================
+
+def load_production_gallery():
+    """
+    Load the gallery the app serves: the current version under MODEL_DIR
+    (core.model_store.load_gallery), else the legacy model.pkl.
+    Returns (Gallery, source, load_ms, memory_bytes) or None.
+    """
+    from core.model_store import Gallery, load_gallery, get_current_version
+
+    start = time.perf_counter()
+    if get_current_version():
+        gallery = load_gallery()
+        if gallery is not None:
+            load_ms = (time.perf_counter() - start) * 1000
+            memory  = gallery.encodings.nbytes + gallery.labels.nbytes + gallery.norms.nbytes
+            return gallery, gallery.version, load_ms, memory
+    if MODEL_PATH.exists():
+        with open(MODEL_PATH, "rb") as f:
+            knn = pickle.load(f)
+        enc    = np.asarray(knn._fit_X, dtype=np.float64)
+        labels = np.asarray(knn.classes_)[np.asarray(knn._y)]
+        gallery = Gallery(MODEL_PATH.name, enc, labels, {"threshold": RECOGNITION_THRESHOLD})
+        load_ms = (time.perf_counter() - start) * 1000
+        return gallery, MODEL_PATH.name, load_ms, enc.nbytes + np.asarray(knn._y).nbytes
+    return None
+
+
+def evaluate_runtime(encodings, labels, repeats=MATCH_REPEATS, batch=MATCH_BATCH_FACES):
+    print("\n" + SEP)
+    print("  STEP 5 -- Runtime Metrics  (model load / gallery memory / match latency)")
+    print(SEP)
+    from core.model_store import Gallery
+
+
+    loaded = load_production_gallery()
+    if loaded is None:
+        print("  [!] No trained model found -- timing against the dataset encodings instead.")
+        dataset = np.asarray(encodings, dtype=np.float64)
+        gallery = Gallery("dataset", dataset, np.asarray(labels), {"threshold": RECOGNITION_THRESHOLD})
+        source, load_ms, memory = "dataset", None, encodings.nbytes
+    else:
+        gallery, source, load_ms, memory = loaded
+
+    # The production search path: Gallery.nearest on a frame's worth of faces
+    rng     = np.random.default_rng(42)
+    times   = []
+    for _ in range(repeats):
+        q     = encodings[rng.integers(0, len(encodings), batch)]
+        start = time.perf_counter()
+        gallery.nearest(q)
+        times.append(time.perf_counter() - start)
+    times = np.array(times) * 1000
+
+    print(f"  Gallery           : {source}  ({len(gallery)} encodings)")
+    print(f"  Model load time   : " + (f"{load_ms:.2f} ms" if load_ms is not None else "n/a"))
+    print(f"  Gallery memory    : {memory / 1024 / 1024:.2f} MB")
+    print(f"  Match latency     : mean {times.mean():.3f} ms, p95 {np.percentile(times, 95):.3f} ms "
+          f"({batch} faces/frame, {repeats} runs)")
+
+    return {
+        "gallery_source":  source,
+        "gallery_size":    int(len(gallery)),
+        "model_load_ms":   load_ms,
+        "gallery_memory_mb": memory / 1024 / 1024,
+        "match_latency_mean_ms": float(times.mean()),
+        "match_latency_p95_ms":  float(np.percentile(times, 95)),
+    }
+
+
+# =============================================================================
+#  STEP 6  Metrics Report + Baseline Regression Gate
+# =============================================================================
+
+def collect_metrics(clf, ver, run):
+    """Flat {metric: value} dict of everything the regression gate compares."""
+    metrics = {}
+    if clf:
+        for key in ("accuracy", "precision", "recall", "f1", "unknown_rate"):
+            metrics[key] = float(clf[key])
+    if ver:
+        for key in ("auc", "eer", "far", "frr"):
+            metrics[key] = float(ver[key])
+    if run:
+        for key in ("match_latency_mean_ms", "match_latency_p95_ms", "model_load_ms", "gallery_memory_mb"):
+            if run[key] is not None:
+                metrics[key] = float(run[key])
+    return metrics
+
+
+def write_report(metrics, meta, json_path, csv_path):
+    with open(json_path, "w") as f:
+        json.dump({**meta, "metrics": metrics}, f, indent=2)
+    with open(csv_path, "w") as f:
+        f.write("metric,value\n")
+        for key, value in metrics.items():
+            f.write(f"{key},{value:.6g}\n")
+    print(f"  [OK] Saved: {json_path}")
+    print(f"  [OK] Saved: {csv_path}")
+
+
+def compare_to_baseline(metrics, baseline):
+    """
+    Returns a list of (metric, baseline, current, allowed) for every metric
+    that got worse by more than its tolerance. The baseline file may carry
+    its own "tolerances" to override REGRESSION_TOLERANCES.
+    """
+    rules     = {**REGRESSION_TOLERANCES, **{k: tuple(v) for k, v in baseline.get("tolerances", {}).items()}}
+    reference = baseline.get("metrics", {})
+    regressions = []
+
+    print(f"\n  {'Metric':<24} {'Baseline':>10} {'Current':>10} {'Allowed':>10}  Status")
+    print("  " + "-" * 66)
+    for key, (direction, tol, kind, *floor) in rules.items():
+        if key not in reference or key not in metrics:
+            continue
+        base, cur = reference[key], metrics[key]
+        slack   = max(tol * abs(base), *floor, 0.0) if kind == "rel" else tol
+        allowed = base - slack if direction == "higher" else base + slack
+        worse   = cur < allowed if direction == "higher" else cur > allowed
+        print(f"  {key:<24} {base:>10.4f} {cur:>10.4f} {allowed:>10.4f}  {'REGRESSED' if worse else 'ok'}")
+        if worse:
+            regressions.append((key, base, cur, allowed))
+    return regressions
+
+
+# =============================================================================
+#  STEP 7  Summary Report
 # =============================================================================
 
-def print_summary(clf, ver, emb):
+def print_summary(clf, ver, emb, run=None):
     print("\n" + SEP)
     print("  FINAL SUMMARY REPORT")
     print(SEP)
@@ -489,9 +983,14 @@ def print_summary(clf, ver, emb):
     if ver:
         print("\n  [VERIFICATION TASK]")
         print(f"    AUC        : {ver['auc']:.4f}")
-        print(f"    EER        : {ver['eer']*100:.2f}%")
-        print(f"    FAR        : {ver['far']*100:.2f}%")
-        print(f"    FRR        : {ver['frr']*100:.2f}%")
+        if "eer_ci" in ver:
+            for key in ("eer", "far", "frr"):
+                lo, hi = ver[f"{key}_ci"]
+                print(f"    {key.upper():<10} : {ver[key]*100:.2f}%  (95% CI {lo*100:.2f}-{hi*100:.2f}%)")
+        else:
+            print(f"    EER        : {ver['eer']*100:.2f}%")
+            print(f"    FAR        : {ver['far']*100:.2f}%")
+            print(f"    FRR        : {ver['frr']*100:.2f}%")
 
     if emb:
         print("\n  [EMBEDDING SIMILARITY]")
@@ -502,6 +1001,13 @@ def print_summary(clf, ver, emb):
         print(f"    RMSE genuine  (vs 0)   : {emb['rmse_genuine']:.4f}")
         print(f"    RMSE impostor (vs 1)   : {emb['rmse_impostor']:.4f}")
 
+    if run:
+        print("\n  [RUNTIME]")
+        print(f"    Match latency (mean)   : {run['match_latency_mean_ms']:.3f} ms")
+        if run["model_load_ms"] is not None:
+            print(f"    Model load time        : {run['model_load_ms']:.2f} ms")
+        print(f"    Gallery memory         : {run['gallery_memory_mb']:.2f} MB")
+
     if HAS_MATPLOTLIB:
         print(f"\n  All plots saved to: {OUTPUT_DIR.resolve()}")
 
@@ -513,6 +1019,25 @@ def print_summary(clf, ver, emb):
 # =============================================================================
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Face recognition model evaluation")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Constant-memory pair evaluation (automatic when the all-pairs arrays would exceed "
+                             f"{STREAMING_MAX_PAIR_BYTES // 1024 // 1024} MB)")
+    parser.add_argument("--bins", type=int, default=SCORE_BINS,
+                        help="Impostor score histogram bins in streaming mode")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="Processes for cross-validation folds (default: one per fold, up to CPU count)")
+    parser.add_argument("--top-k", type=int, default=TOP_K,
+                        help="Neighbours cached per query for the top-k sweep")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH,
+                        help="Baseline metrics JSON; exit 1 if any metric regresses beyond tolerance")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="Write this run's metrics as the new baseline")
+    args = parser.parse_args()
+
+    RECOGNITION_THRESHOLD = setup_django()
+    print(f"  Recognition threshold: {RECOGNITION_THRESHOLD}")
+
     encodings, labels, names = load_dataset()
 
     if len(encodings) == 0:
@@ -520,8 +1045,43 @@ if __name__ == "__main__":
               "Check that dataset folders contain valid images.\n")
         sys.exit(1)
 
-    clf = evaluate_classification(encodings, labels, names)
-    ver = evaluate_verification(encodings, labels)
-    emb = evaluate_embeddings(encodings, labels)
-
-    print_summary(clf, ver, emb)
+    clf = evaluate_classification(encodings, labels, names, jobs=args.jobs, top_k=args.top_k)
+
+    if (args.streaming or pair_array_bytes(len(encodings)) > STREAMING_MAX_PAIR_BYTES) and len(encodings) >= 4:
+        # Genuine pairs kept, impostor pairs histogrammed -- memory independent of N^2
+        stats = accumulate_pair_statistics(encodings, labels, bins=args.bins)
+        ver = evaluate_verification_streaming(stats)
+        emb = evaluate_embeddings(encodings, labels, stats=stats)
+    else:
+        # Pairwise distances are computed once (blocked matrix ops) and shared
+        pairs = compute_pairwise(encodings, labels) if len(encodings) >= 4 else None
+        ver = evaluate_verification(encodings, labels, pairs)
+        emb = evaluate_embeddings(encodings, labels, pairs)
+
+    run = evaluate_runtime(encodings, labels)
+    print_summary(clf, ver, emb, run)
+
+    metrics = collect_metrics(clf, ver, run)
+    meta = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "encodings": int(len(encodings)),
+        "identities": int(len(set(labels))),
+        "threshold": RECOGNITION_THRESHOLD,
+        "gallery": run["gallery_source"],
+    }
+    write_report(metrics, meta, OUTPUT_DIR / "metrics.json", OUTPUT_DIR / "metrics.csv")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({**meta, "metrics": metrics}, f, indent=2)
+        print(f"  [OK] Baseline updated: {args.baseline}")
+    elif args.baseline.exists():
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(metrics, baseline)
+        if regressions:
+            print(f"\n  [FAIL] {len(regressions)} metric(s) regressed against {args.baseline.name}\n")
+            sys.exit(1)
+        print(f"\n  [OK] No regressions against {args.baseline.name}\n")
+    else:
+        print(f"  [!] No baseline at {args.baseline} -- run with --update-baseline to create one.")
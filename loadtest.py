@@ -0,0 +1,493 @@
+# -*- coding: utf-8 -*-
+"""
+============================================================
+  AI-Powered Attendance System - Load Test
+============================================================
+Simulates a busy day against the Django app, in-process and offline:
+  1. Classrooms -> live-attendance cameras posting frames to
+                   process_live_frame at --fps per classroom
+  2. Teachers   -> teacher dashboard, class selector, student management
+  3. Students   -> student dashboard, materials, applications
+  4. RAG        -> ask_ai questions answered by a stub LLM that sleeps
+                   --llm-latency seconds instead of calling Gemini
+
+Each virtual user is a thread with its own test Client, so every request
+goes through URL routing, middleware, views and templates in one process,
+like a single gunicorn worker running with --threads. The run works on a
+throwaway copy of ai_attendance/db.sqlite3, so marked attendance and
+notifications never reach the real database. Frames are recorded JPEGs
+(--frames DIR) or synthetic classroom composites built from the enrolled
+crops in database/dataset.
+
+Run from the project root:
+    python loadtest.py
+    python loadtest.py --classrooms 8 --fps 1 --teachers 5 --students 20 --rag-users 3 --duration 120
+
+Reports throughput, p50/p95/p99 latency and error rate per endpoint, and
+writes a JSON report to loadtest_output/ so runs can be compared.
+"""
+
+import sys
+import io
+# Force UTF-8 on Windows console to avoid cp1252 errors
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8", errors="replace")
+
+import os
+import json
+import math
+import time
+import atexit
+import base64
+import random
+import shutil
+import argparse
+import datetime
+import platform
+import tempfile
+import threading
+import contextlib
+from types import SimpleNamespace
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import cv2
+except ImportError:
+    sys.exit("ERROR: 'opencv-python' not installed. Run: pip install -r requirements.txt")
+
+# -- Paths --------------------------------------------------------------------
+ROOT         = Path(__file__).parent
+DATASET_ROOT = ROOT / "database" / "dataset"
+OUTPUT_DIR   = ROOT / "loadtest_output"
+WORK_DIR     = Path(tempfile.mkdtemp(prefix="loadtest_"))
+atexit.register(shutil.rmtree, WORK_DIR, ignore_errors=True)
+
+# -- Django, pointed at a copy of the local database --------------------------
+sys.path.insert(0, str(ROOT / "ai_attendance"))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ai_attendance.settings")
+from django.conf import settings
+
+SOURCE_DB = Path(settings.DATABASES["default"]["NAME"])
+if SOURCE_DB.exists():
+    shutil.copy2(SOURCE_DB, WORK_DIR / "db.sqlite3")
+settings.DATABASES["default"]["NAME"] = str(WORK_DIR / "db.sqlite3")
+
+import django
+django.setup()
+
+from django.db import connection
+from django.test import Client
+from django.contrib.auth.models import User
+from core.models import Student, TeacherSubject, CourseMaterial
+from core.recognition_cache import recognition_cache
+from core import rag_agent
+
+SEP = "=" * 60
+QUESTIONS = [
+    "Summarise the key points of this unit.",
+    "What are the main definitions I should remember?",
+    "Explain the second topic with an example.",
+    "Which formulas are important for the exam?",
+    "How is this related to the previous chapter?",
+]
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+# =============================================================================
+#  STEP 1  Stub LLM + frames
+# =============================================================================
+
+class StubLLM:
+    """Stands in for google.generativeai: sleeps, then returns a canned answer."""
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def configure(self, **kwargs):
+        pass
+
+    def GenerativeModel(self, name):
+        return self
+
+    def generate_content(self, prompt):
+        time.sleep(self.latency)
+        return SimpleNamespace(text=(
+            f"Stub answer built from a {len(prompt)}-character prompt.\n"
+            '<<<JSON\n{"image_keywords": ["diagram", "summary"]}\nJSON>>>'
+        ))
+
+
+def install_stub_llm(latency):
+    rag_agent.genai = StubLLM(latency)
+    rag_agent.HAS_GENAI = True
+    rag_agent.GEMINI_API_KEY = "stub"
+
+
+def load_recorded_frames(frames_dir):
+    paths = sorted(p for p in Path(frames_dir).rglob("*") if p.suffix.lower() in (".jpg", ".jpeg"))
+    return [p.read_bytes() for p in paths]
+
+
+def synthetic_frames(count, faces, rng, cell=200, margin=20):
+    """Classroom composites of `faces` random enrolled crops each, as JPEG bytes."""
+    paths = [
+        p for p in DATASET_ROOT.rglob("*")
+        if p.suffix.lower() in (".jpg", ".jpeg", ".png") and "_raw_temp" not in p.parts
+    ]
+    crops = [img for img in (cv2.imread(str(p)) for p in paths[:500]) if img is not None]
+    if not crops:
+        return []
+
+    cols = max(1, math.ceil(math.sqrt(faces * 16 / 9)))
+    rows = max(1, math.ceil(faces / cols))
+    size = cell - 2 * margin
+    frames = []
+    for _ in range(count):
+        canvas = np.full((rows * cell, cols * cell, 3), 90, dtype=np.uint8)
+        for i in range(faces):
+            crop = crops[rng.randrange(len(crops))]
+            h, w = crop.shape[:2]
+            scale = size / max(h, w)
+            face = cv2.resize(crop, (max(1, int(w * scale)), max(1, int(h * scale))))
+            r, c = divmod(i, cols)
+            y, x = r * cell + margin, c * cell + margin
+            canvas[y:y + face.shape[0], x:x + face.shape[1]] = face
+        ok, buf = cv2.imencode(".jpg", canvas, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        if ok:
+            frames.append(buf.tobytes())
+    return frames
+
+
+def to_data_url(jpeg_bytes):
+    return "data:image/jpeg;base64," + base64.b64encode(jpeg_bytes).decode()
+
+
+# =============================================================================
+#  STEP 2  Recording
+# =============================================================================
+
+class Recorder:
+    """Thread-safe latency / error samples per endpoint label."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.late = Counter()
+
+    def record(self, label, seconds, error=None):
+        with self._lock:
+            self.latencies.setdefault(label, []).append(seconds)
+            if error:
+                self.errors.setdefault(label, Counter())[error] += 1
+
+    def mark_late(self, label):
+        with self._lock:
+            self.late[label] += 1
+
+    def summary(self, duration):
+        rows = []
+        for label in sorted(self.latencies):
+            values = self.latencies[label]
+            errors = self.errors.get(label, Counter())
+            n_errors = sum(errors.values())
+            rows.append({
+                "endpoint": label,
+                "requests": len(values),
+                "errors": n_errors,
+                "error_rate": n_errors / len(values) if values else 0.0,
+                "throughput_rps": len(values) / duration if duration else 0.0,
+                "p50_ms": percentile(values, 50) * 1000,
+                "p95_ms": percentile(values, 95) * 1000,
+                "p99_ms": percentile(values, 99) * 1000,
+                "max_ms": max(values) * 1000 if values else 0.0,
+                "late": self.late.get(label, 0),
+                "top_errors": errors.most_common(3),
+            })
+        return rows
+
+
+def timed_request(recorder, label, send, check=None):
+    """Run one request; non-2xx/3xx, a failed `check` or an exception counts as an error."""
+    start = time.perf_counter()
+    error = None
+    try:
+        response = send()
+        if response.status_code >= 400:
+            error = f"HTTP {response.status_code}"
+        elif check is not None:
+            error = check(response)
+    except Exception as e:
+        error = type(e).__name__
+    recorder.record(label, time.perf_counter() - start, error)
+
+
+def json_status_check(response):
+    try:
+        data = json.loads(response.content)
+    except ValueError:
+        return "invalid JSON"
+    if data.get("status") == "error" or data.get("error"):
+        return str(data.get("message") or data.get("error"))[:60]
+    return None
+
+
+# =============================================================================
+#  STEP 3  Virtual users
+# =============================================================================
+
+def think(rng, mean, stop):
+    stop.wait(rng.expovariate(1.0 / mean) if mean > 0 else 0)
+
+
+def classroom_user(frames, spec, fps, recorder, stop, seed):
+    """A live-attendance camera: one frame every 1/fps seconds, like the auto-scan loop."""
+    rng = random.Random(seed)
+    client = Client(raise_request_exception=False)
+    interval = 1.0 / fps
+    next_due = time.perf_counter() + rng.uniform(0, interval)
+    try:
+        while not stop.is_set():
+            delay = next_due - time.perf_counter()
+            if delay > 0 and stop.wait(delay):
+                break
+            payload = json.dumps({"image": frames[rng.randrange(len(frames))], **spec})
+            timed_request(
+                recorder, "process_live_frame",
+                lambda: client.post("/core/process_live_frame/", payload, content_type="application/json"),
+                json_status_check,
+            )
+            next_due += interval
+            if time.perf_counter() > next_due + interval:
+                # More than one frame behind: the camera drops frames rather than queueing them
+                recorder.mark_late("process_live_frame")
+                next_due = time.perf_counter()
+    finally:
+        connection.close()
+
+
+def browsing_user(user, pages, think_time, recorder, stop, seed):
+    """A logged-in user clicking through `pages` [(label, url, weight)] with think time."""
+    rng = random.Random(seed)
+    client = Client(raise_request_exception=False)
+    client.force_login(user)
+    labels = [p[0] for p in pages]
+    weights = [p[2] for p in pages]
+    urls = dict((p[0], p[1]) for p in pages)
+    try:
+        while not stop.is_set():
+            label = rng.choices(labels, weights)[0]
+            timed_request(recorder, label, lambda: client.get(urls[label]))
+            think(rng, think_time, stop)
+    finally:
+        connection.close()
+
+
+def rag_user(user, material_ids, think_time, recorder, stop, seed):
+    """A student asking the notes assistant questions; the LLM is the stub."""
+    rng = random.Random(seed)
+    client = Client(raise_request_exception=False)
+    client.force_login(user)
+    try:
+        while not stop.is_set():
+            body = {"question": rng.choice(QUESTIONS)}
+            if material_ids:
+                body["material_ids"] = rng.sample(material_ids, min(2, len(material_ids)))
+            else:
+                body["use_general_knowledge"] = True
+            payload = json.dumps(body)
+            timed_request(
+                recorder, "ask_ai",
+                lambda: client.post("/core/student_materials/ask_ai/", payload, content_type="application/json"),
+                json_status_check,
+            )
+            think(rng, think_time, stop)
+    finally:
+        connection.close()
+
+
+def teacher_pages(teacher):
+    pages = [
+        ("teacher_dashboard", "/core/teacher_dashboard/", 5),
+        ("take_attendance_selector", "/core/take_attendance_selector/", 2),
+    ]
+    ts = TeacherSubject.objects.filter(teacher=teacher).first()
+    student = Student.objects.filter(year=ts.year, section=ts.section).first() if ts else None
+    if student is not None and student.department:
+        pages.append(("manage_students", f"/core/manage_students/?branch={student.department}"
+                                         f"&year={student.year}&section={student.section}", 2))
+    return pages
+
+
+STUDENT_PAGES = [
+    ("student_dashboard", "/student/", 5),
+    ("student_materials", "/core/student_materials/", 2),
+    ("student_applications", "/core/student/applications/", 1),
+]
+
+
+# =============================================================================
+#  MAIN
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test of the attendance server")
+    parser.add_argument("--classrooms", type=int, default=4, help="Concurrent live-attendance cameras")
+    parser.add_argument("--fps", type=float, default=1.0, help="Frames per second per classroom")
+    parser.add_argument("--faces", type=int, default=15, help="Faces per synthetic frame")
+    parser.add_argument("--frames", type=Path, default=None, help="Directory of recorded JPEG frames")
+    parser.add_argument("--frame-pool", type=int, default=20, help="Distinct synthetic frames to cycle through")
+    parser.add_argument("--teachers", type=int, default=3, help="Concurrent teacher dashboard users")
+    parser.add_argument("--students", type=int, default=10, help="Concurrent student dashboard users")
+    parser.add_argument("--rag-users", type=int, default=2, help="Concurrent students asking the notes assistant")
+    parser.add_argument("--think", type=float, default=2.0, help="Mean think time between page views (s)")
+    parser.add_argument("--llm-latency", type=float, default=1.5, help="Stub LLM response time (s)")
+    parser.add_argument("--duration", type=float, default=60.0, help="Measured run length (s)")
+    parser.add_argument("--verbose", action="store_true", help="Show the server's own print output")
+    parser.add_argument("--output", type=Path, default=None, help="Report path (JSON)")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    console = sys.stdout
+    # The views print per frame; keep the console for progress unless --verbose
+    quiet = console if args.verbose else open(os.devnull, "w")
+
+    print("\n" + SEP)
+    print("  STEP 1 -- Users, frames and stub LLM")
+    print(SEP)
+    print(f"  Database copy    : {settings.DATABASES['default']['NAME']}"
+          + ("" if SOURCE_DB.exists() else "  (no local db.sqlite3 found)"))
+
+    teachers = list(User.objects.filter(is_staff=True, is_superuser=False).order_by("id"))
+    students = list(Student.objects.filter(user__isnull=False).select_related("user").order_by("id"))
+    print(f"  Teachers / students with logins: {len(teachers)} / {len(students)}")
+    if args.teachers and not teachers:
+        print("  [!] No teacher accounts: teacher traffic skipped")
+    if (args.students or args.rag_users) and not students:
+        print("  [!] No student accounts: student and RAG traffic skipped")
+
+    if args.frames:
+        raw_frames = load_recorded_frames(args.frames)
+    else:
+        raw_frames = synthetic_frames(args.frame_pool, args.faces, rng)
+    if args.classrooms and not raw_frames:
+        sys.exit(f"ERROR: No frames: pass --frames DIR or enroll faces under {DATASET_ROOT}")
+    frames = [to_data_url(f) for f in raw_frames]
+    print(f"  Frames           : {len(frames)} ({'recorded' if args.frames else f'synthetic, {args.faces} faces'})")
+
+    class_specs = list(
+        TeacherSubject.objects.values("subject", "year", "section").distinct().order_by("year", "section", "subject")
+    ) or [{"subject": "Load Test", "year": "", "section": ""}]
+    material_ids = list(CourseMaterial.objects.values_list("id", flat=True)[:20])
+    install_stub_llm(args.llm_latency)
+    print(f"  Classes          : {len(class_specs)} distinct subject/year/section")
+    print(f"  RAG materials    : {len(material_ids) or 'none (general-knowledge questions)'}"
+          f" | stub LLM latency {args.llm_latency:.2f}s")
+
+    if frames:
+        # Warm-up outside the measurement: gallery load, Haar cascades, DB connection
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(quiet):
+            Client().post("/core/process_live_frame/", json.dumps({"image": frames[0], **class_specs[0]}),
+                          content_type="application/json")
+        print(f"  Warm-up frame    : {(time.perf_counter() - start) * 1000:.0f}ms")
+
+    print("\n" + SEP)
+    print(f"  STEP 2 -- Running for {args.duration:.0f}s")
+    print(SEP)
+
+    recorder = Recorder()
+    stop = threading.Event()
+    threads = []
+    for i in range(args.classrooms if frames else 0):
+        spec = dict(class_specs[i % len(class_specs)])
+        spec["start_time"] = datetime.datetime.now().strftime("%H:%M")
+        threads.append(threading.Thread(target=classroom_user,
+                                        args=(frames, spec, args.fps, recorder, stop, 1000 + i)))
+    for i in range(args.teachers if teachers else 0):
+        teacher = teachers[i % len(teachers)]
+        threads.append(threading.Thread(target=browsing_user,
+                                        args=(teacher, teacher_pages(teacher), args.think, recorder, stop, 2000 + i)))
+    for i in range(args.students if students else 0):
+        threads.append(threading.Thread(target=browsing_user,
+                                        args=(students[i % len(students)].user, STUDENT_PAGES,
+                                              args.think, recorder, stop, 3000 + i)))
+    for i in range(args.rag_users if students else 0):
+        threads.append(threading.Thread(target=rag_user,
+                                        args=(students[-1 - i % len(students)].user, material_ids,
+                                              args.think, recorder, stop, 4000 + i)))
+
+    cache_before = recognition_cache.stats()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(quiet):
+        for t in threads:
+            t.daemon = True
+            t.start()
+        while not stop.wait(min(10.0, max(0.0, args.duration - (time.perf_counter() - started)))):
+            elapsed = time.perf_counter() - started
+            done = sum(len(v) for v in recorder.latencies.values())
+            print(f"  {elapsed:6.1f}s | {done} requests", file=console)
+            if elapsed >= args.duration:
+                stop.set()
+        for t in threads:
+            t.join()
+    duration = time.perf_counter() - started
+    cache_after = recognition_cache.stats()
+
+    print("\n" + SEP)
+    print("  STEP 3 -- Results")
+    print(SEP)
+    rows = recorder.summary(duration)
+    print(f"  {'endpoint':<26} {'reqs':>6} {'req/s':>7} {'err%':>6} {'p50ms':>8} {'p95ms':>8} {'p99ms':>8} {'maxms':>8}")
+    for row in rows:
+        print(f"  {row['endpoint']:<26} {row['requests']:>6} {row['throughput_rps']:>7.2f} "
+              f"{row['error_rate'] * 100:>5.1f}% {row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} "
+              f"{row['p99_ms']:>8.1f} {row['max_ms']:>8.1f}")
+        for message, count in row["top_errors"]:
+            print(f"        {count:>5} x {message}")
+
+    total = sum(r["requests"] for r in rows)
+    errors = sum(r["errors"] for r in rows)
+    frames_row = next((r for r in rows if r["endpoint"] == "process_live_frame"), None)
+    target_fps = args.classrooms * args.fps if frames else 0.0
+    print(f"\n  Total            : {total} requests, {total / duration:.2f} req/s, "
+          f"{(errors / total * 100) if total else 0:.1f}% errors")
+    if frames_row:
+        print(f"  Live frames      : {frames_row['throughput_rps']:.2f} fps achieved of {target_fps:.2f} target, "
+              f"{frames_row['late']} late-drops")
+    hits = cache_after.get("hits", 0) - cache_before.get("hits", 0)
+    misses = cache_after.get("misses", 0) - cache_before.get("misses", 0)
+    if hits + misses:
+        print(f"  Recognition cache: {hits} hits / {misses} misses")
+
+    report = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "host": {"platform": platform.platform(), "python": platform.python_version(),
+                 "cpu_count": os.cpu_count()},
+        "config": {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items()},
+        "data": {"teachers": len(teachers), "students": len(students), "frames": len(frames),
+                 "classes": len(class_specs), "materials": len(material_ids)},
+        "duration_s": duration,
+        "total": {"requests": total, "errors": errors, "throughput_rps": total / duration if duration else 0.0},
+        "live_frames": {"target_fps": target_fps,
+                        "achieved_fps": frames_row["throughput_rps"] if frames_row else 0.0,
+                        "late_drops": frames_row["late"] if frames_row else 0},
+        "recognition_cache": {"hits": hits, "misses": misses},
+        "endpoints": rows,
+    }
+
+    OUTPUT_DIR.mkdir(exist_ok=True)
+    out = args.output or OUTPUT_DIR / f"loadtest_{datetime.datetime.now():%Y%m%d_%H%M%S}.json"
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n  [OK] Report saved: {out}")
+    print("\n" + SEP + "\n")
+
+
+if __name__ == "__main__":
+    main()